@@ -0,0 +1,34 @@
+"""Vendor category mappings
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-02-15 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create vendor_category_mappings table
+    op.create_table('vendor_category_mappings',
+        sa.Column('vendor', sa.Text(), nullable=False),
+        sa.Column('category', sa.Text(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(), nullable=False),
+        sa.PrimaryKeyConstraint('vendor')
+    )
+
+    # Workers poll max(version) to invalidate their caches
+    op.create_index('ix_vendor_category_mappings_version', 'vendor_category_mappings', ['version'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_vendor_category_mappings_version')
+    op.drop_table('vendor_category_mappings')
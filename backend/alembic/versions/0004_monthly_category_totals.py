@@ -0,0 +1,40 @@
+"""Monthly category totals rollup
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2024-02-20 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create monthly_category_totals table
+    op.create_table('monthly_category_totals',
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('month', sa.Text(), nullable=False),
+        sa.Column('category', sa.Text(), nullable=False),
+        sa.Column('total', sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column('expense_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id', 'month', 'category')
+    )
+
+    # Backfill from existing expenses
+    op.execute("""
+        INSERT INTO monthly_category_totals (user_id, month, category, total, expense_count)
+        SELECT user_id, to_char(date, 'YYYY-MM'), category, sum(amount), count(*)
+        FROM expenses
+        GROUP BY user_id, to_char(date, 'YYYY-MM'), category
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('monthly_category_totals')
@@ -0,0 +1,39 @@
+"""Composite and covering expense indexes
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2024-03-01 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Every expenses query filters by user_id, ranges on date and orders by
+    # date desc, id desc; these serve it (scanned backwards) without a sort
+    op.create_index(
+        'ix_expenses_user_date_id', 'expenses', ['user_id', 'date', 'id'],
+        postgresql_include=['category', 'amount', 'currency', 'vendor', 'description']
+    )
+    op.create_index('ix_expenses_user_category_date_id', 'expenses', ['user_id', 'category', 'date', 'id'])
+
+    # Superseded: user_id is the composite prefix, and date/category alone
+    # are never queried without user_id
+    op.drop_index('ix_expenses_user_id')
+    op.drop_index('ix_expenses_date')
+    op.drop_index('ix_expenses_category')
+
+
+def downgrade() -> None:
+    op.create_index('ix_expenses_category', 'expenses', ['category'])
+    op.create_index('ix_expenses_date', 'expenses', ['date'])
+    op.create_index('ix_expenses_user_id', 'expenses', ['user_id'])
+    op.drop_index('ix_expenses_user_category_date_id')
+    op.drop_index('ix_expenses_user_date_id')
@@ -0,0 +1,42 @@
+"""Invoice content hash and duplicate tracking
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2024-03-08 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('invoices', sa.Column('content_hash', sa.Text(), nullable=True))
+    op.add_column('invoices', sa.Column('duplicate_of_id', postgresql.UUID(as_uuid=True), nullable=True))
+    op.create_foreign_key(
+        'fk_invoices_duplicate_of_id', 'invoices', 'invoices',
+        ['duplicate_of_id'], ['id'], ondelete='SET NULL'
+    )
+    
+    # Existing invoices keep a NULL hash (their files were stored under random
+    # names), and NULLs never conflict, so only new uploads are deduplicated
+    op.create_unique_constraint('uq_invoices_user_content_hash', 'invoices', ['user_id', 'content_hash'])
+    op.create_index('ix_invoices_user_invoice_date', 'invoices', ['user_id', 'invoice_date'])
+    
+    # Superseded: user_id is the prefix of both indexes above
+    op.drop_index('ix_invoices_user_id')
+
+
+def downgrade() -> None:
+    op.create_index('ix_invoices_user_id', 'invoices', ['user_id'])
+    op.drop_index('ix_invoices_user_invoice_date')
+    op.drop_constraint('uq_invoices_user_content_hash', 'invoices', type_='unique')
+    op.drop_constraint('fk_invoices_duplicate_of_id', 'invoices', type_='foreignkey')
+    op.drop_column('invoices', 'duplicate_of_id')
+    op.drop_column('invoices', 'content_hash')
@@ -0,0 +1,24 @@
+"""Parser backend per parse job
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2024-04-02 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # NULL means the deployment default (PARSER_BACKEND)
+    op.add_column('parse_jobs', sa.Column('parser', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('parse_jobs', 'parser')
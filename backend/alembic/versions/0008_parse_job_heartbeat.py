@@ -0,0 +1,25 @@
+"""Parse job heartbeat
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2024-04-10 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Refreshed by the worker while a parse runs; stale means the worker died
+    op.add_column('parse_jobs', sa.Column('heartbeat_at', sa.TIMESTAMP(), nullable=True))
+    op.execute("UPDATE parse_jobs SET heartbeat_at = started_at WHERE status = 'running'")
+
+
+def downgrade() -> None:
+    op.drop_column('parse_jobs', 'heartbeat_at')
@@ -0,0 +1,32 @@
+"""Vendor mapping version counter
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2024-04-12 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Single row handing out mapping versions; writers lock it until commit
+    op.create_table('vendor_mapping_version',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(
+        "INSERT INTO vendor_mapping_version (id, version) "
+        "SELECT 1, COALESCE(MAX(version), 0) FROM vendor_category_mappings"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('vendor_mapping_version')
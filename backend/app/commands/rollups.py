@@ -0,0 +1,41 @@
+"""
+Maintain the monthly_category_totals rollup.
+
+    python -m app.commands.rollups check [--user-id UUID]
+    python -m app.commands.rollups rebuild [--user-id UUID]
+
+`check` compares the rollup with the expenses table and exits non-zero on
+any mismatch; `rebuild` recomputes it (also used to backfill).
+"""
+import argparse
+import json
+import sys
+import uuid
+
+from app.database import SessionLocal
+from app.services.rollups import monthly_rollup_service
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Monthly category totals rollup")
+    parser.add_argument("command", choices=["check", "rebuild"])
+    parser.add_argument("--user-id", type=uuid.UUID, default=None, help="Limit to one user")
+    args = parser.parse_args(argv)
+    
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            rows = monthly_rollup_service.rebuild(db, args.user_id)
+            db.commit()
+            print(f"Rebuilt {rows} rollup rows")
+            return 0
+        
+        mismatches = monthly_rollup_service.check(db, args.user_id)
+        for mismatch in mismatches:
+            print(json.dumps(mismatch))
+        print(f"{len(mismatches)} mismatched rollup rows", file=sys.stderr)
+        return 1 if mismatches else 0
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
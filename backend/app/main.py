@@ -1,18 +1,44 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 import os
 
-from app.routers import invoices, expenses, reports, exports
-from app.database import engine, Base
+from app.routers import invoices, expenses, reports, exports, admin
+from app.database import async_engine, pool_stats
+from app.responses import FastJSONResponse
+from app.services.metrics import registry, RouteLatencyMiddleware
+from app.services.profiling import request_profiler, ProfilingMiddleware
+from app.services.parse_queue import parse_queue_service
+from app.services.batch_import import batch_import_service
+from app.services.storage import RequestSizeLimitMiddleware
+from app.services.image_processing import image_processing_service
+from app.services.ocr import ocr_service
+from app.services.resilience import model_call_guard
 
 # Create uploads directory if it doesn't exist
 os.makedirs("uploads", exist_ok=True)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Parse workers run alongside the API; set PARSE_WORKERS=0 to use
+    # dedicated `python -m app.worker` processes instead
+    parse_queue_service.start()
+    yield
+    await parse_queue_service.stop()
+    image_processing_service.shutdown()
+    ocr_service.shutdown()
+    await async_engine.dispose()
+
 app = FastAPI(
     title="Receipt OCR Expense Tracker",
     description="AI-powered receipt parsing and expense tracking",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # orjson encodes response bodies several times faster than the stdlib
+    default_response_class=FastJSONResponse
 )
 
 # CORS middleware
@@ -22,8 +48,48 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
+)
+
+# Reject oversized bodies before Starlette spools them to disk
+app.add_middleware(RequestSizeLimitMiddleware, path_limits={"/invoices/batch": batch_import_service.max_bytes})
+
+# Per-route latency histograms for /metrics
+app.add_middleware(RouteLatencyMiddleware)
+
+# Stack samples of slow requests; not installed at all unless enabled
+if request_profiler.enabled:
+    app.add_middleware(ProfilingMiddleware)
+
+def pool_metric(key: str):
+    """Collect one /admin/stats db_pool value for each engine's pool"""
+    return lambda: {(pool,): stats[key] for pool, stats in pool_stats().items() if key in stats}
+
+for key, kind, description in [
+    ("checkouts", "counter", "Connections checked out of the pool"),
+    ("timeouts", "counter", "Checkouts that gave up after DB_POOL_TIMEOUT"),
+    ("in_use", "gauge", "Connections currently checked out"),
+    ("idle", "gauge", "Connections idle in the pool"),
+    ("overflow", "gauge", "Connections open beyond DB_POOL_SIZE"),
+    ("wait_ms_p99", "gauge", "p99 checkout wait over recent checkouts, in milliseconds"),
+]:
+    name = f"db_pool_{key}_total" if kind == "counter" else f"db_pool_{key}"
+    registry.callback(name, description, ("pool",), pool_metric(key), kind=kind)
+
+registry.callback(
+    "openai_circuit_open", "1 while the model provider circuit breaker is open or probing", (),
+    lambda: {(): int(model_call_guard.breaker.state != "closed")}
 )
 
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    # Connection pool exhausted: tell clients to back off instead of a bare 500
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database busy, retry shortly"},
+        headers={"Retry-After": "1"}
+    )
+
 # Mount static files for uploads
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
@@ -32,11 +98,17 @@ app.include_router(invoices.router, prefix="/invoices", tags=["invoices"])
 app.include_router(expenses.router, prefix="/expenses", tags=["expenses"])
 app.include_router(reports.router, prefix="/reports", tags=["reports"])
 app.include_router(exports.router, prefix="/exports", tags=["exports"])
+app.include_router(admin.router, prefix="/admin", tags=["admin"])
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of this process's metrics"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     return {"message": "Receipt OCR Expense Tracker API"}
\ No newline at end of file
@@ -1,15 +1,16 @@
-from sqlalchemy import Column, String, Date, Numeric, Text, ForeignKey, TIMESTAMP
-from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy import Column, String, Date, Numeric, Text, ForeignKey, TIMESTAMP, Integer, BigInteger, Index, JSON, Uuid, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
+from datetime import datetime
 import uuid
 
 from app.database import Base
 
 class Invoice(Base):
     __tablename__ = "invoices"
-
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), nullable=False)
+    
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    user_id = Column(Uuid, nullable=False)
     file_url = Column(Text, nullable=False)
     vendor = Column(Text)
     invoice_no = Column(Text)
@@ -18,18 +19,79 @@ class Invoice(Base):
     subtotal = Column(Numeric(12, 2))
     tax = Column(Numeric(12, 2))
     total = Column(Numeric(12, 2))
-    raw_json = Column(JSONB)
+    raw_json = Column(JSON().with_variant(JSONB, "postgresql"))
+    content_hash = Column(Text)  # sha256 of the uploaded bytes
+    # Earlier invoice with the same vendor, date and total (set after parsing)
+    duplicate_of_id = Column(Uuid, ForeignKey("invoices.id", ondelete="SET NULL"))
     created_at = Column(TIMESTAMP, server_default=func.now())
+    
+    __table_args__ = (
+        # Re-uploading the same file returns the existing invoice
+        UniqueConstraint("user_id", "content_hash", name="uq_invoices_user_content_hash"),
+        # Fuzzy duplicate lookup after parsing
+        Index("ix_invoices_user_invoice_date", "user_id", "invoice_date"),
+    )
 
 class Expense(Base):
     __tablename__ = "expenses"
-
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), nullable=False)
-    invoice_id = Column(UUID(as_uuid=True), ForeignKey("invoices.id", ondelete="SET NULL"))
+    
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    user_id = Column(Uuid, nullable=False)
+    invoice_id = Column(Uuid, ForeignKey("invoices.id", ondelete="SET NULL"))
     date = Column(Date, nullable=False)
     category = Column(Text, nullable=False)
     description = Column(Text)
     amount = Column(Numeric(12, 2), nullable=False)
     currency = Column(Text, nullable=False)
-    vendor = Column(Text)
\ No newline at end of file
+    vendor = Column(Text)
+    
+    __table_args__ = (
+        # List/export pages: user_id = ?, date range, ORDER BY date DESC, id DESC.
+        # Covers the export columns so exports and ?fields= pages are index-only
+        Index(
+            "ix_expenses_user_date_id", "user_id", "date", "id",
+            postgresql_include=["category", "amount", "currency", "vendor", "description"]
+        ),
+        # Same with a category filter
+        Index("ix_expenses_user_category_date_id", "user_id", "category", "date", "id"),
+    )
+
+class ParseJob(Base):
+    __tablename__ = "parse_jobs"
+    
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    invoice_id = Column(Uuid, ForeignKey("invoices.id", ondelete="CASCADE"), nullable=False, unique=True)
+    status = Column(Text, nullable=False, default="queued")  # queued/running/done/failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    last_error = Column(Text)
+    parser = Column(Text)  # parser backend asked for; NULL uses PARSER_BACKEND
+    run_after = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
+    started_at = Column(TIMESTAMP)
+    heartbeat_at = Column(TIMESTAMP)  # refreshed while running; stale means the worker died
+    finished_at = Column(TIMESTAMP)
+    created_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
+    updated_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class VendorCategoryMapping(Base):
+    __tablename__ = "vendor_category_mappings"
+    
+    vendor = Column(Text, primary_key=True)  # lowercased vendor name
+    category = Column(Text, nullable=False)
+    version = Column(BigInteger, nullable=False)
+    updated_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class VendorMappingVersion(Base):
+    __tablename__ = "vendor_mapping_version"
+    
+    id = Column(Integer, primary_key=True)  # single row, id 1
+    version = Column(BigInteger, nullable=False)  # last version handed out
+
+class MonthlyCategoryTotal(Base):
+    __tablename__ = "monthly_category_totals"
+    
+    user_id = Column(Uuid, primary_key=True)
+    month = Column(Text, primary_key=True)  # YYYY-MM
+    category = Column(Text, primary_key=True)
+    total = Column(Numeric(14, 2), nullable=False, default=0)
+    expense_count = Column(Integer, nullable=False, default=0)
\ No newline at end of file
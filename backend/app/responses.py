@@ -0,0 +1,18 @@
+import uuid
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+def _default(value):
+    # Same JSON forms as the response models; orjson encodes the exact
+    # uuid.UUID, date and datetime types itself
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+class FastJSONResponse(ORJSONResponse):
+    """orjson-encoded response that also takes Decimal and UUID subclasses"""
+    
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
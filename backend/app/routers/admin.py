@@ -0,0 +1,62 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.database import pool_stats
+
+from app.services.parse_cache import parse_cache_service
+from app.services.image_processing import image_processing_service
+from app.services.vendor_mappings import vendor_mapping_store
+from app.services.profiling import request_profiler
+from app.services.resilience import model_call_guard
+
+router = APIRouter()
+
+@router.get("/stats")
+async def get_stats():
+    """Get internal service counters"""
+    
+    return {
+        "parse_cache": parse_cache_service.stats(),
+        "image_processing": image_processing_service.stats(),
+        "vendor_mappings": vendor_mapping_store.stats(),
+        "model_calls": model_call_guard.stats(),
+        "db_pool": pool_stats()
+    }
+
+@router.get("/profiles")
+async def list_profiles():
+    """List stored request profiles, newest first"""
+    
+    store = request_profiler.store
+    return {
+        "enabled": request_profiler.enabled,
+        "sample_rate": request_profiler.sample_rate,
+        "slow_ms": request_profiler.slow_ms,
+        "profiles": await run_in_threadpool(store.list),
+    }
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    format: str = Query("json", description="json, or folded stacks for flamegraph.pl / speedscope")
+):
+    """Download a stored request profile"""
+    
+    path = request_profiler.store.path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    if format == "json":
+        return FileResponse(path, media_type="application/json", filename=f"profile-{profile_id}.json")
+    
+    if format == "folded":
+        profile = await run_in_threadpool(request_profiler.store.load, profile_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        folded = "".join(f"{stack} {count}\n" for stack, count in profile["stacks"].items())
+        return PlainTextResponse(
+            folded, headers={"Content-Disposition": f"attachment; filename=profile-{profile_id}.folded"}
+        )
+    
+    raise HTTPException(status_code=400, detail="Unsupported format, use json or folded")
@@ -1,41 +1,167 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, tuple_
 from typing import Optional, List
 from datetime import date
+import base64
+import json
+import os
+import uuid
 
 from app.database import get_db
 from app.models import Expense
-from app.schemas import ExpenseResponse
+from app.responses import FastJSONResponse
+from app.schemas import ExpenseResponse, ExpenseUpdate, response_content
 from app.services.auth import auth_service
+from app.services.categorization import categorization_service
+from app.services.rollups import monthly_rollup_service
 
 router = APIRouter()
 
+EXPENSES_PAGE_SIZE = int(os.getenv("EXPENSES_PAGE_SIZE", "100"))
+EXPENSES_MAX_PAGE_SIZE = int(os.getenv("EXPENSES_MAX_PAGE_SIZE", "1000"))
+
+def encode_cursor(expense_date: date, expense_id: uuid.UUID) -> str:
+    """Opaque keyset cursor for the (date, id) position of the last row"""
+    raw = json.dumps([expense_date.isoformat(), str(expense_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[date, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        expense_date, expense_id = json.loads(raw)
+        return date.fromisoformat(expense_date), uuid.UUID(expense_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields: Optional[str]) -> Optional[list[str]]:
+    """Validate a comma-separated fields= projection against ExpenseResponse"""
+    
+    if not fields:
+        return None
+    
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in ExpenseResponse.model_fields]
+    if unknown or not names:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}; allowed: {', '.join(ExpenseResponse.model_fields)}"
+        )
+    return list(dict.fromkeys(names))
+
+def build_expenses_query(user_id: uuid.UUID, from_date: Optional[date] = None,
+                         to_date: Optional[date] = None, category: Optional[str] = None,
+                         cursor: Optional[str] = None, projection: Optional[list[str]] = None):
+    """Query for a page of expenses, served by the (user_id, [category,] date, id) indexes"""
+    
+    # Select only the requested columns (plus the keyset columns)
+    if projection:
+        columns = [getattr(Expense, name) for name in projection]
+        query = select(*columns, Expense.date.label("_date"), Expense.id.label("_id"))
+    else:
+        query = select(Expense)
+    query = query.where(Expense.user_id == user_id)
+    
+    # Apply filters
+    if from_date:
+        query = query.where(Expense.date >= from_date)
+    
+    if to_date:
+        query = query.where(Expense.date <= to_date)
+    
+    if category:
+        query = query.where(Expense.category == category)
+    
+    # Keyset pagination: resume strictly after the last (date, id) seen
+    if cursor:
+        after_date, after_id = decode_cursor(cursor)
+        query = query.where(tuple_(Expense.date, Expense.id) < tuple_(after_date, after_id))
+    
+    # Order by date descending, id breaks ties so pages never overlap
+    return query.order_by(Expense.date.desc(), Expense.id.desc())
+
 @router.get("/", response_model=List[ExpenseResponse])
 async def get_expenses(
     from_date: Optional[date] = Query(None, alias="from"),
     to_date: Optional[date] = Query(None, alias="to"),
     category: Optional[str] = Query(None, alias="cat"),
-    db: Session = Depends(get_db)
+    limit: int = Query(EXPENSES_PAGE_SIZE, ge=1, le=EXPENSES_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of fields to return"),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get expenses with optional filters"""
+    """Get a page of expenses with optional filters, newest first.
+    
+    The next page's cursor is returned in the X-Next-Cursor header.
+    """
     
     user_id = auth_service.get_current_user_id()
+    projection = parse_fields(fields)
     
-    # Build query
-    query = db.query(Expense).filter(Expense.user_id == user_id)
+    query = build_expenses_query(user_id, from_date, to_date, category, cursor, projection).limit(limit + 1)
     
-    # Apply filters
-    if from_date:
-        query = query.filter(Expense.date >= from_date)
+    result = await db.execute(query)
+    rows = result.all() if projection else result.scalars().all()
     
-    if to_date:
-        query = query.filter(Expense.date <= to_date)
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        headers["X-Next-Cursor"] = (
+            encode_cursor(last._date, last._id) if projection else encode_cursor(last.date, last.id)
+        )
     
-    if category:
-        query = query.filter(Expense.category == category)
+    # Serialized straight from the rows; response_model only documents the shape
+    content = [response_content(row, ExpenseResponse, projection) for row in rows]
+    return FastJSONResponse(content=content, headers=headers)
+
+async def get_owned_expense(db: AsyncSession, expense_id: uuid.UUID) -> Expense:
+    """Load expense and verify it belongs to the current user"""
+    
+    expense = await db.get(Expense, expense_id)
+    if not expense:
+        raise HTTPException(status_code=404, detail="Expense not found")
+    
+    # Verify ownership
+    user_id = auth_service.get_current_user_id()
+    if expense.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    return expense
+
+@router.patch("/{expense_id}", response_model=ExpenseResponse)
+async def update_expense(
+    expense_id: uuid.UUID,
+    update: ExpenseUpdate,
+    db: AsyncSession = Depends(get_db)
+):
+    """Correct an expense category and learn it for the vendor"""
+    
+    expense = await get_owned_expense(db, expense_id)
+    
+    old_category = expense.category
+    expense.category = update.category
+    await db.run_sync(monthly_rollup_service.update_expense, expense, expense.date, old_category, expense.amount)
+    
+    # Future receipts from this vendor get the corrected category;
+    # the mapping is written in the same transaction as the edit
+    if update.remember_vendor and expense.vendor:
+        await db.run_sync(categorization_service.add_vendor_mapping, expense.vendor, update.category)
+    else:
+        await db.commit()
+    
+    await db.refresh(expense)
+    return expense
+
+@router.delete("/{expense_id}", status_code=204)
+async def delete_expense(
+    expense_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db)
+):
+    """Delete an expense"""
     
-    # Order by date descending
-    expenses = query.order_by(Expense.date.desc()).all()
+    expense = await get_owned_expense(db, expense_id)
     
-    return expenses
\ No newline at end of file
+    await db.run_sync(monthly_rollup_service.remove_expense, expense)
+    await db.delete(expense)
+    await db.commit()
\ No newline at end of file
@@ -1,67 +1,57 @@
-from fastapi import APIRouter, Depends, Query, Response
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from typing import Optional
 from datetime import date
-import csv
-import io
 
-from app.database import get_db
-from app.models import Expense
 from app.services.auth import auth_service
+from app.services.exports import export_service, EXPORT_FORMATS, ExportFormatUnavailable, format_for_accept
 
 router = APIRouter()
 
+def export_response(format_name: str, from_date: Optional[date], to_date: Optional[date],
+                    category: Optional[str]) -> StreamingResponse:
+    """Stream the current user's expenses in the given format"""
+    
+    if format_name not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format, use one of: {', '.join(EXPORT_FORMATS)}")
+    
+    user_id = auth_service.get_current_user_id()
+    
+    # Build query (same filters as expenses endpoint)
+    query = export_service.build_query(user_id, from_date, to_date, category)
+    
+    try:
+        content = export_service.stream(query, format_name)
+    except ExportFormatUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    
+    # Rows are streamed from a server-side cursor in batches; the sync
+    # generator runs in the threadpool so DB reads don't block the loop
+    export_format = EXPORT_FORMATS[format_name]
+    return StreamingResponse(
+        content,
+        media_type=export_format.media_type,
+        headers={"Content-Disposition": f"attachment; filename=expenses.{export_format.extension}"}
+    )
+
+@router.get("/expenses")
+async def export_expenses(
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    category: Optional[str] = Query(None, alias="cat"),
+    format: Optional[str] = Query(None, description="csv, csv.gz, csv.zst, parquet or arrow"),
+    accept: Optional[str] = Header(None)
+):
+    """Export expenses; format from ?format= or the Accept header, CSV by default"""
+    
+    return export_response(format or format_for_accept(accept), from_date, to_date, category)
+
 @router.get("/expenses.csv")
 async def export_expenses_csv(
     from_date: Optional[date] = Query(None, alias="from"),
     to_date: Optional[date] = Query(None, alias="to"),
-    category: Optional[str] = Query(None, alias="cat"),
-    db: Session = Depends(get_db)
+    category: Optional[str] = Query(None, alias="cat")
 ):
     """Export expenses as CSV"""
     
-    user_id = auth_service.get_current_user_id()
-    
-    # Build query (same as expenses endpoint)
-    query = db.query(Expense).filter(Expense.user_id == user_id)
-    
-    if from_date:
-        query = query.filter(Expense.date >= from_date)
-    
-    if to_date:
-        query = query.filter(Expense.date <= to_date)
-    
-    if category:
-        query = query.filter(Expense.category == category)
-    
-    expenses = query.order_by(Expense.date.desc()).all()
-    
-    # Create CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write headers
-    writer.writerow([
-        'Date', 'Vendor', 'Description', 'Category', 'Amount', 'Currency'
-    ])
-    
-    # Write data
-    for expense in expenses:
-        writer.writerow([
-            expense.date.isoformat(),
-            expense.vendor or '',
-            expense.description or '',
-            expense.category,
-            str(expense.amount),
-            expense.currency
-        ])
-    
-    # Return CSV response
-    csv_content = output.getvalue()
-    output.close()
-    
-    return Response(
-        content=csv_content,
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=expenses.csv"}
-    )
\ No newline at end of file
+    return export_response("csv", from_date, to_date, category)
@@ -1,137 +1,240 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-from datetime import datetime
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import json
+import os
 import uuid
 
 from app.database import get_db
-from app.models import Invoice, Expense
-from app.schemas import UploadResponse, ParsedReceipt, InvoiceResponse
+from app.models import Invoice
+from app.responses import FastJSONResponse
+from app.schemas import UploadResponse, InvoiceResponse, ParseJobResponse, ParserBackend, response_content
 from app.services.auth import auth_service
-from app.services.storage import storage_service
-from app.services.ai_parser import ai_parser_service
-from app.services.categorization import categorization_service
+from app.services.storage import storage_service, hash_upload, UploadTooLargeError
+from app.services.parse_queue import parse_queue_service
+from app.services.batch_import import batch_import_service
+from app.services.image_processing import image_processing_service
+from app.services.metrics import stage, duplicate_receipts
 
 router = APIRouter()
 
+PARSE_ON_UPLOAD = os.getenv("PARSE_ON_UPLOAD", "true").lower() == "true"
+
+def is_allowed_file(file: UploadFile) -> bool:
+    return bool(file.content_type) and file.content_type.startswith(('image/', 'application/pdf'))
+
+async def get_owned_invoice(db: AsyncSession, invoice_id: uuid.UUID) -> Invoice:
+    """Load invoice and verify it belongs to the current user"""
+    
+    invoice = await db.get(Invoice, invoice_id)
+    if not invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    
+    # Verify ownership
+    user_id = auth_service.get_current_user_id()
+    if invoice.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    return invoice
+
+async def find_uploaded_invoices(db: AsyncSession, user_id: uuid.UUID, content_hashes: list[str]) -> dict[str, uuid.UUID]:
+    """Existing invoices of the user by upload content hash"""
+    
+    if not content_hashes:
+        return {}
+    
+    # Served by the (user_id, content_hash) unique constraint
+    rows = await db.execute(select(Invoice.content_hash, Invoice.id).where(
+        Invoice.user_id == user_id, Invoice.content_hash.in_(set(content_hashes))
+    ))
+    return dict(rows.all())
+
 @router.post("/", response_model=UploadResponse)
 async def upload_invoice(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    parser: Optional[ParserBackend] = None,
+    db: AsyncSession = Depends(get_db)
 ):
     """Upload receipt image"""
     
     # Validate file type
-    if not file.content_type or not file.content_type.startswith(('image/', 'application/pdf')):
+    if not is_allowed_file(file):
         raise HTTPException(status_code=400, detail="Only image and PDF files are allowed")
     
     try:
         # Get current user
         user_id = auth_service.get_current_user_id()
         
-        # Save file
-        file_url = await storage_service.save_file(file.file, file.filename)
+        # Same bytes uploaded before: return that invoice without storing anything
+        content_hash, _ = await hash_upload(file)
+        existing = await find_uploaded_invoices(db, user_id, [content_hash])
+        if existing:
+            duplicate_receipts.inc("exact")
+            return UploadResponse(id=existing[content_hash], duplicate=True)
+        
+        # Save file, then shrink it for storage and the vision model
+        with stage("storage_write"):
+            stored = await storage_service.save_file(file, file.filename)
+        stored = await image_processing_service.normalize_stored(stored, file.content_type)
         
         # Create invoice record
         invoice = Invoice(
             user_id=user_id,
-            file_url=file_url
+            file_url=stored.url,
+            content_hash=content_hash
         )
         
         db.add(invoice)
-        db.commit()
-        db.refresh(invoice)
+        try:
+            await db.flush()
+        except IntegrityError:
+            # A concurrent upload of the same file got there first
+            await db.rollback()
+            existing = await find_uploaded_invoices(db, user_id, [content_hash])
+            if not existing:
+                raise
+            duplicate_receipts.inc("exact")
+            return UploadResponse(id=existing[content_hash], duplicate=True)
         
-        return UploadResponse(id=invoice.id)
+        # Queue parsing in the same transaction
+        if PARSE_ON_UPLOAD:
+            await parse_queue_service.enqueue(db, invoice.id, parser)
         
+        await db.commit()
+        parse_queue_service.notify()
+        
+        return UploadResponse(id=invoice.id)
+    
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
-@router.post("/{invoice_id}/parse", response_model=ParsedReceipt)
-async def parse_invoice(
-    invoice_id: uuid.UUID,
-    db: Session = Depends(get_db)
+@router.post("/batch")
+async def upload_invoice_batch(
+    files: List[UploadFile] = File(...),
+    parser: Optional[ParserBackend] = None,
+    db: AsyncSession = Depends(get_db)
 ):
-    """Parse uploaded receipt with AI"""
+    """Upload and parse many receipts, streaming NDJSON results as each parse finishes"""
     
-    # Get invoice
-    invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
-    if not invoice:
-        raise HTTPException(status_code=404, detail="Invoice not found")
+    if len(files) > batch_import_service.max_files:
+        raise HTTPException(status_code=413, detail=f"At most {batch_import_service.max_files} files per batch")
     
-    # Verify ownership
     user_id = auth_service.get_current_user_id()
-    if invoice.user_id != user_id:
-        raise HTTPException(status_code=403, detail="Access denied")
     
+    # Hash files first, collecting per-file errors instead of failing the batch
+    hashed = []
+    errors = []
+    for index, file in enumerate(files):
+        if not is_allowed_file(file):
+            errors.append({"index": index, "filename": file.filename, "status": "rejected",
+                           "error": "Only image and PDF files are allowed"})
+            continue
+        try:
+            content_hash, _ = await hash_upload(file)
+            hashed.append((index, file, content_hash))
+        except Exception as e:
+            errors.append({"index": index, "filename": file.filename, "status": "rejected",
+                           "error": f"Upload failed: {str(e)}"})
+    
+    # Files uploaded before, or repeated within the batch, are not stored again
+    invoice_by_hash = await find_uploaded_invoices(db, user_id, [content_hash for _, _, content_hash in hashed])
+    stored = []
+    duplicates = []
+    for index, file, content_hash in hashed:
+        if content_hash in invoice_by_hash or any(content_hash == h for _, _, _, h in stored):
+            duplicates.append((index, file.filename, content_hash))
+            continue
+        try:
+            with stage("storage_write"):
+                stored_file = await storage_service.save_file(file, file.filename)
+            stored_file = await image_processing_service.normalize_stored(stored_file, file.content_type)
+            stored.append((index, file.filename, stored_file.url, content_hash))
+        except Exception as e:
+            errors.append({"index": index, "filename": file.filename, "status": "rejected",
+                           "error": f"Upload failed: {str(e)}"})
+    
+    # Create all invoice rows in one round trip
     try:
-        # Parse with AI
-        parsed_data = await ai_parser_service.parse_receipt(invoice.file_url)
-        
-        # Update invoice with parsed data
-        invoice.vendor = parsed_data.vendor
-        invoice.invoice_no = parsed_data.invoice_no
-        invoice.invoice_date = datetime.strptime(parsed_data.invoice_date, "%Y-%m-%d").date()
-        invoice.currency = parsed_data.currency
-        invoice.subtotal = parsed_data.subtotal
-        invoice.tax = parsed_data.tax
-        invoice.total = parsed_data.total
-        invoice.raw_json = parsed_data.dict()
-        
-        # Create expense entries
-        if parsed_data.items:
-            # Create individual expenses for each item
-            for item in parsed_data.items:
-                expense = Expense(
-                    user_id=user_id,
-                    invoice_id=invoice.id,
-                    date=invoice.invoice_date,
-                    category=item.category,
-                    description=item.description,
-                    amount=item.line_total,
-                    currency=parsed_data.currency,
-                    vendor=parsed_data.vendor
-                )
-                db.add(expense)
-        else:
-            # Create single expense from total
-            category = categorization_service.categorize_expense(
-                vendor=parsed_data.vendor,
-                description=f"Purchase from {parsed_data.vendor}"
-            )
-            expense = Expense(
-                user_id=user_id,
-                invoice_id=invoice.id,
-                date=invoice.invoice_date,
-                category=category,
-                description=f"Purchase from {parsed_data.vendor}",
-                amount=parsed_data.total,
-                currency=parsed_data.currency,
-                vendor=parsed_data.vendor
-            )
-            db.add(expense)
+        invoice_ids = await batch_import_service.create_invoices(
+            db, user_id, [(url, content_hash) for _, _, url, content_hash in stored], parser
+        )
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    
+    # Files a concurrent upload inserted first are duplicates of its invoice
+    conflicts = [(index, filename, content_hash) for index, filename, _, content_hash in stored
+                 if content_hash not in invoice_ids]
+    if conflicts:
+        invoice_by_hash.update(await find_uploaded_invoices(db, user_id, [h for _, _, h in conflicts]))
+        duplicates.extend(conflicts)
+    
+    files_by_invoice = {
+        str(invoice_ids[content_hash]): (index, filename)
+        for index, filename, _, content_hash in stored if content_hash in invoice_ids
+    }
+    invoice_by_hash.update(invoice_ids)
+    
+    async def results():
+        for error in errors:
+            yield json.dumps(error) + "\n"
         
-        db.commit()
-        return parsed_data
+        for index, filename, content_hash in duplicates:
+            duplicate_receipts.inc("exact")
+            yield json.dumps({"index": index, "filename": filename, "status": "duplicate",
+                              "invoice_id": str(invoice_by_hash[content_hash])}) + "\n"
         
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Parsing failed: {str(e)}")
+        async for result in batch_import_service.parse_all(list(invoice_ids.values())):
+            index, filename = files_by_invoice[result["invoice_id"]]
+            yield json.dumps({"index": index, "filename": filename, **result}, default=str) + "\n"
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@router.post("/{invoice_id}/parse", response_model=ParseJobResponse, status_code=202)
+async def parse_invoice(
+    invoice_id: uuid.UUID,
+    parser: Optional[ParserBackend] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Queue uploaded receipt for AI parsing"""
+    
+    invoice = await get_owned_invoice(db, invoice_id)
+    
+    job = await parse_queue_service.enqueue(db, invoice.id, parser)
+    await db.commit()
+    # Load server-side defaults for the response
+    await db.refresh(job)
+    parse_queue_service.notify()
+    
+    return job
+
+@router.get("/{invoice_id}/status", response_model=ParseJobResponse)
+async def get_parse_status(
+    invoice_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db)
+):
+    """Get parse job status (queued/running/done/failed)"""
+    
+    invoice = await get_owned_invoice(db, invoice_id)
+    
+    job = await parse_queue_service.get_job(db, invoice.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Invoice has not been queued for parsing")
+    
+    return job
 
 @router.get("/{invoice_id}", response_model=InvoiceResponse)
 async def get_invoice(
     invoice_id: uuid.UUID,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get invoice details"""
     
-    invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
-    if not invoice:
-        raise HTTPException(status_code=404, detail="Invoice not found")
-    
-    # Verify ownership
-    user_id = auth_service.get_current_user_id()
-    if invoice.user_id != user_id:
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    return invoice
\ No newline at end of file
+    invoice = await get_owned_invoice(db, invoice_id)
+    return FastJSONResponse(content=response_content(invoice, InvoiceResponse))
\ No newline at end of file
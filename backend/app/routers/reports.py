@@ -1,32 +1,22 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
 from app.database import get_db
-from app.models import Expense
 from app.schemas import MonthlyReport
 from app.services.auth import auth_service
+from app.services.rollups import monthly_rollup_service
 
 router = APIRouter()
 
 @router.get("/monthly", response_model=List[MonthlyReport])
-async def get_monthly_reports(db: Session = Depends(get_db)):
+async def get_monthly_reports(db: AsyncSession = Depends(get_db)):
     """Get monthly spending reports"""
     
     user_id = auth_service.get_current_user_id()
     
-    # Query monthly aggregations
-    monthly_data = db.query(
-        func.to_char(Expense.date, 'YYYY-MM').label('month'),
-        Expense.category,
-        func.sum(Expense.amount).label('total')
-    ).filter(
-        Expense.user_id == user_id
-    ).group_by(
-        func.to_char(Expense.date, 'YYYY-MM'),
-        Expense.category
-    ).order_by('month').all()
+    # Read the maintained rollup instead of aggregating all expenses
+    monthly_data = (await db.scalars(monthly_rollup_service.monthly_totals_query(user_id))).all()
     
     # Group by month
     reports = {}
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
-from datetime import date
+from typing import Iterable, Optional, List, Literal
+from datetime import date, datetime
 from decimal import Decimal
 import uuid
 
@@ -37,8 +37,10 @@ class InvoiceResponse(BaseModel):
     tax: Optional[Decimal] = None
     total: Optional[Decimal] = None
     raw_json: Optional[dict] = None
-    created_at: Optional[str] = None
-
+    content_hash: Optional[str] = None
+    duplicate_of_id: Optional[uuid.UUID] = None
+    created_at: Optional[datetime] = None
+    
     class Config:
         from_attributes = True
 
@@ -52,14 +54,42 @@ class ExpenseResponse(BaseModel):
     amount: Decimal
     currency: str
     vendor: Optional[str] = None
-
+    
     class Config:
         from_attributes = True
 
+def response_content(obj, schema: type[BaseModel], fields: Optional[Iterable[str]] = None) -> dict:
+    """Fields of an ORM object in `schema`'s shape, for FastJSONResponse.
+    
+    Rows loaded from the database already satisfy the schema, so this skips
+    the validation a response_model would run on every row.
+    """
+    return {name: getattr(obj, name) for name in (fields or schema.model_fields)}
+
+class ExpenseUpdate(BaseModel):
+    category: str = Field(..., min_length=1)
+    remember_vendor: bool = True  # learn vendor->category for future receipts
+
 class MonthlyReport(BaseModel):
     month: str
     categories: dict[str, float]
     total: float
 
 class UploadResponse(BaseModel):
-    id: uuid.UUID
\ No newline at end of file
+    id: uuid.UUID
+    duplicate: bool = False  # same file was already uploaded; id is the existing invoice
+
+# Parser backends (see app.services.ai_parser.PARSERS)
+ParserBackend = Literal["vision", "ocr", "tiered"]
+
+class ParseJobResponse(BaseModel):
+    invoice_id: uuid.UUID
+    status: str
+    attempts: int
+    parser: Optional[str] = None
+    last_error: Optional[str] = None
+    run_after: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
\ No newline at end of file
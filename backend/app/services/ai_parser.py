@@ -1,25 +1,34 @@
 import os
-import json
+import time
+import base64
+import asyncio
+import logging
+import mimetypes
+from collections import OrderedDict
 from typing import Optional
-from openai import OpenAI
+import orjson
+from openai import AsyncOpenAI
 from pydantic import ValidationError
 
+from app.database import AsyncSessionLocal
 from app.schemas import ParsedReceipt
 from app.services.categorization import categorization_service
+from app.services.metrics import (
+    stage, stage_seconds, record_usage, parse_tiers, layout_escalations, layout_confidence,
+    batch_sizes, batch_receipts
+)
+from app.services.layout_extractor import LayoutExtraction, extract_layout, totals_match
+from app.services.ocr import ocr_service
+from app.services.parse_cache import parse_cache_service
+from app.services.resilience import model_call_guard
+from app.services.storage import storage_service
 
-class AIParserService:
-    def __init__(self):
-        self.client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            base_url=os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
-        )
-        self.model = os.getenv("OPENAI_MODEL_VISION", "gpt-4o-mini")
-        self.temperature = float(os.getenv("OPENAI_TEMPERATURE", "0.1"))
-    
-    async def parse_receipt(self, image_url: str) -> ParsedReceipt:
-        """Parse receipt image using OpenAI Vision API"""
-        
-        system_prompt = """Ti je një parser faturash. Kthe JSON strikt sipas skemës më poshtë. Mos shto tekst tjetër.
+logger = logging.getLogger(__name__)
+
+# Bump whenever SYSTEM_PROMPT changes so cached parses are not reused
+PROMPT_VERSION = "1"
+
+SYSTEM_PROMPT = """Ti je një parser faturash. Kthe JSON strikt sipas skemës më poshtë. Mos shto tekst tjetër.
 Schema:
 {
   "vendor": "string",
@@ -35,55 +44,395 @@ Schema:
   "guessed_categories": true
 }"""
 
+BATCH_PROMPT = """Do të marrësh disa fatura, secila e paraprirë nga teksti "Fatura N".
+Kthe JSON {"receipts": [...]} me një objekt sipas skemës për secilën faturë, në të njëjtën radhë,
+dhe shto te secili fushën "index": N."""
+
+# Default parser backend; requests may pick another with ?parser=
+PARSER_BACKEND = os.getenv("PARSER_BACKEND", "vision").lower()
+
+async def categorize_receipt(receipt: ParsedReceipt) -> ParsedReceipt:
+    """Fill in "auto" item categories"""
+    
+    auto_items = [item for item in receipt.items if item.category == "auto"]
+    if auto_items:
+        descriptions = [item.description for item in auto_items]
+        with stage("categorization"):
+            # Vendor mapping cache misses query through the async session,
+            # off the event loop; cache hits never open a connection
+            async with AsyncSessionLocal() as db:
+                categories = await db.run_sync(
+                    lambda session: categorization_service.categorize_many(receipt.vendor, descriptions, db=session)
+                )
+        for item, category in zip(auto_items, categories):
+            item.category = category
+    return receipt
+
+async def build_receipt(parsed_data: dict) -> ParsedReceipt:
+    """Validate a receipt dict and fill in "auto" item categories"""
+    
+    with stage("validation"):
+        receipt = ParsedReceipt.model_validate(parsed_data)
+    return await categorize_receipt(receipt)
+
+class ReceiptBatcher:
+    """Coalesces concurrent parses of small images into one multi-image request.
+    
+    A batch goes out once it holds max_size images or max_wait after its
+    first one. Each caller gets back its own raw receipt dict, or None when
+    it has to be parsed on its own: the batch failed, the model left it out,
+    or nothing else arrived in time to batch with.
+    """
+    
+    def __init__(self, parser: "AIParserService", max_size: int, max_wait: float):
+        self.parser = parser
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Keeps running batch tasks referenced until they finish
+        self._tasks: set[asyncio.Task] = set()
+    
+    async def submit(self, image_ref: str) -> Optional[tuple[dict, float, int]]:
+        """(raw receipt, model seconds, tokens) for this image's share of a batch"""
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((image_ref, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+    
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Skip callers that were cancelled while waiting, e.g. a batch import
+        # whose client disconnected
+        batch = [(ref, future) for ref, future in self._pending if not future.done()]
+        self._pending = []
+        if not batch:
+            return
+        
+        batch_sizes.observe(len(batch))
+        if len(batch) == 1:
+            batch[0][1].set_result(None)
+            return
+        
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, batch: list[tuple[str, asyncio.Future]]):
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": "Lexo faturën dhe kthe JSON"},
-                            {"type": "image_url", "image_url": {"url": image_url}}
-                        ]
-                    }
-                ],
-                response_format={"type": "json_object"},
-                temperature=self.temperature,
-                max_tokens=1000
+            receipts, model_seconds, tokens = await self.parser.complete_batch([ref for ref, _ in batch])
+        except Exception as e:
+            logger.warning("Batch of %s receipts failed, parsing them one by one: %s", len(batch), e)
+            receipts = [None] * len(batch)
+        
+        for (_, future), receipt in zip(batch, receipts):
+            if future.done():
+                continue  # caller was cancelled
+            if receipt is None:
+                batch_receipts.inc("fallback")
+                future.set_result(None)
+            else:
+                future.set_result((receipt, model_seconds / len(batch), tokens // len(batch)))
+
+class AIParserService:
+    """Vision path: the receipt image goes straight to the model"""
+    
+    prompt_version = PROMPT_VERSION
+    
+    def __init__(self):
+        self.client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1"),
+            timeout=float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60")),
+            # Retries, rate limiting and circuit breaking happen in model_call_guard
+            max_retries=0
+        )
+        self.guard = model_call_guard
+        self.model = os.getenv("OPENAI_MODEL_VISION", "gpt-4o-mini")
+        self.temperature = float(os.getenv("OPENAI_TEMPERATURE", "0.1"))
+        
+        # Caps in-flight model calls per worker process
+        self.max_concurrency = int(os.getenv("PARSER_MAX_CONCURRENCY", "32"))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        # "inline" embeds image bytes as a data URL; "url" makes the provider
+        # fetch file_url, which must then be publicly reachable
+        self.image_mode = os.getenv("PARSER_IMAGE_MODE", "inline").lower()
+        self.inline_cache_size = int(os.getenv("INLINE_IMAGE_CACHE_SIZE", "32"))
+        self._inline_cache: OrderedDict[str, str] = OrderedDict()
+        
+        # Several small receipts per request: one system prompt and one round
+        # trip for up to PARSER_BATCH_SIZE images
+        self.batcher: Optional[ReceiptBatcher] = None
+        self.batch_max_image_bytes = int(os.getenv("PARSER_BATCH_MAX_IMAGE_BYTES", "262144"))
+        if os.getenv("PARSER_BATCH_ENABLED", "false").lower() == "true":
+            self.batcher = ReceiptBatcher(
+                self,
+                max_size=int(os.getenv("PARSER_BATCH_SIZE", "4")),
+                max_wait=float(os.getenv("PARSER_BATCH_WAIT_MS", "50")) / 1000,
             )
+    
+    async def image_reference(self, image_url: str, image_bytes: Optional[bytes] = None) -> str:
+        """Return the URL to send to the model for this image"""
+        
+        if self.image_mode != "inline":
+            return image_url
+        
+        # Small LRU so immediate retries skip the read and base64 encode
+        data_url = self._inline_cache.get(image_url)
+        if data_url is not None:
+            self._inline_cache.move_to_end(image_url)
+            return data_url
+        
+        if image_bytes is None:
+            image_bytes = await storage_service.read_file(image_url)
+        
+        mime_type = mimetypes.guess_type(image_url)[0] or "image/jpeg"
+        data_url = f"data:{mime_type};base64,{base64.b64encode(image_bytes).decode('ascii')}"
+        
+        self._inline_cache[image_url] = data_url
+        if len(self._inline_cache) > self.inline_cache_size:
+            self._inline_cache.popitem(last=False)
+        
+        return data_url
+    
+    async def build_messages(self, image_url: str, image_bytes: Optional[bytes] = None) -> list[dict]:
+        """Chat messages asking the model to parse this receipt"""
+        
+        image_ref = await self.image_reference(image_url, image_bytes)
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "Lexo faturën dhe kthe JSON"},
+                    {"type": "image_url", "image_url": {"url": image_ref}}
+                ]
+            }
+        ]
+    
+    async def complete(self, messages: list[dict], max_tokens: int) -> tuple[dict, float, int]:
+        """One guarded model call; returns (decoded JSON, seconds, total tokens)"""
+        
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                response = await self.guard.call(
+                    lambda: self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        response_format={"type": "json_object"},
+                        temperature=self.temperature,
+                        max_tokens=max_tokens
+                    ),
+                    label=self.model
+                )
+            finally:
+                # Includes retries and rate limiter waits
+                model_seconds = time.perf_counter() - started
+                stage_seconds.observe(model_seconds, "model_call")
+        
+        record_usage(self.model, response.usage)
+        
+        content = response.choices[0].message.content
+        with stage("json_decode"):
+            parsed_data = orjson.loads(content)
+        
+        return parsed_data, model_seconds, response.usage.total_tokens if response.usage else 0
+    
+    async def complete_batch(self, image_refs: list[str]) -> tuple[list[Optional[dict]], float, int]:
+        """Parse several images in one request; receipts come back in input order, None if missing"""
+        
+        content = [{"type": "text", "text": "Lexo faturat dhe kthe JSON"}]
+        for index, image_ref in enumerate(image_refs, start=1):
+            content.append({"type": "text", "text": f"Fatura {index}"})
+            content.append({"type": "image_url", "image_url": {"url": image_ref}})
+        messages = [
+            {"role": "system", "content": f"{SYSTEM_PROMPT}\n{BATCH_PROMPT}"},
+            {"role": "user", "content": content}
+        ]
+        
+        data, model_seconds, tokens = await self.complete(messages, max_tokens=1000 * len(image_refs))
+        
+        receipts: list[Optional[dict]] = [None] * len(image_refs)
+        returned = [receipt for receipt in data.get("receipts") or [] if isinstance(receipt, dict)]
+        for position, receipt in enumerate(returned):
+            index = receipt.pop("index", None)
+            # Trust positions only when the model returned exactly one receipt per image
+            if not isinstance(index, int) and len(returned) == len(image_refs):
+                index = position + 1
+            if isinstance(index, int) and 1 <= index <= len(image_refs) and receipts[index - 1] is None:
+                receipts[index - 1] = receipt
+        return receipts, model_seconds, tokens
+    
+    async def parse_batched(self, image_url: str, image_bytes: bytes,
+                            cache_key: Optional[str]) -> Optional[ParsedReceipt]:
+        """Parse as part of a batch; None means parse on its own instead"""
+        
+        result = await self.batcher.submit(await self.image_reference(image_url, image_bytes))
+        if result is None:
+            return None
+        
+        parsed_data, model_seconds, tokens = result
+        try:
+            with stage("validation"):
+                receipt = ParsedReceipt.model_validate(parsed_data)
+        except ValidationError:
+            batch_receipts.inc("invalid")
+            return None
+        
+        batch_receipts.inc("ok")
+        if cache_key:
+            await parse_cache_service.set(cache_key, parsed_data, model_seconds, tokens)
+        return await categorize_receipt(receipt)
+    
+    async def parse_receipt(self, image_url: str, content_hash: Optional[str] = None,
+                            image_bytes: Optional[bytes] = None) -> ParsedReceipt:
+        """Parse receipt image into structured data"""
+        
+        try:
+            # Reuse earlier model output for identical image content
+            cache_key = None
+            parsed_data = None
+            if content_hash:
+                cache_key = parse_cache_service.make_key(content_hash, self.model, self.prompt_version)
+                parsed_data = await parse_cache_service.get(cache_key)
             
-            content = response.choices[0].message.content
-            parsed_data = json.loads(content)
-            
-            # Auto-categorize items if needed
-            if "items" in parsed_data:
-                for item in parsed_data["items"]:
-                    if item.get("category") == "auto":
-                        item["category"] = categorization_service.categorize_expense(
-                            vendor=parsed_data.get("vendor"),
-                            description=item.get("description")
-                        )
+            if (parsed_data is None and self.batcher is not None
+                    and image_bytes is not None and len(image_bytes) <= self.batch_max_image_bytes):
+                receipt = await self.parse_batched(image_url, image_bytes, cache_key)
+                if receipt is not None:
+                    return receipt
             
-            # Validate against Pydantic schema
-            return ParsedReceipt(**parsed_data)
+            if parsed_data is None:
+                messages = await self.build_messages(image_url, image_bytes)
+                parsed_data, model_seconds, tokens = await self.complete(messages, max_tokens=1000)
+                
+                # Cache the raw model output; categories are applied below so
+                # rule changes take effect on cached receipts too
+                if cache_key:
+                    await parse_cache_service.set(cache_key, parsed_data, model_seconds, tokens)
             
+            return await build_receipt(parsed_data)
+        
         except ValidationError as e:
             raise ValueError(f"Invalid receipt data format: {e}")
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             raise ValueError(f"Invalid JSON response from AI: {e}")
         except Exception as e:
             raise ValueError(f"AI parsing failed: {e}")
 
-# TODO: Option B - OCR + LLM pipeline
-class OCRParserService:
+class OCRParserService(AIParserService):
+    """OCR path: Tesseract reads the receipt locally and only the normalized
+    text goes to a text model, which costs far fewer tokens than the image.
     """
-    TODO: Option B implementation
-    1. Use OCR provider (Tesseract/Cloud Vision/Textract) to extract raw text
-    2. Clean and normalize the text
-    3. Use LLM to structure the normalized text into JSON
-    4. This approach may be more cost-effective for high volume
+    
+    prompt_version = f"ocr-{PROMPT_VERSION}"
+    
+    def __init__(self):
+        super().__init__()
+        self.model = os.getenv("OPENAI_MODEL_TEXT", "gpt-4o-mini")
+        # Batching combines images; OCR text prompts are already small
+        self.batcher = None
+    
+    async def build_messages(self, image_url: str, image_bytes: Optional[bytes] = None) -> list[dict]:
+        if image_bytes is None:
+            image_bytes = await storage_service.read_file(image_url)
+        
+        text = await ocr_service.extract_text(image_bytes)
+        if not text:
+            raise ValueError("OCR found no text on the receipt")
+        
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"Teksti i faturës (OCR):\n{text}\n\nKthe JSON"}
+        ]
+
+class TieredParserService:
+    """Reads receipts of known chains (see layout_extractor.LAYOUTS) from OCR
+    text with no model call, and hands everything else to the fallback parser.
     """
-    pass
+    
+    def __init__(self, fallback: AIParserService):
+        self.fallback = fallback
+        self.min_confidence = float(os.getenv("LAYOUT_MIN_CONFIDENCE", "0.9"))
+        self.total_tolerance = float(os.getenv("LAYOUT_TOTAL_TOLERANCE", "0.01"))
+    
+    def escalation_reason(self, extraction: Optional[LayoutExtraction]) -> Optional[str]:
+        """Why the layout result can't be used, or None if it can"""
+        
+        if extraction is None:
+            return "unknown_layout"
+        if extraction.confidence < self.min_confidence:
+            return "low_confidence"
+        if not totals_match(extraction.data, self.total_tolerance):
+            return "totals_mismatch"
+        return None
+    
+    async def read_layout(self, image_url: str, image_bytes: Optional[bytes]) -> tuple[Optional[ParsedReceipt], str]:
+        """Layout tier: (receipt, "") on success, else (None, escalation reason)"""
+        
+        if not ocr_service.available:
+            return None, "no_ocr"
+        
+        if image_bytes is None:
+            image_bytes = await storage_service.read_file(image_url)
+        try:
+            text = await ocr_service.extract_text(image_bytes)
+        except Exception as e:
+            logger.warning("OCR failed for %s: %s", image_url, e)
+            return None, "no_text"
+        if not text:
+            return None, "no_text"
+        
+        with stage("layout_extract"):
+            extraction = extract_layout(text)
+        if extraction is not None:
+            layout_confidence.observe(extraction.confidence, extraction.vendor)
+        
+        reason = self.escalation_reason(extraction)
+        if reason is not None:
+            return None, reason
+        
+        try:
+            return await build_receipt(extraction.data), ""
+        except ValidationError:
+            return None, "invalid"
+    
+    async def parse_receipt(self, image_url: str, content_hash: Optional[str] = None,
+                            image_bytes: Optional[bytes] = None) -> ParsedReceipt:
+        """Parse from the receipt layout, escalating to the model when unsure"""
+        
+        receipt, reason = await self.read_layout(image_url, image_bytes)
+        if receipt is not None:
+            parse_tiers.inc("layout")
+            return receipt
+        
+        layout_escalations.inc(reason)
+        parse_tiers.inc("model")
+        return await self.fallback.parse_receipt(image_url, content_hash=content_hash, image_bytes=image_bytes)
+
+ai_parser_service = AIParserService()
+ocr_parser_service = OCRParserService()
+tiered_parser_service = TieredParserService(fallback=ai_parser_service)
 
-ai_parser_service = AIParserService()
\ No newline at end of file
+PARSERS = {
+    "vision": ai_parser_service,
+    "ocr": ocr_parser_service,
+    "tiered": tiered_parser_service,
+}
+
+def get_parser(backend: Optional[str] = None):
+    """Parser for a backend name; None means the deployment's PARSER_BACKEND"""
+    
+    backend = backend or PARSER_BACKEND
+    if backend not in PARSERS:
+        raise ValueError(f"Unknown parser backend: {backend}")
+    return PARSERS[backend]
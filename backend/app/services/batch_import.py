@@ -0,0 +1,97 @@
+import os
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import AsyncSessionLocal, dialect_insert
+from app.models import Invoice, ParseJob
+from app.services.parse_queue import parse_queue_service
+
+class BatchImportService:
+    """Bulk upload and parse of many receipts in one request"""
+    
+    def __init__(self):
+        self.max_files = int(os.getenv("BATCH_MAX_FILES", "500"))
+        # Whole request body, enforced before the multipart form is spooled
+        self.max_bytes = int(os.getenv("BATCH_MAX_BYTES", str(256 * 1024 * 1024)))
+        self.parse_concurrency = int(os.getenv("BATCH_PARSE_CONCURRENCY", "8"))
+    
+    async def create_invoices(self, db: AsyncSession, user_id: uuid.UUID,
+                              uploads: list[tuple[str, str]], parser: Optional[str] = None) -> dict[str, uuid.UUID]:
+        """Insert invoices for (file_url, content_hash) pairs and their parse jobs with one statement each.
+        
+        Returns the new invoice ids by content hash. Hashes the user uploaded
+        concurrently since the caller's duplicate check are skipped and left out.
+        """
+        
+        if not uploads:
+            return {}
+        
+        now = datetime.utcnow()
+        
+        stmt = dialect_insert(db, Invoice).values([
+            {"id": uuid.uuid4(), "user_id": user_id, "file_url": file_url, "content_hash": content_hash}
+            for file_url, content_hash in uploads
+        ])
+        rows = await db.execute(stmt.on_conflict_do_nothing(
+            index_elements=[Invoice.user_id, Invoice.content_hash]
+        ).returning(Invoice.content_hash, Invoice.id))
+        invoice_ids = dict(rows.all())
+        
+        if not invoice_ids:
+            await db.commit()
+            return invoice_ids
+        
+        # Jobs stay queued until their parse starts in this request. The
+        # queue workers leave them alone for PARSE_JOB_TIMEOUT_SECONDS and
+        # take over the ones still queued if the request dies first
+        run_after = now + timedelta(seconds=parse_queue_service.job_timeout)
+        await db.execute(insert(ParseJob), [
+            {
+                "id": uuid.uuid4(),
+                "invoice_id": invoice_id,
+                "status": "queued",
+                "attempts": 0,
+                "max_attempts": parse_queue_service.max_attempts,
+                "parser": parser,
+                "run_after": run_after,
+            }
+            for invoice_id in invoice_ids.values()
+        ])
+        
+        await db.commit()
+        return invoice_ids
+    
+    async def parse_all(self, invoice_ids: list[uuid.UUID]) -> AsyncIterator[dict]:
+        """Parse invoices concurrently, yielding each result as it finishes"""
+        
+        semaphore = asyncio.Semaphore(self.parse_concurrency)
+        
+        async def parse_one(invoice_id: uuid.UUID) -> dict:
+            async with semaphore, AsyncSessionLocal() as db:
+                # Marked running only now, so waiting jobs never look stale
+                job = await parse_queue_service.claim_invoice(db, invoice_id)
+                if job is None:
+                    # A queue worker took it over; it records the outcome
+                    job = await parse_queue_service.get_job(db, invoice_id)
+                    return {"invoice_id": str(invoice_id), "status": job.status}
+                
+                # Same path as the queue workers: heartbeat, fenced save, retries
+                parsed_data = await parse_queue_service.run_job(db, job)
+                if parsed_data is None:
+                    return {"invoice_id": str(invoice_id), "status": job.status, "error": job.last_error}
+                return {"invoice_id": str(invoice_id), "status": "done", "receipt": parsed_data.model_dump()}
+        
+        tasks = [asyncio.create_task(parse_one(invoice_id)) for invoice_id in invoice_ids]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            # Client went away: stop outstanding parses, the queue retries them
+            for task in tasks:
+                task.cancel()
+
+batch_import_service = BatchImportService()
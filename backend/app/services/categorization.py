@@ -1,4 +1,9 @@
-from typing import Dict, Optional
+import os
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+
+from app.services.vendor_mappings import VendorMappingStore, vendor_mapping_store
 
 # Category mapping rules
 CATEGORY_RULES: Dict[str, str] = {
@@ -44,37 +49,160 @@ CATEGORY_RULES: Dict[str, str] = {
     "entertainment": "Argëtim",
 }
 
+DEFAULT_CATEGORY = "Tjetër"
+
+NO_MATCH = float("inf")
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over rule keywords.
+    
+    Finds every keyword occurrence in a single pass over the text. Rules are
+    prioritized by their position in the rules table: when several keywords
+    match, the earliest rule wins, exactly like a linear scan in order.
+    """
+    
+    def __init__(self, keywords: List[str], word_boundary: bool = False):
+        self.word_boundary = word_boundary
+        
+        # Trie with per-node transitions, failure links and outputs
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.outputs: List[List[Tuple[int, int]]] = [[]]  # (priority, keyword length)
+        
+        for priority, keyword in enumerate(keywords):
+            if not keyword:
+                continue
+            node = 0
+            for char in keyword:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append([])
+                node = next_node
+            self.outputs[node].append((priority, len(keyword)))
+        
+        # Breadth-first pass: failure links, and outputs merged along them
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+                queue.append(child)
+        
+        for outputs in self.outputs:
+            outputs.sort()
+        
+        # Best priority reachable at each node, for the no-boundary fast path
+        self.best = [outputs[0][0] if outputs else NO_MATCH for outputs in self.outputs]
+    
+    def match_priority(self, text: str) -> float:
+        """Return the priority of the best matching keyword, or NO_MATCH"""
+        
+        goto = self.goto
+        fail = self.fail
+        best = NO_MATCH
+        node = 0
+        
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            
+            if not self.word_boundary:
+                if self.best[node] < best:
+                    best = self.best[node]
+                    if best == 0:
+                        break
+                continue
+            
+            for priority, length in self.outputs[node]:
+                if priority >= best:
+                    break
+                start = index - length + 1
+                if start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if index + 1 < len(text) and _is_word_char(text[index + 1]):
+                    continue
+                best = priority
+        
+        return best
+
 class CategorizationService:
-    def __init__(self):
-        self.rules = CATEGORY_RULES
-        # TODO: Add persistent vendor->category mapping for learning
-        self.vendor_mappings: Dict[str, str] = {}
+    def __init__(self, vendor_store: Optional[VendorMappingStore] = None):
+        self.word_boundary = os.getenv("CATEGORY_WORD_BOUNDARY", "false").lower() == "true"
+        self.set_rules(CATEGORY_RULES)
+        # Learned vendor->category corrections, checked before the rules
+        self.vendor_store = vendor_store
     
-    def categorize_expense(self, vendor: Optional[str] = None, description: Optional[str] = None) -> str:
-        """Categorize expense based on vendor and description"""
+    def set_rules(self, rules: Dict[str, str]):
+        """Replace keyword rules and recompile the matcher.
+        
+        Rules are matched in priority order: earlier entries win.
+        """
+        self.rules = rules
+        self._categories = list(rules.values())
+        self._matcher = KeywordMatcher([keyword.lower() for keyword in rules], self.word_boundary)
+    
+    def _category_for(self, priority: float) -> str:
+        if priority == NO_MATCH:
+            return DEFAULT_CATEGORY
+        return self._categories[priority]
+    
+    def _learned_category(self, vendor: Optional[str], db: Optional[Session] = None) -> Optional[str]:
+        if self.vendor_store is None or not vendor:
+            return None
+        return self.vendor_store.get(vendor, db)
+    
+    def categorize_expense(self, vendor: Optional[str] = None, description: Optional[str] = None,
+                           db: Optional[Session] = None) -> str:
+        """Categorize expense based on vendor and description; db is used for vendor mapping lookups"""
         
         # Check persistent vendor mappings first
-        if vendor and vendor.lower() in self.vendor_mappings:
-            return self.vendor_mappings[vendor.lower()]
+        learned = self._learned_category(vendor, db)
+        if learned:
+            return learned
         
         # Apply rule-based categorization
         text = f"{vendor or ''} {description or ''}".lower()
+        return self._category_for(self._matcher.match_priority(text))
+    
+    def categorize_many(self, vendor: Optional[str], descriptions: List[Optional[str]],
+                        db: Optional[Session] = None) -> List[str]:
+        """Categorize all items of one receipt, matching the vendor only once"""
+        
+        learned = self._learned_category(vendor, db)
+        if learned:
+            return [learned] * len(descriptions)
         
-        for keyword, category in self.rules.items():
-            if keyword in text:
-                return category
+        vendor_priority = self._matcher.match_priority((vendor or "").lower())
+        if vendor_priority == 0:
+            return [self._category_for(0)] * len(descriptions)
         
-        return "Tjetër"  # Default category
+        return [
+            self._category_for(min(vendor_priority, self._matcher.match_priority((description or "").lower())))
+            for description in descriptions
+        ]
     
-    def add_vendor_mapping(self, vendor: str, category: str):
-        """Add persistent vendor->category mapping for future learning"""
-        # TODO: Persist to database
-        self.vendor_mappings[vendor.lower()] = category
+    def add_vendor_mapping(self, db: Session, vendor: str, category: str):
+        """Add persistent vendor->category mapping for future learning; commits the session"""
+        if self.vendor_store is None:
+            raise RuntimeError("No vendor mapping store configured")
+        self.vendor_store.set(db, vendor, category)
     
     def get_all_categories(self) -> list[str]:
         """Get all available categories"""
         categories = set(self.rules.values())
-        categories.add("Tjetër")
+        categories.add(DEFAULT_CATEGORY)
         return sorted(list(categories))
 
-categorization_service = CategorizationService()
\ No newline at end of file
+categorization_service = CategorizationService(vendor_store=vendor_mapping_store)
\ No newline at end of file
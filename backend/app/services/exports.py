@@ -0,0 +1,226 @@
+import os
+import io
+import csv
+import zlib
+import uuid
+from dataclasses import dataclass
+from datetime import date
+from typing import Callable, Iterable, Iterator, Optional
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models import Expense
+
+try:
+    import zstandard
+except ImportError:  # zstd-compressed CSV is optional
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Parquet / Arrow exports are optional
+    pyarrow = None
+
+EXPORT_COLUMNS = [
+    ("Date", Expense.date),
+    ("Vendor", Expense.vendor),
+    ("Description", Expense.description),
+    ("Category", Expense.category),
+    ("Amount", Expense.amount),
+    ("Currency", Expense.currency),
+]
+
+class ExportFormatUnavailable(Exception):
+    """Export format needs an optional dependency that is not installed"""
+
+@dataclass
+class ExportFormat:
+    media_type: str
+    extension: str
+    columnar: bool = False
+
+EXPORT_FORMATS = {
+    "csv": ExportFormat("text/csv", "csv"),
+    "csv.gz": ExportFormat("application/gzip", "csv.gz"),
+    "csv.zst": ExportFormat("application/zstd", "csv.zst"),
+    "parquet": ExportFormat("application/vnd.apache.parquet", "parquet", columnar=True),
+    "arrow": ExportFormat("application/vnd.apache.arrow.stream", "arrow", columnar=True),
+}
+
+def format_for_accept(accept: Optional[str]) -> str:
+    """Pick an export format from an Accept header, defaulting to csv"""
+    
+    for media_range in (accept or "").split(","):
+        media_type = media_range.split(";")[0].strip().lower()
+        for name, export_format in EXPORT_FORMATS.items():
+            if media_type == export_format.media_type:
+                return name
+    return "csv"
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to the generator"""
+    
+    def __init__(self):
+        self.chunks: list[bytes] = []
+        self.position = 0
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self.position
+    
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+class ExportService:
+    """Streams expense exports from a server-side cursor"""
+    
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self.batch_rows = int(os.getenv("EXPORT_BATCH_ROWS", "5000"))
+        # Parquet/Arrow batches are larger so row groups compress well
+        self.row_group_rows = int(os.getenv("EXPORT_ROW_GROUP_ROWS", "65536"))
+        self.gzip_level = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+        self.zstd_level = int(os.getenv("EXPORT_ZSTD_LEVEL", "3"))
+    
+    def build_query(self, user_id: uuid.UUID, from_date: Optional[date] = None,
+                    to_date: Optional[date] = None, category: Optional[str] = None):
+        """Select export columns as plain tuples (same filters as the expenses endpoint)"""
+        
+        query = select(*[column for _, column in EXPORT_COLUMNS]).where(Expense.user_id == user_id)
+        
+        if from_date:
+            query = query.where(Expense.date >= from_date)
+        
+        if to_date:
+            query = query.where(Expense.date <= to_date)
+        
+        if category:
+            query = query.where(Expense.category == category)
+        
+        return query.order_by(Expense.date.desc(), Expense.id.desc())
+    
+    def iter_batches(self, query, batch_rows: Optional[int] = None) -> Iterator[list[tuple]]:
+        """Yield result rows in batches from a server-side cursor.
+        
+        Uses its own session, since streaming outlives the request handler.
+        """
+        
+        db = self.session_factory()
+        try:
+            result = db.execute(query.execution_options(yield_per=batch_rows or self.batch_rows))
+            for batch in result.partitions():
+                yield batch
+        finally:
+            db.close()
+    
+    def iter_csv(self, batches: Iterable[list[tuple]]) -> Iterator[str]:
+        """Yield CSV text, one chunk per batch of rows"""
+        
+        output = io.StringIO()
+        writer = csv.writer(output)
+        
+        writer.writerow([header for header, _ in EXPORT_COLUMNS])
+        yield output.getvalue()
+        
+        for batch in batches:
+            output.seek(0)
+            output.truncate()
+            # csv writes None as '' and str() of dates/decimals is their ISO/plain form
+            writer.writerows(batch)
+            yield output.getvalue()
+    
+    def _iter_compressed_csv(self, batches: Iterable[list[tuple]], compressor) -> Iterator[bytes]:
+        for text in self.iter_csv(batches):
+            data = compressor.compress(text.encode())
+            if data:
+                yield data
+        yield compressor.flush()
+    
+    def iter_csv_gzip(self, batches: Iterable[list[tuple]]) -> Iterator[bytes]:
+        """Yield gzip-compressed CSV as it is produced"""
+        return self._iter_compressed_csv(batches, zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31))
+    
+    def iter_csv_zstd(self, batches: Iterable[list[tuple]]) -> Iterator[bytes]:
+        """Yield zstd-compressed CSV as it is produced"""
+        if zstandard is None:
+            raise ExportFormatUnavailable("zstd export requires the zstandard package")
+        return self._iter_compressed_csv(batches, zstandard.ZstdCompressor(level=self.zstd_level).compressobj())
+    
+    def arrow_schema(self):
+        return pyarrow.schema([
+            ("date", pyarrow.date32()),
+            ("vendor", pyarrow.string()),
+            ("description", pyarrow.string()),
+            ("category", pyarrow.string()),
+            ("amount", pyarrow.decimal128(12, 2)),
+            ("currency", pyarrow.string()),
+        ])
+    
+    def _record_batch(self, schema, batch: list[tuple]):
+        columns = list(zip(*batch))
+        return pyarrow.record_batch(
+            [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)],
+            schema=schema
+        )
+    
+    def _iter_arrow_writer(self, batches: Iterable[list[tuple]], open_writer: Callable) -> Iterator[bytes]:
+        if pyarrow is None:
+            raise ExportFormatUnavailable("Parquet and Arrow exports require the pyarrow package")
+        
+        def generate():
+            schema = self.arrow_schema()
+            sink = _ChunkSink()
+            writer = open_writer(sink, schema)
+            try:
+                for batch in batches:
+                    writer.write_batch(self._record_batch(schema, batch))
+                    data = sink.drain()
+                    if data:
+                        yield data
+            finally:
+                writer.close()
+            yield sink.drain()
+        
+        return generate()
+    
+    def iter_parquet(self, batches: Iterable[list[tuple]]) -> Iterator[bytes]:
+        """Yield a Parquet file, one row group per batch"""
+        return self._iter_arrow_writer(batches, lambda sink, schema: pyarrow.parquet.ParquetWriter(
+            sink, schema, compression="zstd"
+        ))
+    
+    def iter_arrow(self, batches: Iterable[list[tuple]]) -> Iterator[bytes]:
+        """Yield an Arrow IPC stream, one record batch per batch"""
+        return self._iter_arrow_writer(batches, lambda sink, schema: pyarrow.ipc.new_stream(sink, schema))
+    
+    def writer(self, format_name: str) -> Callable[[Iterable[list[tuple]]], Iterator]:
+        return {
+            "csv": self.iter_csv,
+            "csv.gz": self.iter_csv_gzip,
+            "csv.zst": self.iter_csv_zstd,
+            "parquet": self.iter_parquet,
+            "arrow": self.iter_arrow,
+        }[format_name]
+    
+    def batch_rows_for(self, format_name: str) -> int:
+        return self.row_group_rows if EXPORT_FORMATS[format_name].columnar else self.batch_rows
+    
+    def stream(self, query, format_name: str) -> Iterator:
+        """Stream query results in the given export format"""
+        
+        # Writers check optional dependencies before the cursor is opened
+        return self.writer(format_name)(self.iter_batches(query, self.batch_rows_for(format_name)))
+
+export_service = ExportService()
@@ -0,0 +1,161 @@
+import os
+import io
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+from PIL import Image, ImageOps
+
+from app.services.metrics import stage
+from app.services.storage import storage_service, StoredFile
+
+try:
+    import pypdfium2
+except ImportError:  # PDF rasterization is optional
+    pypdfium2 = None
+
+FORMATS = {
+    "JPEG": ("image/jpeg", ".jpg"),
+    "WEBP": ("image/webp", ".webp"),
+}
+
+@dataclass
+class NormalizeOptions:
+    max_edge: int
+    image_format: str
+    quality: int
+    grayscale: bool
+    pdf_max_pages: int
+
+def _rasterize_pdf(data: bytes, max_pages: int) -> Image.Image:
+    """Render the first pages of a PDF stacked into one image"""
+
+    pdf = pypdfium2.PdfDocument(data)
+    pages = [
+        pdf[index].render(scale=2).to_pil()
+        for index in range(min(len(pdf), max_pages))
+    ]
+
+    width = max(page.width for page in pages)
+    image = Image.new("RGB", (width, sum(page.height for page in pages)), "white")
+    top = 0
+    for page in pages:
+        image.paste(page, (0, top))
+        top += page.height
+    return image
+
+def normalize_image_bytes(data: bytes, content_type: str, options: NormalizeOptions) -> Optional[bytes]:
+    """Auto-orient, downsize and re-encode an image or PDF; None if unsupported.
+
+    Runs in a worker process, so it must stay a picklable top-level function.
+    """
+
+    if content_type == "application/pdf":
+        if pypdfium2 is None:
+            return None
+        image = _rasterize_pdf(data, options.pdf_max_pages)
+    else:
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image)
+
+    image.thumbnail((options.max_edge, options.max_edge))
+
+    if options.grayscale:
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    output = io.BytesIO()
+    image.save(output, format=options.image_format, quality=options.quality, optimize=True)
+    return output.getvalue()
+
+class ImageProcessingService:
+    """Shrinks uploads before they are stored and sent to the vision model"""
+
+    def __init__(self):
+        self.enabled = os.getenv("IMAGE_NORMALIZE_ENABLED", "true").lower() == "true"
+        self.workers = int(os.getenv("IMAGE_WORKERS", "2"))
+        self.options = NormalizeOptions(
+            max_edge=int(os.getenv("IMAGE_MAX_EDGE", "1600")),
+            image_format=os.getenv("IMAGE_FORMAT", "JPEG").upper(),
+            quality=int(os.getenv("IMAGE_QUALITY", "85")),
+            grayscale=os.getenv("IMAGE_GRAYSCALE", "false").lower() == "true",
+            pdf_max_pages=int(os.getenv("PDF_MAX_PAGES", "2")),
+        )
+        if self.options.image_format not in FORMATS:
+            raise ValueError(
+                f"IMAGE_FORMAT must be one of {', '.join(FORMATS)}, got {self.options.image_format!r}"
+            )
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+        # Counters for /admin/stats
+        self.images = 0
+        self.failures = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def normalize(self, data: bytes, content_type: str) -> Optional[bytes]:
+        """Normalize image bytes in the process pool"""
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(), normalize_image_bytes, data, content_type, self.options
+        )
+
+    async def normalize_stored(self, stored: StoredFile, content_type: str) -> StoredFile:
+        """Replace a stored upload with its normalized version.
+
+        Images are only replaced when that is smaller; rasterized PDFs always
+        replace the PDF, since the vision model and OCR need an image.
+        """
+
+        if not self.enabled:
+            return stored
+
+        try:
+            data = await storage_service.read_file(stored.url)
+            with stage("image_preprocess"):
+                normalized = await self.normalize(data, content_type)
+        except Exception:
+            # Unreadable images are stored as-is and left to the model
+            self.failures += 1
+            return stored
+
+        self.images += 1
+        self.bytes_in += stored.size
+
+        if normalized is None or (content_type != "application/pdf" and len(normalized) >= stored.size):
+            self.bytes_out += stored.size
+            return stored
+
+        _, extension = FORMATS[self.options.image_format]
+        # The original stays: storage is content-addressed and shared, so a
+        # concurrent upload of the same bytes may still be reading it
+        replacement = await storage_service.save_bytes(normalized, extension)
+
+        self.bytes_out += replacement.size
+        return replacement
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        saved = self.bytes_in - self.bytes_out
+        return {
+            "enabled": self.enabled,
+            "images": self.images,
+            "failures": self.failures,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": saved,
+            "avg_bytes_saved_per_image": saved / self.images if self.images else 0.0,
+        }
+
+image_processing_service = ImageProcessingService()
@@ -0,0 +1,169 @@
+from sqlalchemy import delete, func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Optional
+import hashlib
+import os
+import uuid
+
+from app.models import Invoice, Expense, ParseJob
+from app.schemas import ParsedReceipt
+from app.services.storage import storage_service
+from app.services.ai_parser import get_parser
+from app.services.categorization import categorization_service
+from app.services.metrics import stage, duplicate_receipts
+from app.services.rollups import monthly_rollup_service, money
+
+# Fuzzy duplicates (same vendor, date and total) are always flagged with
+# duplicate_of_id; with this set they also get no expenses of their own
+SKIP_DUPLICATE_EXPENSES = os.getenv("DEDUPE_SKIP_FUZZY_EXPENSES", "false").lower() == "true"
+
+class JobLostError(Exception):
+    """The parse job was reclaimed by another worker; this result must not be saved"""
+
+async def process_invoice(db: AsyncSession, invoice: Invoice, parser: Optional[str] = None,
+                          job_attempt: Optional[int] = None) -> ParsedReceipt:
+    """Parse invoice image and store parsed data and expenses.
+    
+    With job_attempt, the result is only saved if the invoice's parse job is
+    still running that attempt (see save_parsed_receipt).
+    """
+    
+    file_url = invoice.file_url
+    
+    # Release the connection while the model call runs
+    await db.commit()
+    
+    parsed_data = await parse_invoice_file(file_url, parser)
+    await db.run_sync(save_parsed_receipt, invoice, parsed_data, job_attempt)
+    return parsed_data
+
+async def parse_invoice_file(file_url: str, parser: Optional[str] = None) -> ParsedReceipt:
+    """Parse stored receipt image with the given (or default) parser backend"""
+    
+    # Hash stored content so repeat uploads hit the parse cache
+    with stage("storage_read"):
+        content = await storage_service.read_file(file_url)
+    content_hash = hashlib.sha256(content).hexdigest()
+    
+    # Parse with AI
+    return await get_parser(parser).parse_receipt(file_url, content_hash=content_hash, image_bytes=content)
+
+def find_fuzzy_duplicate(db: Session, invoice: Invoice) -> Optional[uuid.UUID]:
+    """Earlier invoice of the same user with the same vendor, date and total.
+    
+    Catches the same receipt photographed twice, which the upload content
+    hash cannot. Differing invoice numbers rule a match out.
+    """
+    
+    if not invoice.vendor or invoice.invoice_date is None or invoice.total is None:
+        return None
+    
+    # Served by ix_invoices_user_invoice_date
+    query = select(Invoice.id).where(
+        Invoice.user_id == invoice.user_id,
+        Invoice.invoice_date == invoice.invoice_date,
+        Invoice.total == invoice.total,
+        func.lower(func.trim(Invoice.vendor)) == invoice.vendor.strip().lower(),
+        Invoice.id != invoice.id,
+        # Point at the original, not at another copy
+        Invoice.duplicate_of_id.is_(None),
+    )
+    if invoice.invoice_no:
+        query = query.where(or_(Invoice.invoice_no.is_(None), Invoice.invoice_no == invoice.invoice_no))
+    
+    return db.execute(query.order_by(Invoice.created_at, Invoice.id).limit(1)).scalar()
+
+def remove_invoice_expenses(db: Session, invoice_id: uuid.UUID):
+    """Delete an invoice's expenses and take them out of the monthly rollups; caller commits"""
+    
+    removed = db.execute(
+        delete(Expense).where(Expense.invoice_id == invoice_id)
+        .returning(Expense.user_id, Expense.date, Expense.category, Expense.amount)
+        .execution_options(synchronize_session=False)
+    ).all()
+    monthly_rollup_service.remove_expenses(db, removed)
+
+def save_parsed_receipt(db: Session, invoice: Invoice, parsed_data: ParsedReceipt,
+                        job_attempt: Optional[int] = None):
+    """Update invoice with parsed data and create its expenses.
+    
+    A re-parse replaces the expenses of the previous parse. With job_attempt,
+    the parse job row is locked first and JobLostError raised if another
+    worker has since reclaimed it, so a slow parse can't save twice.
+    """
+    
+    if job_attempt is not None:
+        job = db.execute(
+            select(ParseJob.status, ParseJob.attempts)
+            .where(ParseJob.invoice_id == invoice.id)
+            .with_for_update()
+        ).first()
+        if job is None or job.status != "running" or job.attempts != job_attempt:
+            raise JobLostError(f"Parse job of invoice {invoice.id} was reclaimed, discarding attempt {job_attempt}")
+    
+    # Only invoices saved before have expenses to replace
+    if invoice.raw_json is not None:
+        with stage("db_write"):
+            remove_invoice_expenses(db, invoice.id)
+    
+    # Update invoice with parsed data
+    invoice.vendor = parsed_data.vendor
+    invoice.invoice_no = parsed_data.invoice_no
+    invoice.invoice_date = datetime.strptime(parsed_data.invoice_date, "%Y-%m-%d").date()
+    invoice.currency = parsed_data.currency
+    # Rounded here so the stored columns, the rollups and the duplicate
+    # check all see the same cents
+    invoice.subtotal = money(parsed_data.subtotal)
+    invoice.tax = money(parsed_data.tax)
+    invoice.total = money(parsed_data.total)
+    invoice.raw_json = parsed_data.model_dump()
+    
+    invoice.duplicate_of_id = find_fuzzy_duplicate(db, invoice)
+    if invoice.duplicate_of_id is not None:
+        duplicate_receipts.inc("fuzzy")
+        if SKIP_DUPLICATE_EXPENSES:
+            db.commit()
+            return
+    
+    # Build expense rows as plain dicts; no ORM objects per line item
+    expense_row = {
+        "user_id": invoice.user_id,
+        "invoice_id": invoice.id,
+        "date": invoice.invoice_date,
+        "currency": parsed_data.currency,
+        "vendor": parsed_data.vendor,
+    }
+    if parsed_data.items:
+        # Create individual expenses for each item
+        expenses = [
+            {**expense_row, "category": item.category, "description": item.description,
+             "amount": money(item.line_total)}
+            for item in parsed_data.items
+        ]
+    else:
+        # Create single expense from total
+        with stage("categorization"):
+            category = categorization_service.categorize_expense(
+                vendor=parsed_data.vendor,
+                description=f"Purchase from {parsed_data.vendor}",
+                db=db
+            )
+        expenses = [{
+            **expense_row,
+            "category": category,
+            "description": f"Purchase from {parsed_data.vendor}",
+            "amount": invoice.total,
+        }]
+    
+    with stage("db_write"):
+        # One multi-row INSERT (executemany via insertmanyvalues) for all items
+        db.execute(insert(Expense), expenses)
+        
+        # Keep monthly report totals in step, in the same transaction
+        monthly_rollup_service.add_expenses(db, expenses)
+    
+    # The invoice UPDATE is flushed with the commit
+    with stage("db_commit"):
+        db.commit()
\ No newline at end of file
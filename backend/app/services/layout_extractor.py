@@ -0,0 +1,204 @@
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+# 1,20  1.20  1.234,56  -0,50
+AMOUNT = r"-?\d{1,3}(?:[.']?\d{3})*[.,]\d{2}"
+# Description, optional VAT rate column, amount, optional VAT code
+ITEM_LINE = re.compile(
+    rf"^(?P<description>.*[^\W\d_].*?)(?:\s+\d{{1,2}}(?:[.,]\d{{1,2}})?%)?\s+(?P<amount>{AMOUNT})(?:\s+[A-Z0-9]{{1,2}})?$"
+)
+QTY_LINE = re.compile(rf"^(?P<qty>\d{{1,3}})\s*[xX*]\s*(?P<unit_price>{AMOUNT})$")
+DATES = [
+    (re.compile(r"\b(\d{2})[/.-](\d{2})[/.-](\d{4})\b"), "%d %m %Y"),
+    (re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b"), "%Y %m %d"),
+    (re.compile(r"\b(\d{2})[/.-](\d{2})[/.-](\d{2})\b"), "%d %m %y"),
+]
+CURRENCIES = [
+    (re.compile(r"€|\bEUR\b|\bEURO\b", re.IGNORECASE), "EUR"),
+    (re.compile(r"\bLEK[EË]?\b|\bALL\b", re.IGNORECASE), "ALL"),
+]
+
+@dataclass
+class VendorLayout:
+    """How one chain prints its receipts"""
+    
+    vendor: str
+    # Matched against the first lines of the receipt
+    header: re.Pattern
+    total_labels: tuple = ("TOTALE COMPLESSIVO", "TOTALE", "TOTAL")
+    subtotal_labels: tuple = ("SUBTOTALE", "SUBTOTAL")
+    tax_labels: tuple = ("DI CUI IVA", "IVA", "TVSH")
+    # Item section starts after this line, if present
+    items_header: Optional[re.Pattern] = None
+    # Lines inside the item section that are neither items nor noise
+    skip: re.Pattern = re.compile(
+        r"\bP\.?\s?IVA\b|\bC\.F\.|\bTEL\b|^VIA\b|\bNIPT\b|\bCASSA\b|\bOPERATORE?\b|\bSCONTRINO\b|\bDOCUMENTO\b",
+        re.IGNORECASE
+    )
+    # "2 x 0,90" is printed above (True) or below (False) its item
+    qty_line_before: bool = True
+    invoice_no: re.Pattern = re.compile(r"(?:DOC(?:UMENTO)?|SCONTRINO|FATURA)\.?\s*N(?:R|O)?\.?\s*[:.]?\s*([\w/-]+)", re.IGNORECASE)
+    currency: str = "EUR"
+    header_lines: int = 5
+
+LAYOUTS = [
+    VendorLayout(
+        vendor="Conad",
+        header=re.compile(r"\bCONAD\b", re.IGNORECASE),
+        items_header=re.compile(r"^DESCRIZIONE\b", re.IGNORECASE),
+    ),
+    VendorLayout(
+        vendor="Lidl",
+        header=re.compile(r"\bLIDL\b", re.IGNORECASE),
+        total_labels=("TOTALE", "TOTAL", "SUMME"),
+        qty_line_before=False,
+    ),
+    VendorLayout(
+        vendor="Carrefour",
+        header=re.compile(r"\bCARREFOUR\b", re.IGNORECASE),
+        items_header=re.compile(r"^DESCRIZIONE\b", re.IGNORECASE),
+    ),
+]
+
+@dataclass
+class LayoutExtraction:
+    """Receipt fields read deterministically from OCR text, with a confidence in [0, 1]"""
+    
+    vendor: str
+    data: dict
+    confidence: float
+    unparsed_lines: list[str] = field(default_factory=list)
+
+def parse_amount(text: str) -> float:
+    """1.234,56 / 1,234.56 / -0,50 -> float; AMOUNT always has two decimals"""
+    return int(re.sub(r"[.,']", "", text)) / 100
+
+def find_date(text: str) -> Optional[str]:
+    for pattern, layout in DATES:
+        for match in pattern.finditer(text):
+            try:
+                return datetime.strptime(" ".join(match.groups()), layout).strftime("%Y-%m-%d")
+            except ValueError:
+                continue
+    return None
+
+def find_currency(text: str, default: str) -> str:
+    for pattern, currency in CURRENCIES:
+        if pattern.search(text):
+            return currency
+    return default
+
+def find_layout(lines: list[str]) -> Optional[VendorLayout]:
+    for layout in LAYOUTS:
+        if any(layout.header.search(line) for line in lines[:layout.header_lines]):
+            return layout
+    return None
+
+def _labelled_amount(line: str, labels: tuple) -> Optional[float]:
+    """Amount on a line starting with one of the labels (longest label first)"""
+    
+    upper = line.upper()
+    for label in sorted(labels, key=len, reverse=True):
+        if upper.startswith(label):
+            amounts = re.findall(AMOUNT, line[len(label):])
+            return parse_amount(amounts[-1]) if amounts else None
+    return None
+
+def extract_layout(text: str) -> Optional[LayoutExtraction]:
+    """Read a receipt of a known chain from normalized OCR text; None for unknown layouts"""
+    
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    layout = find_layout(lines)
+    if layout is None:
+        return None
+    
+    # Item section: after the column header (or the shop header), up to the first total
+    start = 1
+    if layout.items_header is not None:
+        for index, line in enumerate(lines):
+            if layout.items_header.search(line):
+                start = index + 1
+                break
+    
+    items = []
+    unparsed = []
+    subtotal = total = tax = None
+    pending_qty = None
+    for line in lines[start:]:
+        if total is None:
+            amount = _labelled_amount(line, layout.subtotal_labels)
+            if amount is not None:
+                subtotal = amount
+                continue
+            amount = _labelled_amount(line, layout.total_labels)
+            if amount is not None:
+                total = amount
+                continue
+        else:
+            # Tax and payment lines follow the total
+            if tax is None:
+                tax = _labelled_amount(line, layout.tax_labels)
+            continue
+        
+        qty_match = QTY_LINE.match(line)
+        if qty_match:
+            qty = (int(qty_match["qty"]), parse_amount(qty_match["unit_price"]))
+            if layout.qty_line_before:
+                pending_qty = qty
+            elif items:
+                items[-1]["qty"], items[-1]["unit_price"] = qty
+            continue
+        
+        item_match = ITEM_LINE.match(line)
+        if item_match:
+            line_total = parse_amount(item_match["amount"])
+            qty, unit_price = pending_qty or (1, line_total)
+            pending_qty = None
+            items.append({
+                "description": item_match["description"].strip(),
+                "qty": qty,
+                "unit_price": unit_price,
+                "line_total": line_total,
+                "category": "auto",
+            })
+        elif not layout.skip.search(line):
+            unparsed.append(line)
+    
+    invoice_no = None
+    for line in lines:
+        match = layout.invoice_no.search(line)
+        if match:
+            invoice_no = match.group(1)
+            break
+    
+    invoice_date = find_date(text)
+    data = {
+        "vendor": layout.vendor,
+        "invoice_no": invoice_no,
+        "invoice_date": invoice_date,
+        "currency": find_currency(text, layout.currency),
+        "items": items,
+        "subtotal": subtotal if subtotal is not None else total,
+        "tax": tax or 0.0,
+        "total": total,
+        "guessed_categories": True,
+    }
+    
+    # Vendor is known; the rest must be found, and item lines must read
+    # cleanly (squared, so one unreadable line on a short receipt escalates)
+    parsed_fraction = len(items) / (len(items) + len(unparsed)) if items else 0.0
+    confidence = 0.2 + 0.2 * (invoice_date is not None) + 0.3 * (total is not None) + 0.3 * parsed_fraction ** 2
+    
+    return LayoutExtraction(vendor=layout.vendor, data=data, confidence=round(confidence, 3), unparsed_lines=unparsed)
+
+def totals_match(data: dict, tolerance: float = 0.01) -> bool:
+    """Line totals add up to the subtotal (or total when there is none)"""
+    
+    expected = data.get("subtotal")
+    if expected is None:
+        expected = data.get("total")
+    if expected is None or not data.get("items"):
+        return False
+    return abs(sum(item["line_total"] for item in data["items"]) - expected) <= tolerance + 1e-9
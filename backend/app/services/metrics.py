@@ -0,0 +1,235 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+
+# Seconds; covers storage writes (ms) up to slow model calls (tens of seconds)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter, one value per label combination"""
+    
+    kind = "counter"
+    
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+    
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+    
+    def samples(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+    
+    def __init__(self, histogram: "Histogram", labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+class Histogram:
+    """Bucketed histogram; observe() is one bisect and three additions"""
+    
+    kind = "histogram"
+    
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last is +Inf), sum, count]
+        self._series: dict[tuple, list] = {}
+    
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+    
+    def time(self, *labels) -> _Timer:
+        """Context manager observing the duration of its block"""
+        return _Timer(self, labels)
+    
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+    
+    def samples(self) -> Iterable[str]:
+        for labels, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}"
+
+class CallbackMetric:
+    """Gauge or counter whose values are read from a callback at scrape time"""
+    
+    def __init__(self, name: str, help: str, labelnames: tuple, collect: Callable[[], dict], kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self.kind = kind
+    
+    def samples(self) -> Iterable[str]:
+        for labels, value in self.collect().items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+class MetricsRegistry:
+    """In-process metrics rendered in the Prometheus text format.
+    
+    Values are per process; with several uvicorn workers, scrape each one
+    (or run one worker per container).
+    """
+    
+    def __init__(self):
+        self._metrics: dict[str, object] = {}
+    
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+    
+    def histogram(self, name: str, help: str, labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+    
+    def callback(self, name: str, help: str, labelnames: tuple, collect: Callable[[], dict],
+                 kind: str = "gauge") -> CallbackMetric:
+        """Metric computed at scrape time from collect() -> {label values: value}"""
+        return self._register(CallbackMetric(name, help, labelnames, collect, kind))
+    
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+# Receipt pipeline stages: storage_write, image_preprocess, storage_read, ocr,
+# layout_extract, model_call, json_decode, categorization, validation,
+# db_write, db_commit
+stage_seconds = registry.histogram(
+    "receipt_stage_seconds", "Time spent in each stage of the upload and parse path", ("stage",)
+)
+model_tokens = registry.counter(
+    "openai_tokens_total", "Model tokens used by receipt parses", ("model", "kind")
+)
+model_requests = registry.counter(
+    "openai_requests_total", "Model calls by outcome", ("model", "outcome")
+)
+model_hedges = registry.counter(
+    "openai_hedges_total", "Hedged model calls: sent, and won by the hedge", ("outcome",)
+)
+rate_limit_wait_seconds = registry.histogram(
+    "openai_rate_limit_wait_seconds", "Time model calls waited for the client-side RPM/TPM limiter"
+)
+batch_sizes = registry.histogram(
+    "receipt_batch_size", "Receipts per batched model request (1 means parsed alone)",
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16)
+)
+batch_receipts = registry.counter(
+    "receipt_batch_results_total", "Receipts sent in a batch: ok, invalid or fallback (parsed alone after)", ("outcome",)
+)
+parse_tiers = registry.counter(
+    "receipt_parse_tier_total", "Tiered parses by the tier that produced them: layout (no model call) or model", ("tier",)
+)
+layout_escalations = registry.counter(
+    "receipt_layout_escalations_total", "Tiered parses sent on to the model, by reason", ("reason",)
+)
+layout_confidence = registry.histogram(
+    "receipt_layout_confidence", "Confidence of layout extractions of known chains", ("vendor",),
+    buckets=(0.2, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0)
+)
+duplicate_receipts = registry.counter(
+    "receipt_duplicates_total", "Duplicate receipts: exact re-uploads and fuzzy matches after parsing", ("kind",)
+)
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "Request latency by route template", ("method", "route", "status")
+)
+
+def stage(name: str) -> _Timer:
+    """Time a pipeline stage: `with stage("model_call"): ...`"""
+    return stage_seconds.time(name)
+
+def record_usage(model: str, usage: Optional[object]):
+    """Count prompt/completion tokens from an OpenAI response's usage"""
+    if usage is None:
+        return
+    model_tokens.inc(model, "prompt", amount=usage.prompt_tokens or 0)
+    model_tokens.inc(model, "completion", amount=usage.completion_tokens or 0)
+
+class RouteLatencyMiddleware:
+    """ASGI middleware observing request latency per route template.
+    
+    Labels use the matched route's path (/invoices/{invoice_id}), not the raw
+    URL, so series stay bounded; unmatched paths share one "other" label.
+    The timer stops once the response body is fully sent, so streamed
+    responses count their whole transfer.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status = 500
+        
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # FastAPI records the matched route in the (shared) scope
+            route = scope.get("route")
+            http_request_seconds.observe(
+                time.perf_counter() - started,
+                scope["method"], getattr(route, "path", "other"), status
+            )
@@ -0,0 +1,95 @@
+import os
+import io
+import re
+import asyncio
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+from PIL import Image, ImageOps
+
+from app.services.image_processing import pypdfium2, _rasterize_pdf
+from app.services.metrics import stage
+
+try:
+    import pytesseract
+except ImportError:  # the OCR parser backend is optional
+    pytesseract = None
+
+# Lines with no letters or digits: separators, borders, OCR specks
+NOISE_LINE = re.compile(r"^[^\w]*$")
+SPACES = re.compile(r"[ \t]+")
+
+@dataclass
+class OCROptions:
+    language: str
+    psm: int
+    pdf_max_pages: int
+
+def ocr_image_bytes(data: bytes, options: OCROptions) -> str:
+    """Run Tesseract on an image or PDF.
+    
+    Runs in a worker process, so it must stay a picklable top-level function.
+    """
+    
+    if data[:5] == b"%PDF-":
+        if pypdfium2 is None:
+            raise ValueError("OCR of PDF receipts needs pypdfium2")
+        image = _rasterize_pdf(data, options.pdf_max_pages)
+    else:
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    
+    return pytesseract.image_to_string(image.convert("L"), lang=options.language, config=f"--psm {options.psm}")
+
+def normalize_text(text: str, max_chars: int) -> str:
+    """Compact OCR output for the model: one trimmed line per receipt line, noise dropped"""
+    
+    text = unicodedata.normalize("NFKC", text)
+    lines = []
+    for line in text.splitlines():
+        line = SPACES.sub(" ", line).strip()
+        if line and not NOISE_LINE.match(line):
+            lines.append(line)
+    return "\n".join(lines)[:max_chars]
+
+class OCRService:
+    """Extracts receipt text locally with Tesseract in a process pool"""
+    
+    def __init__(self):
+        self.workers = int(os.getenv("OCR_WORKERS", "2"))
+        self.options = OCROptions(
+            language=os.getenv("OCR_LANGUAGE", "eng"),
+            # 4: a single column of text of variable sizes, the usual receipt
+            psm=int(os.getenv("OCR_PSM", "4")),
+            pdf_max_pages=int(os.getenv("PDF_MAX_PAGES", "2")),
+        )
+        # Caps prompt size for very long receipts
+        self.max_chars = int(os.getenv("OCR_MAX_CHARS", "6000"))
+        self._executor: Optional[ProcessPoolExecutor] = None
+    
+    @property
+    def available(self) -> bool:
+        return pytesseract is not None
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+    
+    async def extract_text(self, data: bytes) -> str:
+        """Normalized text of a receipt image"""
+        
+        if not self.available:
+            raise RuntimeError("OCR needs pytesseract and the tesseract binary installed")
+        
+        loop = asyncio.get_running_loop()
+        with stage("ocr"):
+            text = await loop.run_in_executor(self._get_executor(), ocr_image_bytes, data, self.options)
+        return normalize_text(text, self.max_chars)
+    
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+ocr_service = OCRService()
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+from typing import Optional
+import aiofiles
+
+class ParseCacheService:
+    """Disk-backed cache of model parse results keyed by image content"""
+    
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir or os.getenv("PARSE_CACHE_DIR", "cache/parse")
+        self.enabled = os.getenv("PARSE_CACHE_ENABLED", "true").lower() == "true"
+        self.ttl_seconds = int(os.getenv("PARSE_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+        self.max_bytes = int(os.getenv("PARSE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+        
+        # Counters for /admin/stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+        self.saved_tokens = 0
+        
+        # Approximate size of the cache directory, refreshed on eviction
+        self._size_bytes: Optional[int] = None
+        self._evicting = False
+    
+    @staticmethod
+    def make_key(content_hash: str, model: str, prompt_version: str) -> str:
+        """Build cache key from image hash, model name and prompt version"""
+        return hashlib.sha256(f"{content_hash}:{model}:{prompt_version}".encode()).hexdigest()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+    
+    async def get(self, key: str) -> Optional[dict]:
+        """Return cached raw model output or None"""
+        
+        if not self.enabled:
+            return None
+        
+        path = self._path(key)
+        try:
+            async with aiofiles.open(path, 'r') as f:
+                entry = json.loads(await f.read())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        
+        # Expired entries count as misses and are removed lazily
+        if time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            self._remove(path)
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        self.saved_seconds += entry.get("model_seconds", 0.0)
+        self.saved_tokens += entry.get("tokens", 0)
+        return entry["data"]
+    
+    async def set(self, key: str, data: dict, model_seconds: float = 0.0, tokens: int = 0):
+        """Store raw model output for the given key"""
+        
+        if not self.enabled:
+            return
+        
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+        payload = json.dumps({
+            "data": data,
+            "created_at": time.time(),
+            "model_seconds": model_seconds,
+            "tokens": tokens,
+        })
+        
+        # Write to a temp file unique to this writer first, so readers never
+        # see partial entries and concurrent writers of a key don't collide
+        tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        try:
+            async with aiofiles.open(tmp_path, 'w') as f:
+                await f.write(payload)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        
+        if self._size_bytes is not None:
+            self._size_bytes += len(payload)
+        if (self._size_bytes is None or self._size_bytes > self.max_bytes) and not self._evicting:
+            # Directory scan; keep it off the event loop
+            self._evicting = True
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.evict)
+            finally:
+                self._evicting = False
+    
+    def evict(self):
+        """Drop expired entries, then oldest entries until under max_bytes"""
+        
+        entries = []
+        now = time.time()
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue  # being written
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if now - stat.st_mtime > self.ttl_seconds:
+                    self._remove(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        
+        total = sum(size for _, size, _ in entries)
+        
+        # Evict down to 90% so we don't rescan on every write
+        target = int(self.max_bytes * 0.9)
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                self._remove(path)
+                total -= size
+        
+        self._size_bytes = total
+    
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+            self.evictions += 1
+        except FileNotFoundError:
+            pass
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size_bytes": self._size_bytes,
+            "saved_model_seconds": round(self.saved_seconds, 3),
+            "saved_tokens": self.saved_tokens,
+        }
+
+parse_cache_service = ParseCacheService()
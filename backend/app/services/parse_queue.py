@@ -0,0 +1,211 @@
+import os
+import asyncio
+import logging
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import or_, and_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import AsyncSessionLocal
+from app.models import Invoice, ParseJob
+from app.schemas import ParsedReceipt
+from app.services.invoice_processing import process_invoice, JobLostError
+
+logger = logging.getLogger(__name__)
+
+class ParseQueueService:
+    """DB-backed parse job queue with in-process worker tasks"""
+    
+    def __init__(self):
+        self.workers = int(os.getenv("PARSE_WORKERS", "2"))
+        self.max_attempts = int(os.getenv("PARSE_MAX_ATTEMPTS", "3"))
+        self.poll_interval = float(os.getenv("PARSE_POLL_INTERVAL_SECONDS", "1.0"))
+        self.backoff_base = float(os.getenv("PARSE_BACKOFF_BASE_SECONDS", "5"))
+        self.backoff_max = float(os.getenv("PARSE_BACKOFF_MAX_SECONDS", "300"))
+        # Running jobs without a heartbeat for this long are assumed orphaned
+        # by a dead worker; live workers refresh it every third of that
+        self.job_timeout = float(os.getenv("PARSE_JOB_TIMEOUT_SECONDS", "300"))
+        
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+    
+    async def enqueue(self, db: AsyncSession, invoice_id: uuid.UUID, parser: Optional[str] = None) -> ParseJob:
+        """Queue invoice for parsing with an optional parser backend; caller commits"""
+        
+        job = await self.get_job(db, invoice_id)
+        
+        if job is None:
+            job = ParseJob(invoice_id=invoice_id, max_attempts=self.max_attempts, parser=parser)
+            db.add(job)
+        elif job.status == "queued":
+            # Not picked up yet: the latest request decides the parser
+            job.parser = parser
+        elif job.status in ("done", "failed"):
+            job.parser = parser
+            # Re-parse requested
+            job.status = "queued"
+            job.attempts = 0
+            job.last_error = None
+            job.run_after = datetime.utcnow()
+            job.started_at = None
+            job.heartbeat_at = None
+            job.finished_at = None
+        
+        return job
+    
+    def notify(self):
+        """Wake idle workers in this process after a commit"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+    
+    async def get_job(self, db: AsyncSession, invoice_id: uuid.UUID) -> Optional[ParseJob]:
+        return await db.scalar(select(ParseJob).where(ParseJob.invoice_id == invoice_id))
+    
+    async def claim(self, db: AsyncSession) -> Optional[ParseJob]:
+        """Lock and mark the next due job as running"""
+        
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.job_timeout)
+        
+        job = await db.scalar(select(ParseJob).where(
+            or_(
+                and_(ParseJob.status == "queued", ParseJob.run_after <= now),
+                and_(ParseJob.status == "running", ParseJob.heartbeat_at < stale)
+            )
+        ).order_by(
+            ParseJob.run_after
+        ).limit(1).with_for_update(skip_locked=True))
+        
+        if job is None:
+            await db.rollback()
+            return None
+        
+        return await self._start(db, job)
+    
+    async def claim_invoice(self, db: AsyncSession, invoice_id: uuid.UUID) -> Optional[ParseJob]:
+        """Lock and mark one invoice's job as running if it is still queued"""
+        
+        job = await db.scalar(select(ParseJob).where(
+            ParseJob.invoice_id == invoice_id, ParseJob.status == "queued"
+        ).with_for_update(skip_locked=True))
+        
+        if job is None:
+            await db.rollback()
+            return None
+        
+        return await self._start(db, job)
+    
+    async def _start(self, db: AsyncSession, job: ParseJob) -> ParseJob:
+        now = datetime.utcnow()
+        job.status = "running"
+        job.attempts += 1
+        job.started_at = now
+        job.heartbeat_at = now
+        await db.commit()
+        return job
+    
+    async def heartbeat(self, job_id: uuid.UUID, attempt: int):
+        """Keep a running attempt from being reclaimed until cancelled"""
+        
+        while True:
+            await asyncio.sleep(self.job_timeout / 3)
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(ParseJob).where(
+                    ParseJob.id == job_id, ParseJob.status == "running", ParseJob.attempts == attempt
+                ).values(heartbeat_at=datetime.utcnow()))
+                await db.commit()
+    
+    def backoff_seconds(self, attempts: int) -> float:
+        """Exponential backoff with full jitter"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return random.uniform(delay / 2, delay)
+    
+    def mark_done(self, job: ParseJob):
+        job.status = "done"
+        job.last_error = None
+        job.finished_at = datetime.utcnow()
+    
+    def mark_failed(self, job: ParseJob, error: Exception):
+        """Schedule a retry with backoff, or fail once attempts run out"""
+        
+        job.last_error = str(error)
+        if job.attempts < job.max_attempts:
+            job.status = "queued"
+            job.run_after = datetime.utcnow() + timedelta(seconds=self.backoff_seconds(job.attempts))
+        else:
+            job.status = "failed"
+            job.finished_at = datetime.utcnow()
+        logger.warning("Parse job %s attempt %s failed: %s", job.id, job.attempts, error)
+    
+    async def run_job(self, db: AsyncSession, job: ParseJob) -> Optional[ParsedReceipt]:
+        """Parse the job's invoice and record the outcome; returns the receipt if saved"""
+        
+        heartbeat = asyncio.create_task(self.heartbeat(job.id, job.attempts))
+        try:
+            invoice = await db.get(Invoice, job.invoice_id)
+            if invoice is None:
+                raise ValueError("Invoice not found")
+            
+            parsed_data = await process_invoice(db, invoice, job.parser, job_attempt=job.attempts)
+            
+            self.mark_done(job)
+            await db.commit()
+            return parsed_data
+        
+        except JobLostError as e:
+            # Another worker owns the job now and records its outcome
+            await db.rollback()
+            await db.refresh(job)
+            logger.warning("%s", e)
+        
+        except Exception as e:
+            await db.rollback()
+            # Rollback expires the job; reload it before recording the failure
+            await db.refresh(job)
+            self.mark_failed(job, e)
+            await db.commit()
+        
+        finally:
+            heartbeat.cancel()
+        return None
+    
+    async def worker(self, worker_id: int):
+        """Claim and run jobs until cancelled"""
+        
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    job = await self.claim(db)
+                    if job is not None:
+                        await self.run_job(db, job)
+                        continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Parse worker %s crashed, retrying", worker_id)
+            
+            # Idle: wait for a local enqueue or the next poll
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+    
+    def start(self, workers: Optional[int] = None):
+        """Start worker tasks on the running event loop"""
+        
+        self._wakeup = asyncio.Event()
+        for worker_id in range(self.workers if workers is None else workers):
+            self._tasks.append(asyncio.create_task(self.worker(worker_id)))
+    
+    async def stop(self):
+        """Cancel worker tasks and wait for them to exit"""
+        
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+parse_queue_service = ParseQueueService()
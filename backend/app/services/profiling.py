@@ -0,0 +1,250 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+import aiofiles
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]+-[0-9a-f]{8}$")
+
+def _frame_label(frame) -> str:
+    return f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})"
+
+class _Recording:
+    __slots__ = ("task", "thread_id", "samples")
+    
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        # Thread running the task's event loop
+        self.thread_id = threading.get_ident()
+        self.samples: Counter = Counter()
+
+class StackSampler:
+    """Samples the stacks of in-flight request tasks from a background thread.
+    
+    A request's stack is its coroutine chain (the awaits it is suspended in)
+    plus, when it is the task running on the loop at that moment, the plain
+    function calls underneath, so CPU work and waits both show up. The thread
+    only wakes while at least one request is being recorded.
+    """
+    
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._recordings: dict[int, _Recording] = {}
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self, task: asyncio.Task) -> _Recording:
+        recording = _Recording(task)
+        self._recordings[id(recording)] = recording
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+        return recording
+    
+    def stop(self, recording: _Recording) -> Counter:
+        self._recordings.pop(id(recording), None)
+        return recording.samples
+    
+    def _run(self):
+        while True:
+            if not self._recordings:
+                self._wakeup.clear()
+                # Re-check so a start() between the check and clear() isn't missed
+                if not self._recordings:
+                    self._wakeup.wait()
+            time.sleep(self.interval_seconds)
+            
+            thread_frames = sys._current_frames()
+            for recording in list(self._recordings.values()):
+                stack = self.task_stack(recording.task, thread_frames.get(recording.thread_id))
+                if stack:
+                    recording.samples[stack] += 1
+    
+    @staticmethod
+    def task_stack(task: asyncio.Task, thread_frame=None) -> str:
+        """Folded stack (outermost first, ';'-separated) for a task"""
+        
+        labels = []
+        innermost = None
+        awaitable = task.get_coro()
+        while awaitable is not None:
+            frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+            if frame is None:
+                # Suspended on a future or other non-coroutine awaitable
+                labels.append(f"<await {type(awaitable).__name__}>")
+                break
+            labels.append(_frame_label(frame))
+            innermost = frame
+            awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+        
+        # The loop is currently running this task: add the calls beneath it
+        callees = []
+        frame = thread_frame
+        while frame is not None and frame is not innermost:
+            callees.append(_frame_label(frame))
+            frame = frame.f_back
+        if frame is not None and innermost is not None:
+            labels.extend(reversed(callees))
+        
+        return ";".join(labels)
+
+class ProfileStore:
+    """Bounded on-disk ring buffer of request profiles (one JSON file each)"""
+    
+    def __init__(self, profile_dir: Optional[str] = None, max_files: Optional[int] = None):
+        self.profile_dir = profile_dir or os.getenv("PROFILE_DIR", "profiles")
+        self.max_files = max_files or int(os.getenv("PROFILE_MAX_FILES", "200"))
+        self.saved = 0
+        self.evictions = 0
+    
+    def _path(self, profile_id: str) -> str:
+        return os.path.join(self.profile_dir, f"{profile_id}.json")
+    
+    def ids(self) -> list[str]:
+        """Stored profile ids, oldest first"""
+        try:
+            names = os.listdir(self.profile_dir)
+        except FileNotFoundError:
+            return []
+        ids = [name[:-5] for name in names if name.endswith(".json")]
+        return sorted(profile_id for profile_id in ids if PROFILE_ID_PATTERN.match(profile_id))
+    
+    async def save(self, profile: dict) -> str:
+        """Write a profile and drop the oldest ones beyond max_files"""
+        
+        profile_id = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        profile = {"id": profile_id, **profile}
+        
+        os.makedirs(self.profile_dir, exist_ok=True)
+        async with aiofiles.open(self._path(profile_id), "w") as f:
+            await f.write(json.dumps(profile))
+        self.saved += 1
+        
+        ids = self.ids()
+        for old_id in ids[:max(0, len(ids) - self.max_files)]:
+            try:
+                os.remove(self._path(old_id))
+                self.evictions += 1
+            except FileNotFoundError:
+                pass  # another worker evicted it first
+        
+        return profile_id
+    
+    def path(self, profile_id: str) -> Optional[str]:
+        """File for a profile id, or None if it is unknown or malformed"""
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = self._path(profile_id)
+        return path if os.path.exists(path) else None
+    
+    def load(self, profile_id: str) -> Optional[dict]:
+        path = self.path(profile_id)
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+    
+    def list(self) -> list[dict]:
+        """Profile summaries (without stacks), newest first"""
+        summaries = []
+        for profile_id in reversed(self.ids()):
+            profile = self.load(profile_id)
+            if profile is not None:
+                profile.pop("stacks", None)
+                summaries.append(profile)
+        return summaries
+
+class RequestProfiler:
+    """Decides which requests to profile and records them"""
+    
+    def __init__(self, store: Optional[ProfileStore] = None):
+        self.enabled = os.getenv("PROFILE_ENABLED", "false").lower() == "true"
+        # Fraction of requests kept regardless of latency
+        self.sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0.0"))
+        # Requests slower than this are always kept
+        self.slow_ms = float(os.getenv("PROFILE_SLOW_MS", "1000"))
+        self.interval_seconds = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+        self.store = store or ProfileStore()
+        self.sampler = StackSampler(self.interval_seconds)
+    
+    def keep_reason(self, duration_ms: float, sampled: bool) -> Optional[str]:
+        if duration_ms >= self.slow_ms:
+            return "slow"
+        if sampled:
+            return "sampled"
+        return None
+
+class ProfilingMiddleware:
+    """ASGI middleware storing stack samples of slow or randomly sampled requests.
+    
+    Only added to the app when PROFILE_ENABLED=true. Every request is sampled
+    while in flight (latency is only known at the end); samples of requests
+    that are neither slow nor picked by PROFILE_SAMPLE_RATE are dropped.
+    """
+    
+    def __init__(self, app, profiler: Optional["RequestProfiler"] = None):
+        self.app = app
+        self.profiler = profiler or request_profiler
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status = 500
+        
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        sampled = random.random() < self.profiler.sample_rate
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        recording = self.profiler.sampler.start(asyncio.current_task())
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            samples = self.profiler.sampler.stop(recording)
+            duration_ms = (time.perf_counter() - started) * 1000
+            reason = self.profiler.keep_reason(duration_ms, sampled)
+            if reason is not None:
+                await self.save(scope, reason, status, started_at, duration_ms, samples)
+    
+    async def save(self, scope, reason: str, status: int, started_at: datetime, duration_ms: float, samples: Counter):
+        route = scope.get("route")
+        try:
+            await self.profiler.store.save({
+                "reason": reason,
+                "method": scope["method"],
+                "route": getattr(route, "path", None),
+                "path": scope["path"],
+                "invoice_id": scope.get("path_params", {}).get("invoice_id"),
+                "status": status,
+                "started_at": started_at.isoformat(),
+                "duration_ms": round(duration_ms, 3),
+                "interval_ms": self.profiler.interval_seconds * 1000,
+                "sample_count": sum(samples.values()),
+                "stacks": dict(samples.most_common()),
+            })
+        except OSError:
+            # Profiling must never fail the request
+            logger.exception("Could not store request profile")
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,296 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import openai
+
+from app.services.metrics import model_requests, model_hedges, rate_limit_wait_seconds
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class CircuitOpenError(Exception):
+    """The model provider is failing; calls are refused until the breaker resets"""
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `capacity`; rate 0 means unlimited"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self, amount: float = 1) -> float:
+        """Take `amount` tokens, waiting for them if needed; returns seconds waited"""
+        
+        if not self.rate:
+            return 0.0
+        
+        # More than a full bucket would never fit; wait for a full one instead
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        # One waiter at a time keeps callers in FIFO order
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                delay = (amount - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self.tokens -= amount
+        return waited
+    
+    def try_acquire(self, amount: float = 1) -> bool:
+        """Take `amount` tokens only if they are available now"""
+        
+        if not self.rate:
+            return True
+        self._refill()
+        if self._lock.locked() or self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+    
+    def refund(self, amount: float):
+        """Give back (or, if negative, charge) tokens once the real cost is known"""
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive provider failures.
+    
+    While open, calls fail fast with CircuitOpenError. After `reset_seconds`
+    one probe call is let through (half-open); its outcome closes the breaker
+    or opens it for another `reset_seconds`.
+    """
+    
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+    
+    def check(self) -> bool:
+        """Raise CircuitOpenError unless a call may go out now; True for the half-open probe"""
+        
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        retry_in = max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(f"Model provider unavailable, circuit open for another {retry_in:.0f}s")
+    
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+    
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._probing:
+                logger.warning("Model provider circuit opened after %s failures", self.failures)
+            self.opened_at = time.monotonic()
+            self._probing = False
+    
+    def abort_probe(self):
+        """The probe was cancelled before it got an answer; let another one through"""
+        self._probing = False
+
+def is_retryable(error: Exception) -> bool:
+    """Throttling, timeouts, connection errors and 5xx are worth another try"""
+    
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409) or error.status_code >= 500
+    return False
+
+def is_outage(error: Exception) -> bool:
+    """Failures that say the provider is unhealthy (429 means it is up but busy)"""
+    return is_retryable(error) and not isinstance(error, openai.RateLimitError)
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class ModelCallGuard:
+    """Rate limiting, retries, circuit breaking and hedging around model calls.
+    
+    Shared by all parsers in the process, since provider limits and outages
+    apply to the whole account. The OpenAI client's own retries must be off
+    (max_retries=0) so attempts are not multiplied.
+    """
+    
+    def __init__(self):
+        # Provider limits per minute, e.g. 500 RPM / 200k TPM; 0 disables
+        rpm = float(os.getenv("OPENAI_RPM", "500"))
+        tpm = float(os.getenv("OPENAI_TPM", "200000"))
+        # Burst up to a tenth of a minute's allowance
+        self.requests = TokenBucket(rpm / 60, max(1.0, rpm / 10))
+        self.tokens = TokenBucket(tpm / 60, max(1.0, tpm / 10))
+        # Charged up front per call, corrected from the response usage
+        self.estimated_tokens = float(os.getenv("OPENAI_ESTIMATED_TOKENS", "1500"))
+        
+        self.max_attempts = int(os.getenv("OPENAI_MAX_ATTEMPTS", "4"))
+        self.retry_base = float(os.getenv("OPENAI_RETRY_BASE_SECONDS", "0.5"))
+        self.retry_max = float(os.getenv("OPENAI_RETRY_MAX_SECONDS", "20"))
+        
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+            reset_seconds=float(os.getenv("CIRCUIT_RESET_SECONDS", "30")),
+        )
+        
+        # Send a second copy of a call still running after this latency percentile
+        self.hedge_enabled = os.getenv("OPENAI_HEDGE_ENABLED", "false").lower() == "true"
+        self.hedge_percentile = float(os.getenv("OPENAI_HEDGE_PERCENTILE", "95"))
+        self.hedge_min_samples = int(os.getenv("OPENAI_HEDGE_MIN_SAMPLES", "20"))
+        self._latencies: deque = deque(maxlen=int(os.getenv("OPENAI_HEDGE_WINDOW", "200")))
+    
+    def retry_delay(self, attempt: int, error: Exception) -> float:
+        """Jittered exponential backoff, at least the provider's Retry-After"""
+        
+        delay = random.uniform(0, min(self.retry_max, self.retry_base * (2 ** (attempt - 1))))
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.retry_max))
+        return delay
+    
+    def hedge_delay(self) -> Optional[float]:
+        """Latency after which a call is hedged, once enough calls were seen"""
+        
+        if not self.hedge_enabled or len(self._latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))]
+    
+    def _charge_usage(self, response):
+        """Correct the up-front token charge and the running estimate"""
+        
+        usage = getattr(response, "usage", None)
+        if usage is None or not usage.total_tokens:
+            return
+        self.tokens.refund(self.estimated_tokens - usage.total_tokens)
+        self.estimated_tokens = 0.9 * self.estimated_tokens + 0.1 * usage.total_tokens
+    
+    async def _single(self, call: Callable[[], Awaitable[T]], label: str) -> T:
+        """One request: outcome metrics, breaker bookkeeping, latency sample"""
+        
+        started = time.perf_counter()
+        try:
+            response = await call()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            model_requests.inc(label, "error")
+            if is_outage(e):
+                self.breaker.record_failure()
+            else:
+                # The provider answered (e.g. 429 or 400), so it is up
+                self.breaker.record_success()
+            raise
+        
+        model_requests.inc(label, "ok")
+        self.breaker.record_success()
+        self._latencies.append(time.perf_counter() - started)
+        self._charge_usage(response)
+        return response
+    
+    async def _attempt(self, call: Callable[[], Awaitable[T]], label: str) -> T:
+        """A rate-limited request, hedged with a second one if it runs long"""
+        
+        waited = await self.requests.acquire()
+        waited += await self.tokens.acquire(self.estimated_tokens)
+        rate_limit_wait_seconds.observe(waited)
+        
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._single(call, label)
+        
+        primary = asyncio.create_task(self._single(call, label))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        
+        # Only hedge with spare rate limit; never queue behind other callers
+        if not (self.requests.try_acquire() and self.tokens.try_acquire(self.estimated_tokens)):
+            return await primary
+        
+        model_hedges.inc("sent")
+        hedge = asyncio.create_task(self._single(call, label))
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            model_hedges.inc("won")
+                        return task.result()
+            # Both copies failed
+            return primary.result()
+        finally:
+            for task in (primary, hedge):
+                task.cancel()
+    
+    def stats(self) -> dict:
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "estimated_tokens": round(self.estimated_tokens),
+            "hedge_after_ms": None if self.hedge_delay() is None else round(self.hedge_delay() * 1000, 1),
+        }
+    
+    async def call(self, call: Callable[[], Awaitable[T]], label: str) -> T:
+        """Run `call` (one provider request) with retries; raises its last error"""
+        
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                probe = self.breaker.check()
+            except CircuitOpenError:
+                model_requests.inc(label, "circuit_open")
+                raise
+            
+            try:
+                return await self._attempt(call, label)
+            except asyncio.CancelledError:
+                if probe:
+                    self.breaker.abort_probe()
+                raise
+            except Exception as e:
+                if attempt == self.max_attempts or not is_retryable(e):
+                    raise
+                delay = self.retry_delay(attempt, e)
+                model_requests.inc(label, "retry")
+                logger.info("Model call attempt %s failed (%s), retrying in %.2fs", attempt, e, delay)
+                await asyncio.sleep(delay)
+
+model_call_guard = ModelCallGuard()
@@ -0,0 +1,165 @@
+import uuid
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Iterable, Optional
+from sqlalchemy import delete, func, insert, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.database import dialect_insert
+from app.models import Expense, MonthlyCategoryTotal
+
+def month_key(day: date) -> str:
+    return day.strftime("%Y-%m")
+
+def money(value) -> Decimal:
+    # Half away from zero, as Postgres rounds into numeric(12,2) columns
+    return Decimal(str(value or 0)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+def month_expr(db: Session, column):
+    """SQL expression formatting a date column as YYYY-MM"""
+    if db.get_bind().dialect.name == "sqlite":
+        return func.strftime("%Y-%m", column)
+    return func.to_char(column, "YYYY-MM")
+
+class MonthlyRollupService:
+    """Incrementally maintained per-user monthly totals by category.
+    
+    Every change to expenses applies a delta to monthly_category_totals in the
+    caller's transaction, so /reports/monthly reads a handful of rows instead
+    of aggregating the user's whole history.
+    """
+    
+    def apply(self, db: Session, deltas: dict):
+        """Add {(user_id, month, category): (amount, count)} deltas; caller commits"""
+        
+        # Fixed key order keeps concurrent transactions from deadlocking on row locks
+        rows = [
+            {"user_id": user_id, "month": month, "category": category, "total": amount, "expense_count": count}
+            for (user_id, month, category), (amount, count) in sorted(deltas.items(), key=str)
+            if amount or count
+        ]
+        if not rows:
+            return
+        
+        # One multi-row upsert, so concurrent writers add up instead of overwriting
+        stmt = dialect_insert(db, MonthlyCategoryTotal).values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[
+                MonthlyCategoryTotal.user_id,
+                MonthlyCategoryTotal.month,
+                MonthlyCategoryTotal.category,
+            ],
+            set_={
+                "total": MonthlyCategoryTotal.total + stmt.excluded.total,
+                "expense_count": MonthlyCategoryTotal.expense_count + stmt.excluded.expense_count,
+            }
+        ))
+        
+        emptied = [row for row in rows if row["expense_count"] < 0]
+        if emptied:
+            db.execute(delete(MonthlyCategoryTotal).where(
+                tuple_(
+                    MonthlyCategoryTotal.user_id, MonthlyCategoryTotal.month, MonthlyCategoryTotal.category
+                ).in_([(row["user_id"], row["month"], row["category"]) for row in emptied]),
+                MonthlyCategoryTotal.expense_count <= 0,
+            ))
+    
+    def _add(self, deltas: dict, user_id: uuid.UUID, day: date, category: str, amount, sign: int):
+        key = (user_id, month_key(day), category)
+        total, count = deltas.get(key, (Decimal(0), 0))
+        deltas[key] = (total + sign * money(amount), count + sign)
+    
+    def add_expenses(self, db: Session, expenses: Iterable[dict]):
+        """Count newly inserted expense rows (dicts as passed to insert(Expense))"""
+        
+        deltas = {}
+        for expense in expenses:
+            self._add(deltas, expense["user_id"], expense["date"], expense["category"], expense["amount"], 1)
+        self.apply(db, deltas)
+    
+    def remove_expense(self, db: Session, expense: Expense):
+        """Uncount an expense that is being deleted"""
+        self.remove_expenses(db, [expense])
+    
+    def remove_expenses(self, db: Session, expenses: Iterable):
+        """Uncount deleted expenses (Expense objects or rows with the same columns)"""
+        
+        deltas = {}
+        for expense in expenses:
+            self._add(deltas, expense.user_id, expense.date, expense.category, expense.amount, -1)
+        self.apply(db, deltas)
+    
+    def update_expense(self, db: Session, expense: Expense, old_date: date, old_category: str, old_amount):
+        """Move an edited expense from its old totals to its new ones"""
+        
+        deltas = {}
+        self._add(deltas, expense.user_id, old_date, old_category, old_amount, -1)
+        self._add(deltas, expense.user_id, expense.date, expense.category, expense.amount, 1)
+        self.apply(db, deltas)
+    
+    def monthly_totals_query(self, user_id: uuid.UUID):
+        # Primary key order, so this is a single index range scan
+        return select(MonthlyCategoryTotal).where(
+            MonthlyCategoryTotal.user_id == user_id
+        ).order_by(MonthlyCategoryTotal.month, MonthlyCategoryTotal.category)
+    
+    def get_monthly_totals(self, db: Session, user_id: uuid.UUID) -> list[MonthlyCategoryTotal]:
+        return db.execute(self.monthly_totals_query(user_id)).scalars().all()
+    
+    def _raw_totals(self, db: Session, user_id: Optional[uuid.UUID] = None):
+        month = month_expr(db, Expense.date)
+        query = select(
+            Expense.user_id, month.label("month"), Expense.category,
+            func.sum(Expense.amount), func.count()
+        ).group_by(Expense.user_id, month, Expense.category)
+        if user_id is not None:
+            query = query.where(Expense.user_id == user_id)
+        return query
+    
+    def rebuild(self, db: Session, user_id: Optional[uuid.UUID] = None) -> int:
+        """Recompute totals from the expenses table; returns rows written, caller commits"""
+        
+        clear = delete(MonthlyCategoryTotal)
+        if user_id is not None:
+            clear = clear.where(MonthlyCategoryTotal.user_id == user_id)
+        db.execute(clear)
+        
+        result = db.execute(insert(MonthlyCategoryTotal).from_select(
+            ["user_id", "month", "category", "total", "expense_count"],
+            self._raw_totals(db, user_id)
+        ))
+        return result.rowcount
+    
+    def check(self, db: Session, user_id: Optional[uuid.UUID] = None) -> list[dict]:
+        """Compare totals with the expenses table; returns mismatching rows"""
+        
+        expected = defaultdict(lambda: (Decimal(0), 0))
+        for row_user, month, category, total, count in db.execute(self._raw_totals(db, user_id)):
+            expected[(row_user, month, category)] = (money(total), count)
+        
+        query = select(
+            MonthlyCategoryTotal.user_id, MonthlyCategoryTotal.month, MonthlyCategoryTotal.category,
+            MonthlyCategoryTotal.total, MonthlyCategoryTotal.expense_count
+        )
+        if user_id is not None:
+            query = query.where(MonthlyCategoryTotal.user_id == user_id)
+        actual = defaultdict(lambda: (Decimal(0), 0))
+        for row_user, month, category, total, count in db.execute(query):
+            actual[(row_user, month, category)] = (money(total), count)
+        
+        mismatches = []
+        for key in sorted(set(expected) | set(actual), key=str):
+            if expected[key] != actual[key]:
+                mismatches.append({
+                    "user_id": str(key[0]),
+                    "month": key[1],
+                    "category": key[2],
+                    "expected_total": str(expected[key][0]),
+                    "expected_count": expected[key][1],
+                    "actual_total": str(actual[key][0]),
+                    "actual_count": actual[key][1],
+                })
+        return mismatches
+
+monthly_rollup_service = MonthlyRollupService()
@@ -1,13 +1,108 @@
 import os
 import uuid
+import hashlib
 from abc import ABC, abstractmethod
-from typing import BinaryIO
+from dataclasses import dataclass
+from typing import Optional
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
 import aiofiles
 
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+# Whole request body: one upload plus room for the multipart framing
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(MAX_UPLOAD_BYTES + 1024 * 1024)))
+
+class UploadTooLargeError(ValueError):
+    pass
+
+class RequestSizeLimitMiddleware:
+    """ASGI middleware capping request body size before the form is parsed.
+    
+    Starlette spools a multipart body to temp files before a route can look
+    at file.size, so limits checked there come after the bytes are on disk.
+    This rejects a declared Content-Length over the limit without reading
+    the body, and stops chunked bodies as soon as they pass it. path_limits
+    overrides max_bytes for exact paths, e.g. the batch upload.
+    """
+    
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES, path_limits: Optional[dict[str, int]] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        max_bytes = self.path_limits.get(scope["path"], self.max_bytes)
+        detail = f"Request body exceeds {max_bytes} bytes"
+        
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+        
+        received = 0
+        
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    # Surfaces from request.form() as the route's response
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+        
+        await self.app(scope, receive_limited, send)
+
+@dataclass
+class StoredFile:
+    url: str
+    content_hash: str  # sha256 hex digest
+    size: int
+    created: bool = True  # False when identical content was already stored
+
+async def hash_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES,
+                      chunk_bytes: int = UPLOAD_CHUNK_BYTES) -> tuple[str, int]:
+    """sha256 and size of an upload, read from its spool file and rewound"""
+    
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLargeError(f"File exceeds {max_bytes} bytes")
+    
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := await file.read(chunk_bytes):
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLargeError(f"File exceeds {max_bytes} bytes")
+        digest.update(chunk)
+    await file.seek(0)
+    return digest.hexdigest(), size
+
+def content_filename(content_hash: str, extension: str) -> str:
+    """Content-addressed name: identical bytes always map to the same file"""
+    return f"{content_hash}{extension.lower()}"
+
 class StorageInterface(ABC):
+    """File storage keyed by content hash; saving stored content again is a no-op"""
+    
+    @abstractmethod
+    async def save_file(self, file: UploadFile, filename: str) -> StoredFile:
+        """Save file and return URL, content hash and size"""
+        pass
+    
     @abstractmethod
-    async def save_file(self, file: BinaryIO, filename: str) -> str:
-        """Save file and return URL"""
+    async def save_bytes(self, data: bytes, extension: str) -> StoredFile:
+        """Save in-memory content, e.g. a derived image, and return URL, hash and size"""
+        pass
+    
+    
+    @abstractmethod
+    async def read_file(self, url: str) -> bytes:
+        """Read file contents by URL"""
         pass
     
     @abstractmethod
@@ -16,24 +111,69 @@ class StorageInterface(ABC):
         pass
 
 class LocalStorageDriver(StorageInterface):
-    def __init__(self, upload_dir: str = "uploads"):
+    def __init__(self, upload_dir: str = "uploads", max_bytes: int = MAX_UPLOAD_BYTES,
+                 chunk_bytes: int = UPLOAD_CHUNK_BYTES):
         self.upload_dir = upload_dir
+        self.max_bytes = max_bytes
+        self.chunk_bytes = chunk_bytes
         os.makedirs(upload_dir, exist_ok=True)
     
-    async def save_file(self, file: BinaryIO, filename: str) -> str:
-        # Generate unique filename
-        file_ext = os.path.splitext(filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_ext}"
-        file_path = os.path.join(self.upload_dir, unique_filename)
+    async def save_file(self, file: UploadFile, filename: str) -> StoredFile:
+        # Reject before writing anything when the size is already known
+        if file.size is not None and file.size > self.max_bytes:
+            raise UploadTooLargeError(f"File exceeds {self.max_bytes} bytes")
+        
+        # Final name depends on the content, so stream to a unique temp file first
+        file_ext = os.path.splitext(filename or "")[1]
+        tmp_path = os.path.join(self.upload_dir, f"{uuid.uuid4()}.part")
+        
+        # Stream to a temp file in fixed-size chunks, hashing as we go
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                while chunk := await file.read(self.chunk_bytes):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise UploadTooLargeError(f"File exceeds {self.max_bytes} bytes")
+                    digest.update(chunk)
+                    await f.write(chunk)
+            
+            filename = content_filename(digest.hexdigest(), file_ext)
+            file_path = os.path.join(self.upload_dir, filename)
+            created = not os.path.exists(file_path)
+            if created:
+                # Atomic rename so readers never see a partial file
+                os.replace(tmp_path, file_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        
+        return StoredFile(url=self._url(filename), content_hash=digest.hexdigest(), size=size, created=created)
+    
+    async def save_bytes(self, data: bytes, extension: str) -> StoredFile:
+        content_hash = hashlib.sha256(data).hexdigest()
+        filename = content_filename(content_hash, extension)
+        file_path = os.path.join(self.upload_dir, filename)
         
-        # Save file
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        created = not os.path.exists(file_path)
+        if created:
+            tmp_path = os.path.join(self.upload_dir, f"{uuid.uuid4()}.part")
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                await f.write(data)
+            os.replace(tmp_path, file_path)
         
-        # Return URL
+        return StoredFile(url=self._url(filename), content_hash=content_hash, size=len(data), created=created)
+    
+    def _url(self, filename: str) -> str:
         base_url = os.getenv("BASE_URL", "http://localhost:8000")
-        return f"{base_url}/uploads/{unique_filename}"
+        return f"{base_url}/uploads/{filename}"
+    
+    async def read_file(self, url: str) -> bytes:
+        filename = url.split("/")[-1]
+        file_path = os.path.join(self.upload_dir, filename)
+        async with aiofiles.open(file_path, 'rb') as f:
+            return await f.read()
     
     async def delete_file(self, url: str) -> bool:
         try:
@@ -56,10 +196,18 @@ class S3StorageDriver(StorageInterface):
         self.endpoint = endpoint
         # TODO: Initialize boto3 client
     
-    async def save_file(self, file: BinaryIO, filename: str) -> str:
+    async def save_file(self, file: UploadFile, filename: str) -> StoredFile:
+        # TODO: Upload to S3/R2 under content_filename() and return public URL
+        raise NotImplementedError("S3 storage not implemented yet")
+    
+    async def save_bytes(self, data: bytes, extension: str) -> StoredFile:
         # TODO: Upload to S3/R2 and return public URL
         raise NotImplementedError("S3 storage not implemented yet")
     
+    async def read_file(self, url: str) -> bytes:
+        # TODO: Download from S3/R2
+        raise NotImplementedError("S3 storage not implemented yet")
+    
     async def delete_file(self, url: str) -> bool:
         # TODO: Delete from S3/R2
         raise NotImplementedError("S3 storage not implemented yet")
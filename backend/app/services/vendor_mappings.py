@@ -0,0 +1,174 @@
+import os
+import time
+import logging
+from datetime import datetime
+from collections import OrderedDict
+from typing import Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, dialect_insert
+from app.models import VendorCategoryMapping, VendorMappingVersion
+
+logger = logging.getLogger(__name__)
+
+def normalize_vendor(vendor: Optional[str]) -> str:
+    return (vendor or "").strip().lower()
+
+class VendorMappingStore:
+    """Learned vendor->category mappings in the database behind an in-process LRU.
+    
+    Every write bumps a version number. Each process polls for rows newer than
+    the last version it saw at most every VENDOR_MAPPING_CHECK_SECONDS and drops
+    just those vendors from its cache, so a correction made on one worker is
+    visible on all of them within that interval. Entries also expire after
+    VENDOR_MAPPING_TTL_SECONDS as a backstop.
+    """
+    
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self.cache_size = int(os.getenv("VENDOR_MAPPING_CACHE_SIZE", "10000"))
+        self.ttl_seconds = float(os.getenv("VENDOR_MAPPING_TTL_SECONDS", "300"))
+        self.check_interval = float(os.getenv("VENDOR_MAPPING_CHECK_SECONDS", "5"))
+        
+        # vendor -> (category or None for "no mapping", cached_at)
+        self._cache: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        
+        # Counters for /admin/stats
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+    
+    def _refresh(self, db: Session, now: float):
+        """Drop cached vendors that changed since the last version seen"""
+        
+        self._checked_at = now
+        
+        if self._version is None:
+            self._version = db.execute(
+                select(func.coalesce(func.max(VendorCategoryMapping.version), 0))
+            ).scalar_one()
+            return
+        
+        changed = db.execute(
+            select(VendorCategoryMapping.vendor, VendorCategoryMapping.version)
+            .where(VendorCategoryMapping.version > self._version)
+        ).all()
+        
+        for vendor, version in changed:
+            if self._cache.pop(vendor, None) is not None:
+                self.invalidations += 1
+            self._version = max(self._version, version)
+    
+    def _put(self, vendor: str, category: Optional[str], now: float):
+        self._cache[vendor] = (category, now)
+        self._cache.move_to_end(vendor)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+    
+    def get(self, vendor: Optional[str], db: Optional[Session] = None) -> Optional[str]:
+        """Return the learned category for a vendor, or None.
+        
+        With db, cache misses query through that session instead of a new one;
+        async callers pass the session from AsyncSession.run_sync so the lookup
+        doesn't block the event loop.
+        """
+        
+        key = normalize_vendor(vendor)
+        if not key:
+            return None
+        
+        now = time.monotonic()
+        refresh = now - self._checked_at >= self.check_interval
+        
+        entry = self._cache.get(key)
+        if not refresh and entry is not None and now - entry[1] < self.ttl_seconds:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        
+        try:
+            session = db if db is not None else self.session_factory()
+            try:
+                if refresh:
+                    self._refresh(session, now)
+                    entry = self._cache.get(key)
+                    if entry is not None and now - entry[1] < self.ttl_seconds:
+                        self._cache.move_to_end(key)
+                        self.hits += 1
+                        return entry[0]
+                
+                self.misses += 1
+                category = session.execute(
+                    select(VendorCategoryMapping.category).where(VendorCategoryMapping.vendor == key)
+                ).scalar_one_or_none()
+            finally:
+                if db is None:
+                    session.close()
+        except (SQLAlchemyError, OSError) as e:
+            # Fall back to rule-based categorization while the DB is unavailable
+            self.errors += 1
+            logger.warning("Vendor mapping lookup failed: %s", e)
+            return None
+        
+        # Vendors without a mapping are cached too, so rule-only vendors cost no query
+        self._put(key, category, now)
+        return category
+    
+    def set(self, db: Session, vendor: str, category: str):
+        """Upsert a mapping with a new version and commit the session"""
+        
+        key = normalize_vendor(vendor)
+        if not key:
+            raise ValueError("Vendor is required")
+        
+        # Versions come from a single counter row. The upsert keeps it locked
+        # until commit, so concurrent writers get distinct versions and commit
+        # in version order; a reader that saw version N has seen all below it
+        counter = dialect_insert(db, VendorMappingVersion).values(
+            id=1,
+            version=select(func.coalesce(func.max(VendorCategoryMapping.version), 0) + 1).scalar_subquery()
+        )
+        version = db.execute(counter.on_conflict_do_update(
+            index_elements=[VendorMappingVersion.id],
+            set_={"version": VendorMappingVersion.version + 1}
+        ).returning(VendorMappingVersion.version)).scalar_one()
+        
+        stmt = dialect_insert(db, VendorCategoryMapping).values(
+            vendor=key, category=category, version=version
+        )
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[VendorCategoryMapping.vendor],
+            set_={
+                "category": stmt.excluded.category,
+                "version": stmt.excluded.version,
+                "updated_at": datetime.utcnow(),
+            }
+        ))
+        db.commit()
+        
+        # Visible in this process immediately; others pick it up on their next check
+        self._put(key, category, time.monotonic())
+    
+    def clear(self):
+        self._cache.clear()
+        self._version = None
+        self._checked_at = 0.0
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "cached_vendors": len(self._cache),
+            "version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+        }
+
+vendor_mapping_store = VendorMappingStore()
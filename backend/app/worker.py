@@ -0,0 +1,31 @@
+"""
+Standalone parse worker process.
+
+    PARSE_WORKERS=8 python -m app.worker
+
+Run as many of these as needed; they share the parse_jobs table with the
+API processes and with each other.
+"""
+import asyncio
+import logging
+import signal
+
+from app.database import async_engine
+from app.services.ocr import ocr_service
+from app.services.parse_queue import parse_queue_service
+
+async def main():
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    parse_queue_service.start()
+    await stop.wait()
+    await parse_queue_service.stop()
+    ocr_service.shutdown()
+    await async_engine.dispose()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
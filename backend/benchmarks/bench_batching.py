@@ -0,0 +1,64 @@
+"""
+Bulk import throughput and tokens per receipt, with and without batching.
+
+    STUB_LATENCY_MS=1500 uvicorn benchmarks.stub_model_server:app --port 9000
+    OPENAI_API_BASE=http://localhost:9000/v1 OPENAI_API_KEY=stub \\
+        python -m benchmarks.bench_batching --receipts 64 --concurrency 8 --batch-sizes 1 2 4 8
+
+Parses the same image --receipts times with --concurrency parses in flight,
+like a batch import, once per batch size (1 means batching off). Images go
+inline and the parse cache is bypassed, so every receipt reaches the model.
+Set OPENAI_RPM low (e.g. 120) to see the request-bound case, where fewer
+requests per receipt means more receipts per second. Tokens come from the
+openai_tokens_total counter, i.e. the usage the stub reports: prompt text
+plus STUB_IMAGE_TOKENS per image, and the answer.
+"""
+import argparse
+import asyncio
+import time
+
+from app.services.ai_parser import AIParserService, ReceiptBatcher
+from app.services.metrics import model_tokens
+from app.services.resilience import ModelCallGuard
+
+def tokens_used(model: str) -> float:
+    return model_tokens.value(model, "prompt") + model_tokens.value(model, "completion")
+
+async def run(image: bytes, receipts: int, concurrency: int, batch_size: int) -> tuple[float, float]:
+    parser = AIParserService()
+    parser.image_mode = "inline"
+    # Fresh rate limiter per run: its lock belongs to this event loop
+    parser.guard = ModelCallGuard()
+    if batch_size > 1:
+        parser.batcher = ReceiptBatcher(parser, max_size=batch_size, max_wait=0.05)
+        parser.batch_max_image_bytes = len(image)
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def parse_one(index: int):
+        async with semaphore:
+            await parser.parse_receipt(f"receipt-{index}.jpg", image_bytes=image)
+    
+    tokens_before = tokens_used(parser.model)
+    started = time.perf_counter()
+    await asyncio.gather(*[parse_one(index) for index in range(receipts)])
+    elapsed = time.perf_counter() - started
+    return elapsed, (tokens_used(parser.model) - tokens_before) / receipts
+
+def main(image_path: str, receipts: int, concurrency: int, batch_sizes: list[int]):
+    with open(image_path, "rb") as f:
+        image = f.read()
+    print(f"{image_path} ({len(image)} bytes), {receipts} receipts, {concurrency} in flight")
+    
+    for batch_size in batch_sizes:
+        elapsed, tokens = asyncio.run(run(image, receipts, concurrency, batch_size))
+        label = "off" if batch_size == 1 else f"K={batch_size}"
+        print(f"batching {label:5s} {receipts / elapsed:7.2f} receipts/s {tokens:8.1f} tokens/receipt")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image", default="sample_data/sample_receipt.jpg")
+    parser.add_argument("--receipts", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    main(args.image, args.receipts, args.concurrency, args.batch_sizes)
@@ -0,0 +1,72 @@
+"""
+Categorization microbenchmark: compiled matcher vs the old linear scan.
+
+    python -m benchmarks.bench_categorization --rules 10000 --items 100000
+
+Generates synthetic merchant keyword rules and receipt line items, then
+reports compile time and per-item latency. The linear scan is measured on
+a sample since it is O(rules) per item.
+"""
+import argparse
+import random
+import time
+
+from app.services.categorization import CategorizationService
+
+def random_word(rng: random.Random, low: int, high: int) -> str:
+    return "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(low, high)))
+
+def main(rule_count: int, item_count: int, linear_sample: int, word_boundary: bool):
+    rng = random.Random(42)
+    categories = ["Ushqim", "Transport", "Teknologji", "Argëtim", "Shëndet", "Shtëpi"]
+
+    rules = {}
+    while len(rules) < rule_count:
+        rules[random_word(rng, 5, 12)] = rng.choice(categories)
+    keywords = list(rules)
+
+    # About a third of the items mention a known merchant
+    items = []
+    for _ in range(item_count):
+        words = [random_word(rng, 3, 9) for _ in range(rng.randint(2, 5))]
+        if rng.random() < 0.33:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(keywords))
+        items.append(" ".join(words))
+
+    service = CategorizationService()
+    service.word_boundary = word_boundary
+
+    started = time.perf_counter()
+    service.set_rules(rules)
+    compile_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for description in items:
+        service.categorize_expense(vendor="Conad", description=description)
+    compiled_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    service.categorize_many("Conad", items)
+    batch_seconds = time.perf_counter() - started
+
+    sample = items[:linear_sample]
+    started = time.perf_counter()
+    for description in sample:
+        text = f"conad {description}".lower()
+        next((category for keyword, category in rules.items() if keyword in text), "Tjetër")
+    linear_seconds = time.perf_counter() - started
+
+    print(f"{rule_count} rules, {item_count} items (word_boundary={word_boundary})")
+    print(f"compile:              {compile_seconds * 1000:10.1f} ms")
+    print(f"categorize_expense:   {compiled_seconds / item_count * 1e6:10.2f} us/item")
+    print(f"categorize_many:      {batch_seconds / item_count * 1e6:10.2f} us/item")
+    print(f"linear scan (n={len(sample)}): {linear_seconds / len(sample) * 1e6:10.2f} us/item")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, default=10000)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--linear-sample", type=int, default=1000)
+    parser.add_argument("--word-boundary", action="store_true")
+    args = parser.parse_args()
+    main(args.rules, args.items, args.linear_sample, args.word_boundary)
@@ -0,0 +1,105 @@
+"""
+Throughput of sync vs async DB sessions on a single worker, at a fixed p99.
+
+    BENCH_DB_LATENCY_MS=5 uvicorn benchmarks.bench_db_modes:app --port 8100
+    python -m benchmarks.bench_db_modes --base http://localhost:8100 --p99-ms 50
+
+The app serves the same expenses page two ways: /sync/expenses runs the
+query on a blocking Session inside an async handler (how the routers used
+to work), /async/expenses awaits it on an AsyncSession. BENCH_DB_LATENCY_MS
+adds a pg_sleep to each request to stand in for the network round trip to a
+remote database.
+
+For each mode the driver steps up the number of concurrent clients and
+prints requests/sec and p99 per step, then the best requests/sec whose p99
+stays under --p99-ms.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import text
+
+from app.database import AsyncSessionLocal, SessionLocal
+from app.routers.expenses import build_expenses_query
+from app.services.auth import auth_service
+
+DB_LATENCY_SECONDS = float(os.getenv("BENCH_DB_LATENCY_MS", "5")) / 1000
+PAGE_SIZE = 100
+
+app = FastAPI()
+
+@app.get("/sync/expenses")
+async def sync_expenses():
+    db = SessionLocal()
+    try:
+        if DB_LATENCY_SECONDS:
+            db.execute(text("SELECT pg_sleep(:seconds)"), {"seconds": DB_LATENCY_SECONDS})
+        query = build_expenses_query(auth_service.get_current_user_id()).limit(PAGE_SIZE)
+        return len(db.execute(query).scalars().all())
+    finally:
+        db.close()
+
+@app.get("/async/expenses")
+async def async_expenses():
+    async with AsyncSessionLocal() as db:
+        if DB_LATENCY_SECONDS:
+            await db.execute(text("SELECT pg_sleep(:seconds)"), {"seconds": DB_LATENCY_SECONDS})
+        query = build_expenses_query(auth_service.get_current_user_id()).limit(PAGE_SIZE)
+        return len((await db.execute(query)).scalars().all())
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def run_step(client: httpx.AsyncClient, path: str, clients: int, seconds: float) -> tuple[float, float]:
+    """Closed-loop load from `clients` concurrent callers; returns (req/s, p99 ms)"""
+    
+    samples = []
+    deadline = time.perf_counter() + seconds
+    
+    async def caller():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.get(path)
+            response.raise_for_status()
+            samples.append((time.perf_counter() - started) * 1000)
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(clients)))
+    return len(samples) / (time.perf_counter() - started), percentile(samples, 99)
+
+async def main(base: str, p99_ms: float, seconds: float, max_clients: int):
+    limits = httpx.Limits(max_connections=max_clients + 10)
+    async with httpx.AsyncClient(base_url=base, timeout=60, limits=limits) as client:
+        # Warm up both pools
+        for mode in ("sync", "async"):
+            await run_step(client, f"/{mode}/expenses", 4, 1)
+        
+        best = {}
+        for mode in ("sync", "async"):
+            print(f"{mode}:")
+            clients = 1
+            while clients <= max_clients:
+                rps, p99 = await run_step(client, f"/{mode}/expenses", clients, seconds)
+                print(f"  {clients:>4} clients  {rps:8.1f} req/s  p99 {p99:7.1f} ms")
+                if p99 <= p99_ms:
+                    best[mode] = max(best.get(mode, 0.0), rps)
+                clients *= 2
+    
+    print(f"\nbest req/s with p99 <= {p99_ms:.0f} ms")
+    for mode in ("sync", "async"):
+        print(f"  {mode:<6} {best.get(mode, 0.0):8.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base", default="http://localhost:8100")
+    parser.add_argument("--p99-ms", type=float, default=50)
+    parser.add_argument("--seconds", type=float, default=5, help="duration of each concurrency step")
+    parser.add_argument("--max-clients", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(main(args.base, args.p99_ms, args.seconds, args.max_clients))
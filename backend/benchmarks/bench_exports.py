@@ -0,0 +1,67 @@
+"""
+Export format benchmark: bytes on the wire and generation time per 1M rows.
+
+    python -m benchmarks.bench_exports --rows 1000000
+
+Feeds synthetic expense rows through each export writer in cursor-sized
+batches (no database), so the numbers isolate serialization and
+compression cost. Formats whose optional dependency is missing are skipped.
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from app.services.exports import export_service, EXPORT_FORMATS, ExportFormatUnavailable
+
+VENDORS = ["Conad", "Lidl", "Carrefour", "Uber", "Netflix", "Shell", "Apple Store", "Spar"]
+CATEGORIES = ["Ushqim", "Transport", "Teknologji", "Argëtim", "Tjetër"]
+WORDS = ["pane", "latte", "uova", "pasta", "caffè", "benzina", "biglietto", "abbonamento", "acqua"]
+
+def make_rows(count: int) -> list[tuple]:
+    rng = random.Random(42)
+    start = date(2019, 1, 1)
+    return [
+        (
+            start + timedelta(days=rng.randrange(2000)),
+            rng.choice(VENDORS),
+            " ".join(rng.choices(WORDS, k=rng.randint(1, 3))),
+            rng.choice(CATEGORIES),
+            Decimal(rng.randrange(10, 50000)) / 100,
+            "EUR",
+        )
+        for _ in range(count)
+    ]
+
+def batched(rows: list[tuple], size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def main(row_count: int):
+    rows = make_rows(row_count)
+    scale = 1_000_000 / row_count
+    
+    print(f"{'format':<10} {'MB/1M rows':>12} {'s/1M rows':>10} {'vs csv':>8}")
+    csv_bytes = None
+    for name in EXPORT_FORMATS:
+        started = time.perf_counter()
+        try:
+            size = 0
+            batches = batched(rows, export_service.batch_rows_for(name))
+            for chunk in export_service.writer(name)(batches):
+                size += len(chunk.encode() if isinstance(chunk, str) else chunk)
+        except ExportFormatUnavailable as e:
+            print(f"{name:<10} skipped: {e}")
+            continue
+        elapsed = time.perf_counter() - started
+        
+        if csv_bytes is None:
+            csv_bytes = size
+        print(f"{name:<10} {size * scale / 1e6:>12.1f} {elapsed * scale:>10.2f} {size / csv_bytes:>8.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+    main(args.rows)
@@ -0,0 +1,86 @@
+"""
+End-to-end parse latency for url vs inline image modes.
+
+    STUB_LATENCY_MS=300 STUB_FETCH_LATENCY_MS=150 \\
+        uvicorn benchmarks.stub_model_server:app --port 9000
+    OPENAI_API_BASE=http://localhost:9000/v1 OPENAI_API_KEY=stub \\
+        python -m benchmarks.bench_image_mode --image /path/to/receipt.jpg
+
+Serves the image from a local HTTP server for url mode (the stub downloads
+it, like the provider would) and embeds it as a data URL for inline mode.
+The parse cache is bypassed so every iteration calls the model.
+"""
+import argparse
+import asyncio
+import functools
+import hashlib
+import http.server
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from app.services.ai_parser import AIParserService
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+def serve_directory(directory: str, port: int) -> http.server.ThreadingHTTPServer:
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+async def run(mode: str, image_url: str, iterations: int) -> list[float]:
+    parser = AIParserService()
+    parser.image_mode = mode
+    # Measure the cold path: no inline LRU reuse between iterations
+    parser.inline_cache_size = 0
+
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await parser.parse_receipt(image_url)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def main(image_path: str, iterations: int, port: int):
+    filename = f"bench-{os.path.basename(image_path)}"
+
+    # url mode: the stub downloads from this server; inline mode reads the
+    # same file through storage_service, which maps URLs to uploads/
+    serve_root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(serve_root, "uploads"))
+    os.makedirs("uploads", exist_ok=True)
+    for directory in (os.path.join(serve_root, "uploads"), "uploads"):
+        shutil.copy(image_path, os.path.join(directory, filename))
+
+    server = serve_directory(serve_root, port)
+    image_url = f"http://127.0.0.1:{port}/uploads/{filename}"
+
+    with open(image_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    print(f"{image_path} ({os.path.getsize(image_path)} bytes, sha256 {digest}), {iterations} parses per mode")
+
+    try:
+        for mode in ("url", "inline"):
+            timings = asyncio.run(run(mode, image_url, iterations))
+            print(
+                f"{mode:7s} p50={statistics.median(timings):8.1f}ms "
+                f"max={max(timings):8.1f}ms mean={statistics.mean(timings):8.1f}ms"
+            )
+    finally:
+        server.shutdown()
+        shutil.rmtree(serve_root)
+        os.remove(os.path.join("uploads", filename))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image", default="sample_data/sample_receipt.jpg")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    main(args.image, args.iterations, args.port)
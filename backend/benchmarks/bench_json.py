@@ -0,0 +1,94 @@
+"""
+Serialization and validation cost of the JSON paths.
+
+    OPENAI_API_KEY=stub python -m benchmarks.bench_json --rows 10000 --items 40
+
+Expense responses: --rows in-memory Expense rows encoded the way FastAPI
+does with response_model (validate every row into ExpenseResponse, dump,
+stdlib json.dumps), and the way /expenses/ does now (response_content per
+row, rendered by FastJSONResponse). Model output: 1000 decodes and
+validations of a receipt with --items line items, with json.loads,
+orjson.loads and ParsedReceipt.model_validate_json. No database or model
+server is needed. Prints the median of --repeat runs.
+"""
+import argparse
+import json
+import statistics
+import time
+import uuid
+from datetime import date
+from decimal import Decimal
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter
+
+from app.models import Expense
+from app.responses import FastJSONResponse
+from app.schemas import ExpenseResponse, ParsedReceipt, response_content
+
+def make_expenses(count: int) -> list[Expense]:
+    user_id = uuid.uuid4()
+    invoice_id = uuid.uuid4()
+    return [
+        Expense(
+            id=uuid.uuid4(), user_id=user_id, invoice_id=invoice_id, date=date(2024, 1 + i % 12, 1 + i % 28),
+            category="Ushqim", description=f"Item {i}", amount=Decimal("1.25"), currency="EUR", vendor="Conad"
+        )
+        for i in range(count)
+    ]
+
+def make_model_output(item_count: int) -> str:
+    return json.dumps({
+        "vendor": "Conad", "invoice_no": "A-1001", "invoice_date": "2024-03-15", "currency": "EUR",
+        "items": [
+            {"description": f"Item {i}", "qty": 1, "unit_price": 1.25, "line_total": 1.25, "category": "auto"}
+            for i in range(item_count)
+        ],
+        "subtotal": 1.25 * item_count, "tax": 0.0, "total": 1.25 * item_count, "guessed_categories": True,
+    })
+
+def timed(fn, repeat: int) -> float:
+    """Median milliseconds of fn()"""
+    
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+def main(rows: int, items: int, repeat: int):
+    expenses = make_expenses(rows)
+    adapter = TypeAdapter(List[ExpenseResponse])
+    
+    def response_model_path() -> bytes:
+        content = adapter.dump_python(adapter.validate_python(expenses, from_attributes=True), mode="json")
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+    
+    def direct_path() -> bytes:
+        return FastJSONResponse([response_content(row, ExpenseResponse) for row in expenses]).body
+    
+    assert json.loads(response_model_path()) == json.loads(direct_path())
+    
+    print(f"/expenses/ with {rows} rows")
+    print(f"  response_model + json     {timed(response_model_path, repeat):8.2f}ms")
+    print(f"  response_content + orjson {timed(direct_path, repeat):8.2f}ms")
+    
+    content = make_model_output(items)
+    paths = {
+        "json.loads + validate": lambda: ParsedReceipt(**json.loads(content)),
+        "orjson.loads + validate": lambda: ParsedReceipt.model_validate(orjson.loads(content)),
+        "model_validate_json": lambda: ParsedReceipt.model_validate_json(content),
+    }
+    print(f"model output with {items} items, x1000")
+    for name, parse in paths.items():
+        print(f"  {name:25s} {timed(lambda: [parse() for _ in range(1000)], repeat):8.2f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--items", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.rows, args.items, args.repeat)
@@ -0,0 +1,104 @@
+"""
+Parse-commit latency vs receipt line count: bulk INSERT vs per-object ORM flush.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_save_receipt --items 1 10 40 80 160
+
+Saves synthetic parsed receipts into a real database (rows are tagged with
+a throwaway user id and deleted afterwards) and reports median latency and
+SQL statements per save for save_parsed_receipt and for the previous ORM
+path that created one Expense object per item.
+"""
+import argparse
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import event, delete
+
+from app.database import SessionLocal, engine
+from app.models import Expense, Invoice, MonthlyCategoryTotal
+from app.schemas import ParsedReceipt, ReceiptItem
+from app.services.invoice_processing import save_parsed_receipt
+from app.services.rollups import monthly_rollup_service
+
+def make_receipt(item_count: int) -> ParsedReceipt:
+    return ParsedReceipt(
+        vendor="Conad", invoice_date="2024-03-15", currency="EUR",
+        items=[
+            ReceiptItem(description=f"Item {i}", unit_price=1.25, line_total=1.25, category="Ushqim")
+            for i in range(item_count)
+        ],
+        subtotal=item_count * 1.25, tax=0, total=item_count * 1.25
+    )
+
+def save_with_orm(db, invoice: Invoice, parsed_data: ParsedReceipt):
+    """The previous implementation: one ORM Expense per item, flushed by the unit of work"""
+    
+    invoice.vendor = parsed_data.vendor
+    invoice.invoice_date = datetime.strptime(parsed_data.invoice_date, "%Y-%m-%d").date()
+    invoice.currency = parsed_data.currency
+    invoice.total = parsed_data.total
+    invoice.raw_json = parsed_data.dict()
+    
+    expenses = [
+        Expense(user_id=invoice.user_id, invoice_id=invoice.id, date=invoice.invoice_date,
+                category=item.category, description=item.description, amount=item.line_total,
+                currency=parsed_data.currency, vendor=parsed_data.vendor)
+        for item in parsed_data.items
+    ]
+    db.add_all(expenses)
+    monthly_rollup_service.add_expenses(db, [
+        {"user_id": e.user_id, "date": e.date, "category": e.category, "amount": e.amount} for e in expenses
+    ])
+    db.commit()
+
+def run(save, item_count: int, repeats: int, user_id: uuid.UUID) -> tuple[float, float]:
+    receipt = make_receipt(item_count)
+    statements = []
+    
+    def count(*args):
+        statements.append(1)
+    
+    timings = []
+    for _ in range(repeats):
+        db = SessionLocal()
+        try:
+            invoice = Invoice(user_id=user_id, file_url="http://localhost/uploads/bench.jpg")
+            db.add(invoice)
+            db.commit()
+            db.refresh(invoice)
+            
+            event.listen(engine, "before_cursor_execute", count)
+            started = time.perf_counter()
+            save(db, invoice, receipt)
+            timings.append(time.perf_counter() - started)
+            event.remove(engine, "before_cursor_execute", count)
+        finally:
+            db.close()
+    
+    return statistics.median(timings) * 1000, len(statements) / repeats
+
+def main(item_counts: list[int], repeats: int):
+    user_id = uuid.uuid4()
+    try:
+        print(f"{'items':>6} {'orm ms':>8} {'orm stmts':>10} {'bulk ms':>8} {'bulk stmts':>11} {'speedup':>8}")
+        for item_count in item_counts:
+            orm_ms, orm_statements = run(save_with_orm, item_count, repeats, user_id)
+            bulk_ms, bulk_statements = run(save_parsed_receipt, item_count, repeats, user_id)
+            print(f"{item_count:>6} {orm_ms:>8.2f} {orm_statements:>10.0f} {bulk_ms:>8.2f} "
+                  f"{bulk_statements:>11.0f} {orm_ms / bulk_ms:>7.1f}x")
+    finally:
+        db = SessionLocal()
+        db.execute(delete(Expense).where(Expense.user_id == user_id))
+        db.execute(delete(Invoice).where(Invoice.user_id == user_id))
+        db.execute(delete(MonthlyCategoryTotal).where(MonthlyCategoryTotal.user_id == user_id))
+        db.commit()
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, nargs="+", default=[1, 10, 40, 80, 160])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    main(args.items, args.repeats)
@@ -0,0 +1,87 @@
+"""
+Load test: latency of cheap endpoints while many parses are in flight.
+
+    STUB_LATENCY_MS=3000 uvicorn benchmarks.stub_model_server:app --port 9000
+    OPENAI_API_BASE=http://localhost:9000/v1 OPENAI_API_KEY=stub \\
+        uvicorn app.main:app --port 8000
+    python -m benchmarks.load_parse --base http://localhost:8000 --parses 50
+
+Each parse request re-queues the job and is then polled until it finishes,
+so the numbers include queueing as well as model time.
+
+Prints p50/p99 for /health, /expenses/ and /reports/monthly sampled while
+the parses run. With a blocking model client every sample waits behind the
+model call; with the async client they stay in the low milliseconds.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+PROBES = ["/health", "/expenses/", "/reports/monthly"]
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def upload(client: httpx.AsyncClient, image: bytes) -> str:
+    # Trailing bytes make every upload unique so the parse cache can't short-circuit
+    content = image + uuid.uuid4().bytes
+    response = await client.post("/invoices/", files={"file": ("receipt.jpg", content, "image/jpeg")})
+    response.raise_for_status()
+    return response.json()["id"]
+
+async def parse_and_wait(client: httpx.AsyncClient, invoice_id: str):
+    response = await client.post(f"/invoices/{invoice_id}/parse")
+    response.raise_for_status()
+    status = response.json()["status"]
+    while status in ("queued", "running"):
+        await asyncio.sleep(0.2)
+        status = (await client.get(f"/invoices/{invoice_id}/status")).json()["status"]
+
+async def probe(client: httpx.AsyncClient, path: str, stop: asyncio.Event, samples: list[float]):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get(path)
+        samples.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.05)
+
+async def main(base: str, parses: int, image_path: str):
+    with open(image_path, "rb") as f:
+        image = f.read()
+
+    limits = httpx.Limits(max_connections=parses + len(PROBES) + 10)
+    async with httpx.AsyncClient(base_url=base, timeout=300, limits=limits) as client:
+        ids = await asyncio.gather(*(upload(client, image) for _ in range(parses)))
+
+        stop = asyncio.Event()
+        samples = {path: [] for path in PROBES}
+        probes = [asyncio.create_task(probe(client, path, stop, samples[path])) for path in PROBES]
+
+        started = time.perf_counter()
+        await asyncio.gather(*(parse_and_wait(client, invoice_id) for invoice_id in ids))
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        await asyncio.gather(*probes)
+
+    print(f"{parses} parses finished in {elapsed:.2f}s")
+    for path, values in samples.items():
+        if not values:
+            continue
+        print(
+            f"{path:20s} n={len(values):4d} "
+            f"p50={statistics.median(values):8.1f}ms p99={percentile(values, 99):8.1f}ms"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base", default="http://localhost:8000")
+    parser.add_argument("--parses", type=int, default=50)
+    parser.add_argument("--image", default="sample_data/sample_receipt.jpg")
+    args = parser.parse_args()
+    asyncio.run(main(args.base, args.parses, args.image))
@@ -0,0 +1,183 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint.
+
+Run with:
+    uvicorn benchmarks.stub_model_server:app --port 9000
+
+and point the backend at it with OPENAI_API_BASE=http://localhost:9000/v1.
+STUB_LATENCY_MS controls how long each completion takes. Like the real
+provider, the stub downloads http(s) image URLs before answering (plus
+STUB_FETCH_LATENCY_MS to model the extra network hop) and decodes inline
+data URLs. Reported prompt tokens are about one per 4 characters of text
+plus STUB_IMAGE_TOKENS per image, so vision and OCR parses can be compared
+on /metrics. A request carrying several images is answered like a batched
+parse: {"receipts": [...]} with one indexed receipt per image, and
+completion tokens of about one per 4 characters of the answer.
+
+Faults can be injected to exercise the client's retries, circuit breaker
+and hedging, either at startup (STUB_ERROR_RATE, STUB_RATE_LIMIT_RATE,
+STUB_SLOW_RATE, STUB_SLOW_MS) or at runtime:
+
+    # Provider down: every call is a 503
+    curl -X POST localhost:9000/stub/faults -d '{"error_rate": 1.0}'
+    # Throttle the next two calls
+    curl -X POST localhost:9000/stub/faults -d '{"fail_next": 2, "fail_status": 429}'
+    # Back to normal
+    curl -X POST localhost:9000/stub/faults
+
+error_rate / rate_limit_rate / slow_rate are probabilities per call;
+fail_next and slow_next apply to the next N calls. GET /stub/faults shows
+the current settings and call counts.
+"""
+import asyncio
+import base64
+import json
+import os
+import random
+import time
+import uuid
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+STUB_LATENCY_MS = int(os.getenv("STUB_LATENCY_MS", "2000"))
+STUB_FETCH_LATENCY_MS = int(os.getenv("STUB_FETCH_LATENCY_MS", "0"))
+STUB_IMAGE_TOKENS = int(os.getenv("STUB_IMAGE_TOKENS", "850"))
+
+DEFAULT_FAULTS = {
+    "error_rate": float(os.getenv("STUB_ERROR_RATE", "0")),
+    "rate_limit_rate": float(os.getenv("STUB_RATE_LIMIT_RATE", "0")),
+    "retry_after": os.getenv("STUB_RETRY_AFTER", "1"),
+    "slow_rate": float(os.getenv("STUB_SLOW_RATE", "0")),
+    "slow_ms": int(os.getenv("STUB_SLOW_MS", "10000")),
+    "fail_next": 0,
+    "fail_status": 503,
+    "slow_next": 0,
+}
+faults = dict(DEFAULT_FAULTS)
+calls = {"total": 0, "failed": 0, "slow": 0}
+
+RECEIPT = {
+    "vendor": "Conad",
+    "invoice_no": "A-1001",
+    "invoice_date": "2024-03-15",
+    "currency": "EUR",
+    "items": [
+        {"description": "Pane", "qty": 1, "unit_price": 1.2, "line_total": 1.2, "category": "auto"},
+        {"description": "Latte", "qty": 2, "unit_price": 0.9, "line_total": 1.8, "category": "auto"},
+    ],
+    "subtotal": 3.0,
+    "tax": 0.0,
+    "total": 3.0,
+    "guessed_categories": True,
+}
+
+app = FastAPI()
+
+def completion(content: str, model: str, prompt_tokens: int, completion_tokens: int = 150) -> dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+def image_urls(body: dict) -> list[str]:
+    urls = []
+    for message in body.get("messages", []):
+        if isinstance(message.get("content"), list):
+            for part in message["content"]:
+                if part.get("type") == "image_url":
+                    urls.append(part["image_url"]["url"])
+    return urls
+
+def prompt_tokens(body: dict) -> int:
+    chars = 0
+    for message in body.get("messages", []):
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+        chars += sum(len(part.get("text", "")) for part in parts if part.get("type") == "text")
+    return chars // 4 + STUB_IMAGE_TOKENS * len(image_urls(body))
+
+async def load_image(url: str) -> bytes:
+    if url.startswith("data:"):
+        return base64.b64decode(url.split(",", 1)[1])
+    
+    await asyncio.sleep(STUB_FETCH_LATENCY_MS / 1000)
+    async with httpx.AsyncClient() as client:
+        response = await client.get(url)
+    if response.status_code != 200:
+        raise HTTPException(status_code=400, detail=f"Could not download image: {url}")
+    return response.content
+
+def error_response(status: int) -> JSONResponse:
+    """Error in the provider's format; 429s carry Retry-After"""
+    
+    kind = "rate_limit_exceeded" if status == 429 else "server_error"
+    headers = {"retry-after": str(faults["retry_after"])} if status == 429 else None
+    return JSONResponse(
+        status_code=status,
+        content={"error": {"message": f"Injected {status}", "type": kind, "param": None, "code": kind}},
+        headers=headers,
+    )
+
+@app.post("/stub/faults")
+async def set_faults(request: Request):
+    """Update fault settings; an empty body resets them and the call counts"""
+    
+    updates = await request.json() if await request.body() else {}
+    if not updates:
+        faults.update(DEFAULT_FAULTS)
+        calls.update({key: 0 for key in calls})
+    unknown = set(updates) - set(DEFAULT_FAULTS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown faults: {sorted(unknown)}")
+    faults.update(updates)
+    return faults
+
+@app.get("/stub/faults")
+async def get_faults():
+    return {"faults": faults, "calls": calls}
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    calls["total"] += 1
+    
+    if faults["fail_next"] > 0:
+        faults["fail_next"] -= 1
+        calls["failed"] += 1
+        return error_response(faults["fail_status"])
+    if random.random() < faults["rate_limit_rate"]:
+        calls["failed"] += 1
+        return error_response(429)
+    if random.random() < faults["error_rate"]:
+        calls["failed"] += 1
+        return error_response(503)
+    
+    latency_ms = STUB_LATENCY_MS
+    if faults["slow_next"] > 0 or random.random() < faults["slow_rate"]:
+        faults["slow_next"] = max(0, faults["slow_next"] - 1)
+        calls["slow"] += 1
+        latency_ms = faults["slow_ms"]
+    
+    urls = image_urls(body)
+    for url in urls:
+        await load_image(url)
+    await asyncio.sleep(latency_ms / 1000)
+    
+    if len(urls) > 1:
+        content = json.dumps({"receipts": [dict(RECEIPT, index=index) for index in range(1, len(urls) + 1)]})
+        return completion(content, body.get("model", "stub"), prompt_tokens(body), len(content) // 4)
+    return completion(json.dumps(RECEIPT), body.get("model", "stub"), prompt_tokens(body))
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.database import Base, async_url
+
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+@pytest.fixture(scope="session")
+def postgres_engine():
+    """Engine for a scratch PostgreSQL database, skipped when TEST_POSTGRES_URL is unset"""
+    
+    if not TEST_POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL not set")
+    
+    engine = create_engine(TEST_POSTGRES_URL)
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def postgres_db(postgres_engine):
+    db = sessionmaker(bind=postgres_engine)()
+    try:
+        yield db
+    finally:
+        db.rollback()
+        db.close()
+
+@pytest.fixture
+def postgres_get_db(postgres_engine):
+    """get_db override using the scratch database through asyncpg"""
+    
+    # No pooling since each TestClient runs the app on its own event loop
+    engine = create_async_engine(async_url(TEST_POSTGRES_URL), poolclass=NullPool)
+    session_factory = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    
+    async def get_db():
+        async with session_factory() as db:
+            yield db
+    
+    return get_db
@@ -0,0 +1,101 @@
+import asyncio
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from benchmarks import stub_model_server as stub
+from app.services.ai_parser import AIParserService, ReceiptBatcher
+from app.services.metrics import batch_receipts
+from app.services.resilience import ModelCallGuard
+
+@pytest.fixture
+def parser(monkeypatch):
+    """Vision parser with batching on, talking to the in-process stub"""
+    
+    monkeypatch.setattr(stub, "STUB_LATENCY_MS", 0)
+    stub.faults.update(stub.DEFAULT_FAULTS)
+    stub.calls.update({key: 0 for key in stub.calls})
+    
+    parser = AIParserService()
+    parser.client = AsyncOpenAI(
+        api_key="test", base_url="http://stub/v1", max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=stub.app))
+    )
+    parser.guard = ModelCallGuard()
+    parser.batcher = ReceiptBatcher(parser, max_size=3, max_wait=0.05)
+    return parser
+
+def parse_many(parser: AIParserService, count: int, image: bytes = b"image"):
+    async def run():
+        return await asyncio.gather(*[
+            parser.parse_receipt(f"receipt-{index}.jpg", image_bytes=image) for index in range(count)
+        ])
+    return asyncio.run(run())
+
+def test_concurrent_parses_share_one_request(parser):
+    """Test up to max_size receipts go out as one model request"""
+    
+    ok = batch_receipts.value("ok")
+    
+    receipts = parse_many(parser, 3)
+    assert [receipt.vendor for receipt in receipts] == ["Conad"] * 3
+    assert stub.calls["total"] == 1
+    assert batch_receipts.value("ok") == ok + 3
+
+def test_lone_parse_is_sent_alone(parser):
+    """Test a receipt with nothing to batch with is parsed on its own after max_wait"""
+    
+    assert parse_many(parser, 1)[0].total == 3.0
+    assert stub.calls["total"] == 1
+
+def test_large_images_skip_batching(parser):
+    """Test images over the size limit are parsed one per request"""
+    
+    parser.batch_max_image_bytes = 4
+    parse_many(parser, 3)
+    assert stub.calls["total"] == 3
+
+def test_missing_and_invalid_results_fall_back(parser, monkeypatch):
+    """Test receipts the batch left out or got wrong are parsed singly"""
+    
+    async def complete_batch(image_refs):
+        invalid = dict(stub.RECEIPT, total="not a number")
+        return [dict(stub.RECEIPT), None, invalid], 0.1, 3000
+    
+    monkeypatch.setattr(parser, "complete_batch", complete_batch)
+    ok, fallback, invalid = (batch_receipts.value(outcome) for outcome in ("ok", "fallback", "invalid"))
+    
+    receipts = parse_many(parser, 3)
+    assert [receipt.vendor for receipt in receipts] == ["Conad"] * 3
+    # Only the two fallbacks reached the model
+    assert stub.calls["total"] == 2
+    assert batch_receipts.value("ok") == ok + 1
+    assert batch_receipts.value("fallback") == fallback + 1
+    assert batch_receipts.value("invalid") == invalid + 1
+
+def test_batch_results_matched_by_index(parser, monkeypatch):
+    """Test results come back in input order whatever order the model used"""
+    
+    async def complete(messages, max_tokens):
+        return {"receipts": [{"index": 2, "vendor": "B"}, {"index": 1, "vendor": "A"}, {"index": 7}]}, 0.1, 100
+    
+    monkeypatch.setattr(parser, "complete", complete)
+    
+    receipts, _, _ = asyncio.run(parser.complete_batch(["a", "b", "c"]))
+    assert receipts == [{"vendor": "A"}, {"vendor": "B"}, None]
+
+def test_cancelled_waiter_is_not_flushed(parser):
+    """Test a parse cancelled while waiting for its batch neither errors the flush nor reaches the model"""
+    
+    async def run():
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        task = asyncio.create_task(parser.parse_receipt("receipt-0.jpg", image_bytes=b"image"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.sleep(0.1)
+        return errors
+    
+    assert asyncio.run(run()) == []
+    assert stub.calls["total"] == 0
@@ -0,0 +1,54 @@
+import random
+
+from app.services.categorization import CategorizationService, KeywordMatcher, CATEGORY_RULES
+
+def linear_categorize(rules: dict, text: str) -> str:
+    for keyword, category in rules.items():
+        if keyword in text:
+            return category
+    return "Tjetër"
+
+def test_matcher_agrees_with_linear_scan():
+    """Test automaton picks the same rule as scanning rules in order"""
+    
+    rng = random.Random(7)
+    words = ["".join(rng.choices("abcde", k=rng.randint(1, 4))) for _ in range(200)]
+    rules = {word: f"cat{i}" for i, word in enumerate(dict.fromkeys(words))}
+    
+    service = CategorizationService()
+    service.set_rules(rules)
+    
+    for _ in range(500):
+        text = "".join(rng.choices("abcde ", k=rng.randint(0, 30)))
+        assert service.categorize_expense(description=text) == linear_categorize(rules, f" {text}")
+
+def test_priority_follows_rule_order():
+    """Test earlier rules win over longer later matches"""
+    
+    service = CategorizationService()
+    service.set_rules({"market": "Ushqim", "supermarket": "Tjetër"})
+    
+    assert service.categorize_expense(vendor="Supermarket Conad") == "Ushqim"
+
+def test_word_boundary_matching():
+    """Test word-boundary mode ignores keywords inside other words"""
+    
+    matcher = KeywordMatcher(["gas", "bus"], word_boundary=True)
+    
+    assert matcher.match_priority("vegas casino") == float("inf")
+    assert matcher.match_priority("gas station") == 0
+    assert matcher.match_priority("city-bus ticket") == 1
+
+def test_categorize_many_matches_single_item_path():
+    """Test batch categorization agrees with per-item categorization"""
+    
+    service = CategorizationService()
+    service.set_rules(CATEGORY_RULES)
+    descriptions = ["Uber ride", "Netflix subscription", "Pane", None]
+    
+    assert service.categorize_many("Lidl", descriptions) == [
+        service.categorize_expense(vendor="Lidl", description=d) for d in descriptions
+    ]
+    assert service.categorize_many("Shell", descriptions) == [
+        service.categorize_expense(vendor="Shell", description=d) for d in descriptions
+    ]
@@ -0,0 +1,87 @@
+import json
+import uuid
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app.database import get_db
+from app.main import app
+from app.models import Expense
+from app.responses import FastJSONResponse
+from app.routers.expenses import encode_cursor, decode_cursor, parse_fields
+from app.schemas import ExpenseResponse, response_content
+from app.services.auth import auth_service
+
+def test_cursor_round_trip():
+    """Test cursors decode to the (date, id) they were made from"""
+    
+    expense_id = uuid.uuid4()
+    cursor = encode_cursor(date(2024, 3, 15), expense_id)
+    
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (date(2024, 3, 15), expense_id)
+    with pytest.raises(HTTPException):
+        decode_cursor("not-a-cursor")
+
+def test_parse_fields():
+    """Test fields= projection is validated against ExpenseResponse"""
+    
+    assert parse_fields(None) is None
+    assert parse_fields("date, amount,date") == ["date", "amount"]
+    with pytest.raises(HTTPException):
+        parse_fields("date,password")
+
+def test_keyset_pages_cover_all_rows(postgres_db, postgres_get_db):
+    """Test following X-Next-Cursor returns every row once, in order"""
+    
+    user_id = auth_service.get_current_user_id()
+    postgres_db.query(Expense).filter(Expense.user_id == user_id).delete()
+    postgres_db.add_all([
+        Expense(user_id=user_id, date=date(2024, 1, 1 + i % 3), category="Ushqim",
+                amount="1.00", currency="EUR")
+        for i in range(10)
+    ])
+    postgres_db.commit()
+    
+    previous = app.dependency_overrides.get(get_db)
+    app.dependency_overrides[get_db] = postgres_get_db
+    try:
+        client = TestClient(app)
+        full = client.get("/expenses/", params={"limit": 100}).json()
+        
+        seen = []
+        params = {"limit": 4, "fields": "id,date"}
+        while True:
+            response = client.get("/expenses/", params=params)
+            assert response.status_code == 200
+            page = response.json()
+            assert len(page) <= 4 and set(page[0]) == {"id", "date"}
+            seen += [row["id"] for row in page]
+            if "X-Next-Cursor" not in response.headers:
+                break
+            params["cursor"] = response.headers["X-Next-Cursor"]
+    finally:
+        if previous is None:
+            app.dependency_overrides.pop(get_db, None)
+        else:
+            app.dependency_overrides[get_db] = previous
+    
+    assert len(full) == 10
+    assert seen == [row["id"] for row in full]
+
+def test_response_content_matches_response_model():
+    """Test rows rendered without validation match ExpenseResponse's JSON"""
+    
+    expense = Expense(
+        id=uuid.uuid4(), user_id=uuid.uuid4(), invoice_id=None, date=date(2024, 3, 15),
+        category="Ushqim", description="Pane", amount=Decimal("1.20"), currency="EUR", vendor="Conad"
+    )
+    
+    def render(fields=None):
+        return json.loads(FastJSONResponse(response_content(expense, ExpenseResponse, fields)).body)
+    
+    assert render() == ExpenseResponse.model_validate(expense).model_dump(mode="json")
+    assert render(["amount", "date"]) == {"amount": "1.20", "date": "2024-03-15"}
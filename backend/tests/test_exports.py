@@ -0,0 +1,111 @@
+import csv
+import gzip
+import io
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from app.main import app
+from app.models import Expense
+from app.services.auth import auth_service
+from app.services.exports import ExportService, export_service, format_for_accept
+
+def test_csv_streams_in_batches(postgres_db, postgres_engine):
+    """Test CSV export yields a header chunk then one chunk per batch"""
+    
+    user_id = uuid.uuid4()
+    postgres_db.add_all([
+        Expense(user_id=user_id, date=date(2024, 1, 1) + timedelta(days=i), category="Ushqim",
+                description=None if i == 0 else f"Item, {i}", amount=f"{i}.50", currency="EUR", vendor="Conad")
+        for i in range(5)
+    ])
+    postgres_db.commit()
+    
+    service = ExportService(sessionmaker(bind=postgres_engine))
+    service.batch_rows = 2
+    chunks = list(service.stream(service.build_query(user_id), "csv"))
+    
+    assert len(chunks) == 1 + 3
+    rows = list(csv.reader(io.StringIO("".join(chunks))))
+    assert rows[0] == ["Date", "Vendor", "Description", "Category", "Amount", "Currency"]
+    assert rows[1] == ["2024-01-05", "Conad", "Item, 4", "Ushqim", "4.50", "EUR"]
+    assert rows[-1] == ["2024-01-01", "Conad", "", "Ushqim", "0.50", "EUR"]
+    
+    filtered = service.build_query(user_id, from_date=date(2024, 1, 4))
+    assert len(list(csv.reader(io.StringIO("".join(service.stream(filtered, "csv")))))) == 3
+
+ROWS = [
+    (date(2024, 3, 15), "Conad", "Pane", "Ushqim", Decimal("1.20"), "EUR"),
+    (date(2024, 3, 14), None, None, "Tjetër", Decimal("10.00"), "EUR"),
+]
+
+def test_gzip_csv_matches_plain_csv():
+    """Test streamed gzip output decompresses to the plain CSV"""
+    
+    service = ExportService()
+    plain = "".join(service.iter_csv([ROWS])).encode()
+    
+    assert gzip.decompress(b"".join(service.iter_csv_gzip([ROWS[:1], ROWS[1:]]))) == plain
+
+def test_parquet_round_trip():
+    """Test Parquet export keeps types and writes one row group per batch"""
+    
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    service = ExportService()
+    
+    data = b"".join(service.iter_parquet([ROWS[:1], ROWS[1:]]))
+    parquet_file = pyarrow_parquet.ParquetFile(io.BytesIO(data))
+    
+    assert parquet_file.metadata.num_row_groups == 2
+    assert parquet_file.read().to_pylist()[1] == {
+        "date": date(2024, 3, 14), "vendor": None, "description": None,
+        "category": "Tjetër", "amount": Decimal("10.00"), "currency": "EUR",
+    }
+
+def test_format_for_accept():
+    """Test Accept header negotiation falls back to CSV"""
+    
+    assert format_for_accept("application/vnd.apache.parquet") == "parquet"
+    assert format_for_accept("text/html, application/vnd.apache.arrow.stream;q=0.9") == "arrow"
+    assert format_for_accept("*/*") == "csv"
+    assert format_for_accept(None) == "csv"
+
+def test_export_endpoint_negotiates_format(postgres_db, postgres_engine, monkeypatch):
+    """Test GET /exports/expenses picks the format from ?format= or Accept and rejects unknown ones"""
+    
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    user_id = auth_service.get_current_user_id()
+    postgres_db.query(Expense).filter(Expense.user_id == user_id).delete()
+    postgres_db.add_all([
+        Expense(user_id=user_id, date=date(2024, 3, 15), category="Ushqim", description="Pane",
+                amount="1.20", currency="EUR", vendor="Conad"),
+        Expense(user_id=user_id, date=date(2024, 3, 14), category="Tjetër", amount="10.00", currency="EUR"),
+    ])
+    postgres_db.commit()
+    monkeypatch.setattr(export_service, "session_factory", sessionmaker(bind=postgres_engine))
+    client = TestClient(app)
+    
+    plain = client.get("/exports/expenses")
+    assert plain.status_code == 200
+    assert plain.headers["content-type"].startswith("text/csv")
+    assert len(list(csv.reader(io.StringIO(plain.text)))) == 3
+    
+    compressed = client.get("/exports/expenses", params={"format": "csv.gz"})
+    assert compressed.headers["content-disposition"] == "attachment; filename=expenses.csv.gz"
+    assert gzip.decompress(compressed.content) == plain.content
+    
+    parquet = client.get("/exports/expenses", headers={"Accept": "application/vnd.apache.parquet"})
+    assert parquet.headers["content-type"] == "application/vnd.apache.parquet"
+    assert pyarrow_parquet.read_table(io.BytesIO(parquet.content)).num_rows == 2
+    
+    # ?format= wins over Accept
+    assert client.get("/exports/expenses", params={"format": "csv"},
+                      headers={"Accept": "application/vnd.apache.arrow.stream"}).content == plain.content
+    
+    unknown = client.get("/exports/expenses", params={"format": "xml"})
+    assert unknown.status_code == 400
+    assert "csv, csv.gz, csv.zst, parquet, arrow" in unknown.json()["detail"]
@@ -0,0 +1,78 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+from app.services.image_processing import normalize_image_bytes, ImageProcessingService, NormalizeOptions
+from app.services.storage import storage_service
+
+OPTIONS = NormalizeOptions(max_edge=800, image_format="JPEG", quality=80, grayscale=False, pdf_max_pages=1)
+
+def make_jpeg(width: int, height: int, orientation: int = 1) -> bytes:
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(output, format="JPEG", exif=exif)
+    return output.getvalue()
+
+def test_normalize_downsizes_to_max_edge():
+    """Test long edge is capped and aspect ratio kept"""
+    
+    data = normalize_image_bytes(make_jpeg(3000, 1500), "image/jpeg", OPTIONS)
+    
+    assert Image.open(io.BytesIO(data)).size == (800, 400)
+
+def test_normalize_applies_exif_orientation():
+    """Test rotated phone photos are turned upright"""
+    
+    # Orientation 6 means the camera was rotated 90 degrees
+    data = normalize_image_bytes(make_jpeg(1000, 500, orientation=6), "image/jpeg", OPTIONS)
+    
+    assert Image.open(io.BytesIO(data)).size == (400, 800)
+
+def test_normalize_grayscale():
+    """Test grayscale option converts to a single channel"""
+    
+    options = NormalizeOptions(max_edge=800, image_format="JPEG", quality=80, grayscale=True, pdf_max_pages=1)
+    data = normalize_image_bytes(make_jpeg(100, 100), "image/jpeg", options)
+    
+    assert Image.open(io.BytesIO(data)).mode == "L"
+
+def test_normalize_webp():
+    """Test WebP output format"""
+    
+    options = NormalizeOptions(max_edge=800, image_format="WEBP", quality=80, grayscale=False, pdf_max_pages=1)
+    data = normalize_image_bytes(make_jpeg(100, 100), "image/jpeg", options)
+    
+    assert Image.open(io.BytesIO(data)).format == "WEBP"
+
+def test_unknown_image_format_fails_at_startup(monkeypatch):
+    """Test an unsupported IMAGE_FORMAT is refused when the service is created"""
+    
+    monkeypatch.setenv("IMAGE_FORMAT", "png")
+    with pytest.raises(ValueError, match="IMAGE_FORMAT must be one of JPEG, WEBP"):
+        ImageProcessingService()
+
+def test_rasterized_pdf_always_replaces_upload(monkeypatch, tmp_path):
+    """Test PDFs are swapped for their rendering even when it is larger, images are not"""
+    
+    monkeypatch.setattr(storage_service, "upload_dir", str(tmp_path))
+    service = ImageProcessingService()
+    
+    async def normalize(data, content_type):
+        return make_jpeg(100, 100)
+    
+    monkeypatch.setattr(service, "normalize", normalize)
+    
+    async def run(content_type: str, extension: str):
+        stored = await storage_service.save_bytes(b"tiny", extension)
+        return stored, await service.normalize_stored(stored, content_type)
+    
+    pdf, replacement = asyncio.run(run("application/pdf", ".pdf"))
+    assert replacement.url.endswith(".jpg") and replacement.size > pdf.size
+    # Another upload of the same PDF may still read the original
+    assert asyncio.run(storage_service.read_file(pdf.url)) == b"tiny"
+    
+    image, kept = asyncio.run(run("image/jpeg", ".jpg"))
+    assert kept == image
@@ -0,0 +1,125 @@
+import uuid
+
+import pytest
+from sqlalchemy import event
+
+from app.models import Expense, Invoice, MonthlyCategoryTotal, ParseJob
+from app.schemas import ParsedReceipt, ReceiptItem
+from app.services.invoice_processing import save_parsed_receipt, JobLostError
+from app.services.rollups import monthly_rollup_service
+
+def make_receipt(item_count: int) -> ParsedReceipt:
+    return ParsedReceipt(
+        vendor="Conad", invoice_date="2024-03-15", currency="EUR",
+        items=[
+            ReceiptItem(description=f"Item {i}", unit_price=1.5, line_total=1.5,
+                        category="Ushqim" if i % 2 else "Shtepi")
+            for i in range(item_count)
+        ],
+        subtotal=item_count * 1.5, tax=0, total=item_count * 1.5
+    )
+
+def test_save_parsed_receipt_batches_items(postgres_db):
+    """Test an 80-line receipt is saved with a constant number of statements"""
+    
+    invoice = Invoice(user_id=uuid.uuid4(), file_url="http://localhost/uploads/x.jpg")
+    postgres_db.add(invoice)
+    postgres_db.commit()
+    
+    statements = []
+    engine = postgres_db.get_bind()
+    
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0])
+    
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        save_parsed_receipt(postgres_db, invoice, make_receipt(80))
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    
+    # Expense INSERT, rollup upsert, invoice UPDATE (+ reload SELECT)
+    assert statements.count("INSERT") == 2
+    assert statements.count("UPDATE") == 1
+    
+    assert postgres_db.query(Expense).filter(Expense.invoice_id == invoice.id).count() == 80
+    totals = {
+        row.category: (float(row.total), row.expense_count)
+        for row in postgres_db.query(MonthlyCategoryTotal).filter(MonthlyCategoryTotal.user_id == invoice.user_id)
+    }
+    assert totals == {"Ushqim": (60.0, 40), "Shtepi": (60.0, 40)}
+    assert float(invoice.total) == 120.0
+
+def test_same_receipt_photographed_twice_is_flagged(postgres_db):
+    """Test a parsed receipt matching an earlier one on vendor, date and total is marked a duplicate"""
+    
+    user_id = uuid.uuid4()
+    original, copy, other = (Invoice(user_id=user_id, file_url=f"http://localhost/uploads/{i}.jpg") for i in range(3))
+    postgres_db.add_all([original, copy, other])
+    postgres_db.commit()
+    
+    save_parsed_receipt(postgres_db, original, make_receipt(2))
+    receipt = make_receipt(2)
+    receipt.vendor = " CONAD "
+    save_parsed_receipt(postgres_db, copy, receipt)
+    receipt = make_receipt(3)
+    save_parsed_receipt(postgres_db, other, receipt)
+    
+    assert original.duplicate_of_id is None
+    assert copy.duplicate_of_id == original.id
+    assert other.duplicate_of_id is None
+
+def test_reparse_replaces_expenses(postgres_db):
+    """Test saving a second parse replaces the first one's expenses and totals"""
+    
+    invoice = Invoice(user_id=uuid.uuid4(), file_url="http://localhost/uploads/x.jpg")
+    postgres_db.add(invoice)
+    postgres_db.commit()
+    
+    save_parsed_receipt(postgres_db, invoice, make_receipt(4))
+    save_parsed_receipt(postgres_db, invoice, make_receipt(2))
+    
+    assert postgres_db.query(Expense).filter(Expense.invoice_id == invoice.id).count() == 2
+    totals = {
+        row.category: (float(row.total), row.expense_count)
+        for row in postgres_db.query(MonthlyCategoryTotal).filter(MonthlyCategoryTotal.user_id == invoice.user_id)
+    }
+    assert totals == {"Ushqim": (1.5, 1), "Shtepi": (1.5, 1)}
+    assert monthly_rollup_service.check(postgres_db, invoice.user_id) == []
+
+def test_reclaimed_job_is_not_saved(postgres_db):
+    """Test a parse whose job was reclaimed by another worker is discarded"""
+    
+    invoice = Invoice(user_id=uuid.uuid4(), file_url="http://localhost/uploads/x.jpg")
+    postgres_db.add(invoice)
+    postgres_db.flush()
+    postgres_db.add(ParseJob(invoice_id=invoice.id, status="running", attempts=2))
+    postgres_db.commit()
+    
+    with pytest.raises(JobLostError):
+        save_parsed_receipt(postgres_db, invoice, make_receipt(2), job_attempt=1)
+    postgres_db.rollback()
+    
+    save_parsed_receipt(postgres_db, invoice, make_receipt(2), job_attempt=2)
+    assert postgres_db.query(Expense).filter(Expense.invoice_id == invoice.id).count() == 2
+
+def test_half_cent_amounts_match_rollups(postgres_db):
+    """Test half-cent line totals round the same way in expenses, rollups and the duplicate check"""
+    
+    user_id = uuid.uuid4()
+    original, copy = (Invoice(user_id=user_id, file_url=f"http://localhost/uploads/{i}.jpg") for i in range(2))
+    postgres_db.add_all([original, copy])
+    postgres_db.commit()
+    
+    receipt = make_receipt(2)
+    for item in receipt.items:
+        item.line_total = 0.125
+    receipt.total = 0.245
+    save_parsed_receipt(postgres_db, original, receipt)
+    save_parsed_receipt(postgres_db, copy, receipt)
+    
+    amounts = {str(row.amount) for row in postgres_db.query(Expense).filter(Expense.invoice_id == original.id)}
+    assert amounts == {"0.13"}
+    assert str(original.total) == "0.25"
+    assert monthly_rollup_service.check(postgres_db, user_id) == []
+    assert copy.duplicate_of_id == original.id
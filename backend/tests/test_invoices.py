@@ -1,29 +1,45 @@
+import json
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlalchemy.orm import Session
+from decimal import Decimal
 import tempfile
 import os
+import uuid
 
 from app.main import app
 from app.database import get_db, Base
+from app.models import Invoice, ParseJob
+from app.schemas import InvoiceResponse, ParsedReceipt
+from app.routers import invoices as invoices_router
+from app.services import batch_import, invoice_processing, parse_queue
+from app.services.batch_import import batch_import_service
+from app.services.parse_queue import parse_queue_service
+from app.services.storage import storage_service
 
 # Create test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Requests use the same file through aiosqlite; no pooling since each
+# TestClient runs the app on its own event loop
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async def override_get_db():
+    async with TestingSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 app.dependency_overrides[get_db] = override_get_db
 
 @pytest.fixture
-def client():
+def client(monkeypatch, tmp_path):
+    # Queue workers would poll the application database
+    monkeypatch.setattr(parse_queue_service, "workers", 0)
+    # Keep uploaded test files out of ./uploads
+    monkeypatch.setattr(storage_service, "upload_dir", str(tmp_path))
     Base.metadata.create_all(bind=engine)
     with TestClient(app) as c:
         yield c
@@ -54,4 +70,114 @@ def test_health_check(client):
     """Test health check endpoint"""
     response = client.get("/health")
     assert response.status_code == 200
-    assert response.json() == {"status": "healthy"}
\ No newline at end of file
+    assert response.json() == {"status": "healthy"}
+
+def test_duplicate_upload_returns_existing_invoice(client):
+    """Test re-uploading the same file returns the first invoice"""
+    
+    content = os.urandom(64)
+    first = client.post("/invoices/", files={"file": ("a.jpg", content, "image/jpeg")}).json()
+    second = client.post("/invoices/", files={"file": ("b.jpg", content, "image/jpeg")}).json()
+    
+    assert first["duplicate"] is False
+    assert second == {"id": first["id"], "duplicate": True}
+
+def test_parse_with_parser_backend(client):
+    """Test a parse can ask for the OCR backend and unknown backends are rejected"""
+    
+    invoice = client.post("/invoices/", files={"file": ("a.jpg", os.urandom(64), "image/jpeg")}).json()
+    
+    job = client.post(f"/invoices/{invoice['id']}/parse", params={"parser": "ocr"}).json()
+    assert job["parser"] == "ocr"
+    
+    response = client.post(f"/invoices/{invoice['id']}/parse", params={"parser": "bogus"})
+    assert response.status_code == 422
+
+def test_get_invoice_matches_response_model(client):
+    """Test invoice details serialize exactly as InvoiceResponse would"""
+    
+    invoice = client.post("/invoices/", files={"file": ("a.jpg", os.urandom(64), "image/jpeg")}).json()
+    
+    response = client.get(f"/invoices/{invoice['id']}")
+    assert response.status_code == 200
+    
+    with Session(engine) as db:
+        row = db.get(Invoice, uuid.UUID(invoice["id"]))
+        row.total, row.raw_json = Decimal("12.50"), {"vendor": "Conad"}
+        db.commit()
+        expected = InvoiceResponse.model_validate(row).model_dump(mode="json")
+    
+    assert client.get(f"/invoices/{invoice['id']}").json() == expected
+
+def test_batch_upload_reports_each_file(client, monkeypatch):
+    """Test a batch streams one line per file and failed parses go back to the queue"""
+    
+    monkeypatch.setattr(batch_import, "AsyncSessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(parse_queue, "AsyncSessionLocal", TestingSessionLocal)
+    failing = os.urandom(64)
+    
+    async def parse_invoice_file(file_url, parser=None):
+        if await storage_service.read_file(file_url) == failing:
+            raise ValueError("unreadable receipt")
+        return ParsedReceipt(vendor="Conad", invoice_date="2024-03-15", currency="EUR",
+                             subtotal=3.0, tax=0.0, total=3.0)
+    
+    monkeypatch.setattr(invoice_processing, "parse_invoice_file", parse_invoice_file)
+    
+    response = client.post("/invoices/batch", files=[
+        ("files", ("ok.jpg", os.urandom(64), "image/jpeg")),
+        ("files", ("bad.jpg", failing, "image/jpeg")),
+        ("files", ("notes.txt", b"text", "text/plain")),
+    ])
+    assert response.status_code == 200
+    
+    lines = {line["filename"]: line for line in map(json.loads, response.text.splitlines())}
+    assert lines["ok.jpg"]["status"] == "done"
+    assert lines["ok.jpg"]["receipt"]["vendor"] == "Conad"
+    assert lines["bad.jpg"] == {"index": 1, "filename": "bad.jpg", "invoice_id": lines["bad.jpg"]["invoice_id"],
+                                "status": "queued", "error": "unreadable receipt"}
+    assert lines["notes.txt"]["status"] == "rejected"
+    
+    with Session(engine) as db:
+        jobs = {str(job.invoice_id): job for job in db.query(ParseJob)}
+        assert jobs[lines["ok.jpg"]["invoice_id"]].status == "done"
+        assert jobs[lines["bad.jpg"]["invoice_id"]].attempts == 1
+        assert db.get(Invoice, uuid.UUID(lines["ok.jpg"]["invoice_id"])).total == Decimal("3.00")
+
+def test_batch_upload_loses_race_to_single_upload(client, monkeypatch):
+    """Test a file another request inserted after the batch's duplicate check is reported as a duplicate"""
+    
+    content = os.urandom(64)
+    existing = client.post("/invoices/", files={"file": ("a.jpg", content, "image/jpeg")}).json()
+    
+    find_uploaded_invoices = invoices_router.find_uploaded_invoices
+    lookups = []
+    
+    async def find_before_commit(db, user_id, content_hashes):
+        # The batch's first lookup ran before the single upload committed
+        lookups.append(content_hashes)
+        return {} if len(lookups) == 1 else await find_uploaded_invoices(db, user_id, content_hashes)
+    
+    monkeypatch.setattr(invoices_router, "find_uploaded_invoices", find_before_commit)
+    
+    response = client.post("/invoices/batch", files=[("files", ("b.jpg", content, "image/jpeg"))])
+    assert response.status_code == 200
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"index": 0, "filename": "b.jpg", "status": "duplicate", "invoice_id": existing["id"]}
+    ]
+    
+    with Session(engine) as db:
+        assert db.query(Invoice).count() == 1
+
+def test_batch_upload_file_limit(client, monkeypatch):
+    """Test batches over BATCH_MAX_FILES are refused before anything is stored"""
+    
+    monkeypatch.setattr(batch_import_service, "max_files", 2)
+    
+    response = client.post("/invoices/batch", files=[
+        ("files", (f"r{index}.jpg", os.urandom(64), "image/jpeg")) for index in range(3)
+    ])
+    assert response.status_code == 413
+    
+    with Session(engine) as db:
+        assert db.query(Invoice).count() == 0
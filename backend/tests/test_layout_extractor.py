@@ -0,0 +1,92 @@
+import asyncio
+
+from app.services import ocr
+from app.services.ai_parser import tiered_parser_service
+from app.services.layout_extractor import extract_layout, totals_match
+from app.services.metrics import layout_escalations, parse_tiers
+from app.services.ocr import ocr_service
+
+CONAD = """CONAD SUPERSTORE
+Via Roma 12 Rimini
+P.IVA 01234567890
+DOCUMENTO COMMERCIALE
+DESCRIZIONE IVA PREZZO(€)
+PANE COMUNE 4% 1,20
+2 x 0,90
+LATTE INTERO 4% 1,80
+SCONTO -0,50
+SUBTOTALE 2,50
+TOTALE COMPLESSIVO 2,50
+DI CUI IVA 0,10
+PAGAMENTO CONTANTE 5,00
+15-03-2024 10:22 DOC.N. 0012-0034"""
+
+LIDL = """LIDL
+Lidl Italia S.r.l.
+Pasta Combino 0,89 A
+Yogurt 1,38 A
+2 x 0,69
+TOTALE 2,27
+02.04.2024 18:05"""
+
+def test_conad_receipt_is_read_from_layout():
+    """Test a known layout yields every field with full confidence"""
+    
+    extraction = extract_layout(CONAD)
+    
+    assert extraction.confidence == 1.0
+    assert extraction.data["invoice_date"] == "2024-03-15"
+    assert extraction.data["invoice_no"] == "0012-0034"
+    assert (extraction.data["total"], extraction.data["tax"]) == (2.5, 0.1)
+    assert [(item["description"], item["qty"], item["line_total"]) for item in extraction.data["items"]] == [
+        ("PANE COMUNE", 1, 1.2), ("LATTE INTERO", 2, 1.8), ("SCONTO", 1, -0.5)
+    ]
+    assert totals_match(extraction.data)
+
+def test_lidl_quantity_follows_item():
+    """Test quantity lines printed under their item"""
+    
+    extraction = extract_layout(LIDL)
+    
+    assert extraction.data["vendor"] == "Lidl"
+    assert [(item["qty"], item["unit_price"]) for item in extraction.data["items"]] == [(1, 0.89), (2, 0.69)]
+    assert totals_match(extraction.data)
+
+def test_garbled_or_unknown_receipts_lose_confidence():
+    """Test unknown vendors, unreadable lines and wrong sums are caught"""
+    
+    assert extract_layout("BAR CENTRALE\nCAFFE 1,00\nTOTALE 1,00") is None
+    
+    garbled = extract_layout(CONAD.replace("PANE COMUNE 4% 1,20", "PANE C0MUNE 4% 1.2O"))
+    assert garbled.confidence < tiered_parser_service.min_confidence
+    
+    wrong_sum = extract_layout(CONAD.replace("SUBTOTALE 2,50", "SUBTOTALE 3,50"))
+    assert wrong_sum.confidence == 1.0
+    assert tiered_parser_service.escalation_reason(wrong_sum) == "totals_mismatch"
+
+def test_tiered_parser_escalates_only_when_unsure(monkeypatch):
+    """Test known layouts skip the model and the rest fall back to it"""
+    
+    texts = iter([CONAD, CONAD.replace("SUBTOTALE 2,50", "SUBTOTALE 3,50")])
+    fallback_calls = []
+    
+    async def extract_text(data):
+        return next(texts)
+    
+    async def fallback_parse(image_url, content_hash=None, image_bytes=None):
+        fallback_calls.append(image_url)
+        return "model result"
+    
+    monkeypatch.setattr(ocr, "pytesseract", object())
+    monkeypatch.setattr(ocr_service, "extract_text", extract_text)
+    monkeypatch.setattr(tiered_parser_service.fallback, "parse_receipt", fallback_parse)
+    layout_count, mismatches = parse_tiers.value("layout"), layout_escalations.value("totals_mismatch")
+    
+    receipt = asyncio.run(tiered_parser_service.parse_receipt("http://localhost/uploads/a.jpg", image_bytes=b"a"))
+    assert receipt.vendor == "Conad" and receipt.items[0].category != "auto"
+    assert fallback_calls == []
+    
+    assert asyncio.run(tiered_parser_service.parse_receipt("http://localhost/uploads/b.jpg", image_bytes=b"b")) == "model result"
+    assert fallback_calls == ["http://localhost/uploads/b.jpg"]
+    assert parse_tiers.value("layout") == layout_count + 1
+    assert layout_escalations.value("totals_mismatch") == mismatches + 1
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.metrics import MetricsRegistry, http_request_seconds, model_tokens, record_usage
+
+def test_histogram_buckets_are_cumulative():
+    """Test observations land in le buckets and render in the text format"""
+    
+    registry = MetricsRegistry()
+    histogram = registry.histogram("demo_seconds", "Demo", ("stage",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "read")
+    histogram.observe(0.1, "read")
+    histogram.observe(5, "read")
+    with histogram.time("write"):
+        pass
+    
+    lines = registry.render().splitlines()
+    assert "# TYPE demo_seconds histogram" in lines
+    assert 'demo_seconds_bucket{stage="read",le="0.1"} 2' in lines
+    assert 'demo_seconds_bucket{stage="read",le="1.0"} 2' in lines
+    assert 'demo_seconds_bucket{stage="read",le="+Inf"} 3' in lines
+    assert 'demo_seconds_count{stage="read"} 3' in lines
+    assert histogram.count("write") == 1
+
+def test_record_usage_counts_tokens():
+    """Test prompt and completion tokens are counted per model"""
+    
+    prompt = model_tokens.value("test-model", "prompt")
+    record_usage("test-model", SimpleNamespace(prompt_tokens=120, completion_tokens=30, total_tokens=150))
+    record_usage("test-model", None)
+    
+    assert model_tokens.value("test-model", "prompt") == prompt + 120
+    assert model_tokens.value("test-model", "completion") >= 30
+
+def test_route_latency_and_metrics_endpoint():
+    """Test requests are timed per route template and exposed on /metrics"""
+    
+    client = TestClient(app)
+    count = http_request_seconds.count("GET", "/health", 200)
+    client.get("/health")
+    client.get("/no-such-page")
+    
+    assert http_request_seconds.count("GET", "/health", 200) == count + 1
+    assert http_request_seconds.count("GET", "other", 404) >= 1
+    
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in response.text
+    assert "# TYPE receipt_stage_seconds histogram" in response.text
+    assert 'db_pool_checkouts_total{pool="async"}' in response.text
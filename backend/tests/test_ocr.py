@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from app.services import ocr
+from app.services.ai_parser import AIParserService, get_parser, ocr_parser_service
+from app.services.ocr import normalize_text, ocr_service
+
+def test_normalize_text_drops_noise_lines():
+    """Test OCR output is trimmed to one compact line per receipt line"""
+    
+    text = "  CONAD   Tirane \n\n-----------\nPane\t\t1,20\n  ***  \nTOTALE   3,00  \n"
+    
+    assert normalize_text(text, max_chars=1000) == "CONAD Tirane\nPane 1,20\nTOTALE 3,00"
+    assert normalize_text(text, max_chars=5) == "CONAD"
+
+def test_get_parser_selects_backend():
+    """Test backends are picked by name and unknown names are rejected"""
+    
+    assert get_parser("ocr") is ocr_parser_service
+    assert type(get_parser("vision")) is AIParserService
+    with pytest.raises(ValueError):
+        get_parser("bogus")
+
+def test_ocr_parser_sends_text_only(monkeypatch):
+    """Test the OCR backend sends extracted text and no image to a text model"""
+    
+    async def extract_text(data):
+        assert data == b"image bytes"
+        return "CONAD\nPane 1,20"
+    
+    monkeypatch.setattr(ocr_service, "extract_text", extract_text)
+    messages = asyncio.run(ocr_parser_service.build_messages("http://localhost/uploads/x.jpg", b"image bytes"))
+    
+    assert all(isinstance(message["content"], str) for message in messages)
+    assert "CONAD\nPane 1,20" in messages[-1]["content"]
+    assert ocr_parser_service.prompt_version != AIParserService.prompt_version
+
+def test_ocr_without_tesseract_fails_clearly(monkeypatch):
+    """Test a missing pytesseract is reported instead of failing in the pool"""
+    
+    monkeypatch.setattr(ocr, "pytesseract", None)
+    
+    with pytest.raises(RuntimeError, match="pytesseract"):
+        asyncio.run(ocr_service.extract_text(b"image bytes"))
@@ -0,0 +1,59 @@
+import asyncio
+import os
+import time
+
+from app.services.parse_cache import ParseCacheService
+
+def test_cache_roundtrip(tmp_path):
+    """Test cached parse results are returned and counted"""
+    
+    cache = ParseCacheService(cache_dir=str(tmp_path))
+    key = cache.make_key("abc123", "gpt-4o-mini", "1")
+    
+    assert asyncio.run(cache.get(key)) is None
+    asyncio.run(cache.set(key, {"vendor": "Conad"}, model_seconds=2.5, tokens=900))
+    
+    assert asyncio.run(cache.get(key)) == {"vendor": "Conad"}
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["saved_model_seconds"] == 2.5
+    assert stats["saved_tokens"] == 900
+
+def test_cache_key_depends_on_model_and_prompt():
+    """Test key changes with model name and prompt version"""
+    
+    key = ParseCacheService.make_key("abc123", "gpt-4o-mini", "1")
+    assert key != ParseCacheService.make_key("abc123", "gpt-4o", "1")
+    assert key != ParseCacheService.make_key("abc123", "gpt-4o-mini", "2")
+
+def test_cache_evicts_oldest_entries(tmp_path):
+    """Test size-based eviction removes the oldest entries first"""
+    
+    cache = ParseCacheService(cache_dir=str(tmp_path))
+    cache.max_bytes = 400
+    
+    keys = [cache.make_key(str(i), "m", "1") for i in range(5)]
+    for i, key in enumerate(keys):
+        asyncio.run(cache.set(key, {"vendor": "x" * 100}))
+        # Spread mtimes so eviction order is deterministic
+        os.utime(cache._path(key), (time.time() - 100 + i, time.time() - 100 + i))
+    cache.evict()
+    
+    assert asyncio.run(cache.get(keys[0])) is None
+    assert asyncio.run(cache.get(keys[-1])) is not None
+    assert cache.stats()["size_bytes"] <= cache.max_bytes
+
+def test_concurrent_writers_of_one_key(tmp_path):
+    """Test concurrent sets of a key each use their own temp file"""
+    
+    cache = ParseCacheService(cache_dir=str(tmp_path))
+    key = cache.make_key("abc123", "m", "1")
+    
+    async def write_all():
+        await asyncio.gather(*[cache.set(key, {"vendor": f"v{i}"}) for i in range(20)])
+    
+    asyncio.run(write_all())
+    
+    assert asyncio.run(cache.get(key))["vendor"].startswith("v")
+    assert os.listdir(os.path.dirname(cache._path(key))) == [os.path.basename(cache._path(key))]
@@ -0,0 +1,148 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.database import async_url
+from app.models import Invoice, ParseJob
+from app.services import parse_queue
+from app.services.parse_queue import ParseQueueService
+from tests.conftest import TEST_POSTGRES_URL
+
+@pytest.fixture
+def queue():
+    queue = ParseQueueService()
+    queue.max_attempts = 3
+    queue.backoff_base = 10
+    queue.backoff_max = 60
+    queue.job_timeout = 300
+    return queue
+
+@pytest.fixture
+def jobs(postgres_db):
+    """Empty parse_jobs table; returns a helper adding an invoice with a job"""
+    
+    postgres_db.execute(delete(ParseJob))
+    postgres_db.commit()
+    
+    def add(**job_fields) -> uuid.UUID:
+        invoice = Invoice(user_id=uuid.uuid4(), file_url="http://localhost/uploads/x.jpg")
+        postgres_db.add(invoice)
+        postgres_db.flush()
+        postgres_db.add(ParseJob(invoice_id=invoice.id, **job_fields))
+        postgres_db.commit()
+        return invoice.id
+    
+    return add
+
+def claim(queue: ParseQueueService, get_db):
+    async def run():
+        async for db in get_db():
+            job = await queue.claim(db)
+            return None if job is None else (job.invoice_id, job.status, job.attempts)
+    return asyncio.run(run())
+
+def test_claim_takes_due_jobs_only(queue, jobs, postgres_get_db):
+    """Test claim marks the due job running and leaves future ones queued"""
+    
+    now = datetime.utcnow()
+    due = jobs(status="queued", run_after=now - timedelta(seconds=1))
+    jobs(status="queued", run_after=now + timedelta(minutes=5))
+    
+    assert claim(queue, postgres_get_db) == (due, "running", 1)
+    assert claim(queue, postgres_get_db) is None
+
+def test_stale_running_job_is_reclaimed(queue, jobs, postgres_get_db):
+    """Test only running jobs whose heartbeat stopped are claimed again"""
+    
+    now = datetime.utcnow()
+    jobs(status="running", attempts=1, started_at=now - timedelta(hours=1), heartbeat_at=now - timedelta(seconds=10))
+    dead = jobs(status="running", attempts=1, started_at=now - timedelta(hours=1), heartbeat_at=now - timedelta(hours=1))
+    
+    # A slow parse with a fresh heartbeat is left alone despite its old started_at
+    assert claim(queue, postgres_get_db) == (dead, "running", 2)
+    assert claim(queue, postgres_get_db) is None
+
+def test_heartbeat_keeps_attempt_alive(queue, jobs, postgres_db, monkeypatch):
+    """Test the heartbeat refreshes only the attempt it was started for"""
+    
+    old = datetime.utcnow() - timedelta(hours=1)
+    invoice_id = jobs(status="running", attempts=2, heartbeat_at=old)
+    job = postgres_db.query(ParseJob).filter(ParseJob.invoice_id == invoice_id).one()
+    
+    queue.job_timeout = 0.03
+    
+    async def beat(attempt: int):
+        engine = create_async_engine(async_url(TEST_POSTGRES_URL), poolclass=NullPool)
+        monkeypatch.setattr(parse_queue, "AsyncSessionLocal", async_sessionmaker(engine))
+        task = asyncio.create_task(queue.heartbeat(job.id, attempt))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await engine.dispose()
+    
+    asyncio.run(beat(attempt=1))
+    postgres_db.refresh(job)
+    assert job.heartbeat_at == old
+    
+    asyncio.run(beat(attempt=2))
+    postgres_db.refresh(job)
+    assert job.heartbeat_at > old
+
+def test_mark_failed_backs_off_then_fails(queue):
+    """Test failures are retried with growing jittered delays until attempts run out"""
+    
+    job = ParseJob(attempts=1, max_attempts=3)
+    before = datetime.utcnow()
+    queue.mark_failed(job, ValueError("boom"))
+    assert job.status == "queued" and job.last_error == "boom"
+    assert before + timedelta(seconds=5) <= job.run_after <= datetime.utcnow() + timedelta(seconds=10)
+    
+    job.attempts = 2
+    queue.mark_failed(job, ValueError("boom"))
+    assert before + timedelta(seconds=10) <= job.run_after <= datetime.utcnow() + timedelta(seconds=20)
+    
+    job.attempts = 3
+    queue.mark_failed(job, ValueError("boom"))
+    assert job.status == "failed" and job.finished_at is not None
+    
+    # Capped at PARSE_BACKOFF_MAX_SECONDS, jittered down to half of it
+    assert all(30 <= queue.backoff_seconds(10) <= 60 for _ in range(20))
+
+def test_requeue_finished_job(queue, jobs, postgres_get_db):
+    """Test done jobs are reset for a re-parse and running jobs are left alone"""
+    
+    done = jobs(status="done", attempts=2, last_error="old", started_at=datetime.utcnow(),
+                finished_at=datetime.utcnow(), parser="vision")
+    running = jobs(status="running", attempts=1, heartbeat_at=datetime.utcnow())
+    
+    async def run():
+        async for db in postgres_get_db():
+            requeued = await queue.enqueue(db, done, "ocr")
+            untouched = await queue.enqueue(db, running, "ocr")
+            await db.commit()
+            return (
+                (requeued.status, requeued.attempts, requeued.parser, requeued.last_error, requeued.finished_at),
+                (untouched.status, untouched.attempts),
+            )
+    
+    assert asyncio.run(run()) == (("queued", 0, "ocr", None, None), ("running", 1))
+    assert claim(queue, postgres_get_db)[:2] == (done, "running")
+
+def test_claim_invoice_takes_its_queued_job(queue, jobs, postgres_get_db):
+    """Test a batch request claims its own job before the workers' grace period ends"""
+    
+    waiting = jobs(status="queued", run_after=datetime.utcnow() + timedelta(seconds=300))
+    
+    async def run():
+        async for db in postgres_get_db():
+            job = await queue.claim_invoice(db, waiting)
+            claimed = (job.status, job.attempts, job.started_at is not None)
+            return claimed, await queue.claim_invoice(db, waiting)
+    
+    assert claim(queue, postgres_get_db) is None
+    assert asyncio.run(run()) == (("running", 1, True), None)
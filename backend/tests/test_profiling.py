@@ -0,0 +1,76 @@
+import asyncio
+import time
+import uuid
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.profiling import ProfileStore, ProfilingMiddleware, RequestProfiler, request_profiler
+
+def test_store_is_a_bounded_ring(tmp_path):
+    """Test the oldest profiles are dropped beyond max_files"""
+    
+    store = ProfileStore(str(tmp_path), max_files=3)
+    ids = [asyncio.run(store.save({"route": f"/r{i}", "stacks": {"a;b": 1}})) for i in range(5)]
+    
+    assert store.ids() == ids[2:]
+    assert [profile["route"] for profile in store.list()] == ["/r4", "/r3", "/r2"]
+    assert "stacks" not in store.list()[0]
+    assert store.path("../../etc/passwd") is None
+
+def test_slow_request_is_profiled(tmp_path, monkeypatch):
+    """Test a request over PROFILE_SLOW_MS is stored with its route, invoice id and stacks"""
+    
+    profiler = RequestProfiler(ProfileStore(str(tmp_path)))
+    monkeypatch.setattr(profiler, "slow_ms", 20)
+    monkeypatch.setattr(profiler, "sample_rate", 0.0)
+    monkeypatch.setattr(profiler.sampler, "interval_seconds", 0.001)
+    
+    demo = FastAPI()
+    
+    def busy_work():
+        deadline = time.perf_counter() + 0.03
+        while time.perf_counter() < deadline:
+            pass
+    
+    @demo.get("/invoices/{invoice_id}/status")
+    async def status(invoice_id: uuid.UUID):
+        busy_work()
+        await asyncio.sleep(0.03)
+        return {}
+    
+    @demo.get("/fast")
+    async def fast():
+        return {}
+    
+    demo.add_middleware(ProfilingMiddleware, profiler=profiler)
+    client = TestClient(demo)
+    invoice_id = uuid.uuid4()
+    client.get("/fast")
+    client.get(f"/invoices/{invoice_id}/status")
+    
+    [profile] = profiler.store.list()
+    assert profile["reason"] == "slow"
+    assert profile["route"] == "/invoices/{invoice_id}/status"
+    assert profile["invoice_id"] == str(invoice_id)
+    assert profile["duration_ms"] >= 60 and profile["sample_count"] > 0
+    
+    stacks = profiler.store.load(profile["id"])["stacks"]
+    assert any("busy_work" in stack for stack in stacks)
+    assert any("sleep" in stack for stack in stacks)
+
+def test_admin_profile_endpoints(tmp_path, monkeypatch):
+    """Test profiles are listed and downloadable as JSON or folded stacks"""
+    
+    store = ProfileStore(str(tmp_path))
+    monkeypatch.setattr(request_profiler, "store", store)
+    profile_id = asyncio.run(store.save({"route": "/expenses/", "stacks": {"handler;query": 3}}))
+    
+    client = TestClient(app)
+    listing = client.get("/admin/profiles").json()
+    assert [profile["id"] for profile in listing["profiles"]] == [profile_id]
+    
+    assert client.get(f"/admin/profiles/{profile_id}").json()["stacks"] == {"handler;query": 3}
+    assert client.get(f"/admin/profiles/{profile_id}", params={"format": "folded"}).text == "handler;query 3\n"
+    assert client.get("/admin/profiles/1-deadbeef").status_code == 404
@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from benchmarks import stub_model_server as stub
+from app.services.ai_parser import AIParserService
+from app.services.metrics import model_hedges, model_requests
+from app.services.resilience import ModelCallGuard, TokenBucket
+
+@pytest.fixture
+def parser(monkeypatch):
+    """Vision parser talking to the in-process fault-injecting stub"""
+    
+    monkeypatch.setattr(stub, "STUB_LATENCY_MS", 0)
+    stub.faults.update(stub.DEFAULT_FAULTS)
+    stub.calls.update({key: 0 for key in stub.calls})
+    
+    guard = ModelCallGuard()
+    guard.retry_base = 0.001
+    
+    parser = AIParserService()
+    parser.client = AsyncOpenAI(
+        api_key="test", base_url="http://stub/v1", max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=stub.app))
+    )
+    parser.guard = guard
+    return parser
+
+def parse(parser: AIParserService):
+    return asyncio.run(parser.parse_receipt("receipt.jpg", image_bytes=b"image"))
+
+def test_retryable_errors_are_retried(parser):
+    """Test 5xx responses are retried until a call succeeds"""
+    
+    retries = model_requests.value(parser.model, "retry")
+    stub.faults["fail_next"] = 2
+    
+    assert parse(parser).vendor == "Conad"
+    assert stub.calls["total"] == 3
+    assert model_requests.value(parser.model, "retry") == retries + 2
+
+def test_rate_limited_call_waits_for_retry_after(parser):
+    """Test a 429 is retried after Retry-After and does not count as an outage"""
+    
+    stub.faults.update(fail_next=1, fail_status=429, retry_after="0.2")
+    
+    started = time.perf_counter()
+    assert parse(parser).vendor == "Conad"
+    assert time.perf_counter() - started >= 0.2
+    assert parser.guard.breaker.failures == 0
+
+def test_circuit_opens_and_recovers(parser):
+    """Test a failing provider is not called while the breaker is open"""
+    
+    parser.guard.max_attempts = 2
+    parser.guard.breaker.failure_threshold = 2
+    parser.guard.breaker.reset_seconds = 60
+    stub.faults["error_rate"] = 1.0
+    
+    with pytest.raises(ValueError):
+        parse(parser)
+    assert parser.guard.breaker.state == "open"
+    
+    with pytest.raises(ValueError, match="circuit open"):
+        parse(parser)
+    assert stub.calls["total"] == 2
+    
+    # After the reset period one probe goes out; its success closes the breaker
+    parser.guard.breaker.reset_seconds = 0
+    stub.faults["error_rate"] = 0.0
+    assert parse(parser).vendor == "Conad"
+    assert parser.guard.breaker.state == "closed"
+
+def test_slow_call_is_hedged(parser):
+    """Test a call past the latency percentile is raced by a second request"""
+    
+    parser.guard.hedge_enabled = True
+    parser.guard.hedge_min_samples = 1
+    parser.guard._latencies.extend([0.05] * 20)
+    stub.faults.update(slow_next=1, slow_ms=5000)
+    won = model_hedges.value("won")
+    
+    started = time.perf_counter()
+    assert parse(parser).vendor == "Conad"
+    assert time.perf_counter() - started < 2
+    assert stub.calls["total"] == 2
+    assert model_hedges.value("won") == won + 1
+
+def test_token_bucket_limits_rate():
+    """Test callers wait for tokens once the burst is used up"""
+    
+    async def take(bucket: TokenBucket, count: int) -> float:
+        started = time.perf_counter()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.perf_counter() - started
+    
+    assert asyncio.run(take(TokenBucket(rate=50, capacity=2), 2)) < 0.02
+    assert asyncio.run(take(TokenBucket(rate=50, capacity=2), 5)) >= 0.05
+    assert asyncio.run(take(TokenBucket(rate=0, capacity=1), 100)) < 0.02
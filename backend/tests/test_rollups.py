@@ -0,0 +1,76 @@
+import uuid
+from datetime import date
+
+from app.models import Expense, MonthlyCategoryTotal
+from app.services.rollups import MonthlyRollupService, money
+
+def make_expense(user_id: uuid.UUID, day: date, category: str, amount: str) -> Expense:
+    return Expense(id=uuid.uuid4(), user_id=user_id, date=day, category=category,
+                   amount=amount, currency="EUR")
+
+def totals(db, user_id: uuid.UUID):
+    return {
+        (row.month, row.category): (str(row.total), row.expense_count)
+        for row in db.query(MonthlyCategoryTotal).filter(MonthlyCategoryTotal.user_id == user_id)
+    }
+
+def test_incremental_updates_match_raw_table(postgres_db):
+    """Test insert, edit and delete deltas keep the rollup consistent"""
+    
+    db = postgres_db
+    user_id = uuid.uuid4()
+    service = MonthlyRollupService()
+    
+    expenses = [
+        make_expense(user_id, date(2024, 3, 1), "Ushqim", "1.20"),
+        make_expense(user_id, date(2024, 3, 15), "Ushqim", "3.30"),
+        make_expense(user_id, date(2024, 4, 2), "Transport", "10.00"),
+    ]
+    db.add_all(expenses)
+    service.add_expenses(db, [
+        {"user_id": e.user_id, "date": e.date, "category": e.category, "amount": e.amount} for e in expenses
+    ])
+    db.commit()
+    
+    assert totals(db, user_id) == {
+        ("2024-03", "Ushqim"): ("4.50", 2),
+        ("2024-04", "Transport"): ("10.00", 1),
+    }
+    
+    edited = expenses[0]
+    edited.category = "Argetim"
+    service.update_expense(db, edited, edited.date, "Ushqim", edited.amount)
+    service.remove_expense(db, expenses[2])
+    db.delete(expenses[2])
+    db.commit()
+    
+    assert totals(db, user_id) == {
+        ("2024-03", "Ushqim"): ("3.30", 1),
+        ("2024-03", "Argetim"): ("1.20", 1),
+    }
+    assert service.check(db, user_id) == []
+
+def test_check_and_rebuild(postgres_db):
+    """Test the checker reports drift and rebuild repairs it"""
+    
+    db = postgres_db
+    user_id = uuid.uuid4()
+    service = MonthlyRollupService()
+    
+    # Expense written without going through the rollup
+    db.add(make_expense(user_id, date(2024, 5, 5), "Tjeter", "7.00"))
+    db.commit()
+    
+    mismatches = service.check(db, user_id)
+    assert len(mismatches) == 1
+    assert mismatches[0]["expected_total"] == "7.00"
+    assert mismatches[0]["actual_count"] == 0
+    
+    assert service.rebuild(db, user_id) == 1
+    db.commit()
+    assert service.check(db, user_id) == []
+
+def test_money_rounds_half_away_from_zero():
+    """Test money() rounds like Postgres numeric, not banker's rounding"""
+    
+    assert [str(money(value)) for value in (0.125, "2.675", -0.125, None)] == ["0.13", "2.68", "-0.13", "0.00"]
@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from app.services.storage import LocalStorageDriver, RequestSizeLimitMiddleware, UploadTooLargeError, hash_upload
+
+def make_upload(content: bytes, size=None) -> UploadFile:
+    return UploadFile(file=io.BytesIO(content), filename="receipt.jpg", size=size)
+
+def test_save_file_streams_and_hashes(tmp_path):
+    """Test chunked save computes hash and size in one pass"""
+    
+    storage = LocalStorageDriver(upload_dir=str(tmp_path), chunk_bytes=7)
+    content = os.urandom(100)
+    
+    stored = asyncio.run(storage.save_file(make_upload(content), "receipt.jpg"))
+    
+    assert stored.size == 100
+    assert stored.content_hash == hashlib.sha256(content).hexdigest()
+    assert stored.url.endswith(".jpg")
+    assert asyncio.run(storage.read_file(stored.url)) == content
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".part")]
+
+def test_save_file_rejects_oversized_upload(tmp_path):
+    """Test max upload size is enforced mid-stream and leaves no files behind"""
+    
+    storage = LocalStorageDriver(upload_dir=str(tmp_path), max_bytes=50, chunk_bytes=16)
+    
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(storage.save_file(make_upload(os.urandom(100)), "receipt.jpg"))
+    
+    assert os.listdir(tmp_path) == []
+
+def test_save_file_rejects_known_size_early(tmp_path):
+    """Test declared size over the limit is rejected before reading"""
+    
+    storage = LocalStorageDriver(upload_dir=str(tmp_path), max_bytes=50)
+    upload = make_upload(b"", size=1000)
+    
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(storage.save_file(upload, "receipt.jpg"))
+
+def test_save_file_is_content_addressed(tmp_path):
+    """Test the same bytes map to one stored file"""
+    
+    storage = LocalStorageDriver(upload_dir=str(tmp_path))
+    content = os.urandom(100)
+    
+    first = asyncio.run(storage.save_file(make_upload(content), "receipt.jpg"))
+    second = asyncio.run(storage.save_file(make_upload(content), "copy.jpg"))
+    
+    assert first.created and not second.created
+    assert second.url == first.url
+    assert os.listdir(tmp_path) == [f"{first.content_hash}.jpg"]
+
+def test_hash_upload_rewinds(tmp_path):
+    """Test hashing an upload leaves it readable from the start"""
+    
+    content = os.urandom(100)
+    upload = make_upload(content)
+    
+    content_hash, size = asyncio.run(hash_upload(upload, chunk_bytes=16))
+    
+    assert (content_hash, size) == (hashlib.sha256(content).hexdigest(), 100)
+    assert asyncio.run(upload.read()) == content
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(hash_upload(make_upload(content), max_bytes=50))
+
+def test_request_size_limit_before_form_parsing():
+    """Test oversized bodies get 413 before the route parses the form, declared or chunked"""
+    
+    demo = FastAPI()
+    handled = []
+    
+    @demo.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        handled.append(file.filename)
+        return {}
+    
+    @demo.post("/batch")
+    async def batch(file: UploadFile = File(...)):
+        handled.append(file.filename)
+        return {}
+    
+    demo.add_middleware(RequestSizeLimitMiddleware, max_bytes=1000, path_limits={"/batch": 5000})
+    client = TestClient(demo)
+    
+    assert client.post("/upload", files={"file": ("a.jpg", os.urandom(500))}).status_code == 200
+    assert client.post("/batch", files={"file": ("b.jpg", os.urandom(3000))}).status_code == 200
+    
+    declared = client.post("/upload", files={"file": ("c.jpg", os.urandom(3000))})
+    assert declared.status_code == 413
+    assert declared.json() == {"detail": "Request body exceeds 1000 bytes"}
+    
+    # No Content-Length: cut off once the received bytes pass the limit
+    chunked = client.post("/upload", content=iter([b"x" * 400] * 5),
+                          headers={"Content-Type": "multipart/form-data; boundary=b"})
+    assert chunked.status_code == 413
+    
+    assert handled == ["a.jpg", "b.jpg"]
@@ -0,0 +1,116 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, delete
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import VendorCategoryMapping, VendorMappingVersion
+from app.services.categorization import CategorizationService
+from app.services.vendor_mappings import VendorMappingStore
+
+def make_session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/mappings.db")
+    VendorCategoryMapping.__table__.create(engine)
+    VendorMappingVersion.__table__.create(engine)
+    return sessionmaker(bind=engine)
+
+class CountingSessionFactory:
+    def __init__(self, factory):
+        self.factory = factory
+        self.sessions = 0
+    
+    def __call__(self):
+        self.sessions += 1
+        return self.factory()
+
+def test_correction_visible_on_other_worker_after_check(tmp_path):
+    """Test a write on one store reaches another store on its next version check"""
+    
+    factory = make_session_factory(tmp_path)
+    writer = VendorMappingStore(factory)
+    reader = VendorMappingStore(factory)
+    reader.check_interval = 0
+    
+    assert reader.get("Shell") is None
+    
+    db = factory()
+    writer.set(db, "Shell", "Transport")
+    db.close()
+    
+    assert writer.get("SHELL ") == "Transport"
+    assert reader.get("shell") == "Transport"
+    assert reader.invalidations == 1
+
+def test_cached_lookups_skip_database(tmp_path):
+    """Test repeated lookups, including unmapped vendors, hit only the cache"""
+    
+    factory = CountingSessionFactory(make_session_factory(tmp_path))
+    store = VendorMappingStore(factory)
+    store.check_interval = 3600
+    
+    for _ in range(100):
+        store.get("Unknown Shop")
+    
+    assert factory.sessions == 1
+    assert store.hits == 99
+
+def test_learned_category_overrides_rules(tmp_path):
+    """Test categorization prefers the learned vendor category"""
+    
+    factory = make_session_factory(tmp_path)
+    store = VendorMappingStore(factory)
+    service = CategorizationService(vendor_store=store)
+    
+    assert service.categorize_many("Lidl", ["Pane"]) == ["Ushqim"]
+    
+    db = factory()
+    service.add_vendor_mapping(db, "Lidl", "Shtëpi")
+    db.close()
+    
+    assert service.categorize_expense(vendor="lidl") == "Shtëpi"
+    assert service.categorize_many("Lidl", ["Pane", "Uber"]) == ["Shtëpi", "Shtëpi"]
+
+def test_lookup_through_async_session(tmp_path):
+    """Test async callers can look vendors up through their own session via run_sync"""
+    
+    factory = CountingSessionFactory(make_session_factory(tmp_path))
+    store = VendorMappingStore(factory)
+    
+    db = factory()
+    store.set(db, "Shell", "Transport")
+    db.close()
+    store.clear()
+    
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/mappings.db")
+        async with AsyncSession(engine) as db:
+            category = await db.run_sync(lambda session: store.get("shell", session))
+        await engine.dispose()
+        return category
+    
+    assert asyncio.run(run()) == "Transport"
+    # Only the write opened a session of the store's own
+    assert factory.sessions == 1
+
+def test_concurrent_writes_get_distinct_versions(postgres_db):
+    """Test simultaneous corrections never share a version a reader could skip"""
+    
+    postgres_db.execute(delete(VendorCategoryMapping))
+    postgres_db.execute(delete(VendorMappingVersion))
+    postgres_db.commit()
+    factory = sessionmaker(bind=postgres_db.get_bind())
+    store = VendorMappingStore(factory)
+    
+    def write(index: int):
+        db = factory()
+        try:
+            store.set(db, f"Vendor {index}", "Ushqim")
+        finally:
+            db.close()
+    
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(write, range(40)))
+    
+    versions = sorted(version for (version,) in postgres_db.query(VendorCategoryMapping.version))
+    assert versions == list(range(1, 41))
@@ -15,24 +15,27 @@ interface Expense {
 export default function ExpensesPage() {
   const [expenses, setExpenses] = useState<Expense[]>([])
   const [loading, setLoading] = useState(true)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const [filters, setFilters] = useState({
     from: '',
     to: '',
     category: ''
   })
 
-  const fetchExpenses = async () => {
+  const fetchExpenses = async (cursor?: string) => {
     setLoading(true)
     try {
       const params = new URLSearchParams()
       if (filters.from) params.append('from', filters.from)
       if (filters.to) params.append('to', filters.to)
       if (filters.category) params.append('cat', filters.category)
+      if (cursor) params.append('cursor', cursor)
 
       const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE}/expenses/?${params}`)
       if (response.ok) {
         const data = await response.json()
-        setExpenses(data)
+        setExpenses(prev => cursor ? [...prev, ...data] : data)
+        setNextCursor(response.headers.get('X-Next-Cursor'))
       }
     } catch (error) {
       console.error('Failed to fetch expenses:', error)
@@ -71,7 +74,8 @@ export default function ExpensesPage() {
     }
   }
 
-  const totalAmount = expenses.reduce((sum, expense) => sum + expense.amount, 0)
+  // Pages load on demand, so this only covers the rows fetched so far
+  const loadedTotal = expenses.reduce((sum, expense) => sum + expense.amount, 0)
 
   return (
     <div className="max-w-6xl mx-auto">
@@ -122,10 +126,15 @@ export default function ExpensesPage() {
             </select>
           </div>
           <div className="form-group">
-            <label className="form-label">Total</label>
+            <label className="form-label">Total of loaded rows</label>
             <div className="text-lg font-semibold text-gray-900">
-              €{totalAmount.toFixed(2)}
+              €{loadedTotal.toFixed(2)}
             </div>
+            {nextCursor && (
+              <div className="text-sm text-gray-500">
+                {expenses.length} rows loaded; load more to include the rest
+              </div>
+            )}
           </div>
         </div>
       </div>
@@ -171,6 +180,13 @@ export default function ExpensesPage() {
             </tbody>
           </table>
         )}
+        {!loading && nextCursor && (
+          <div className="text-center py-4">
+            <button onClick={() => fetchExpenses(nextCursor)} className="btn btn-outline">
+              Load more
+            </button>
+          </div>
+        )}
       </div>
     </div>
   )
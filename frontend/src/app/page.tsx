@@ -60,20 +60,31 @@ export default function UploadPage() {
 
       const { id } = await uploadResponse.json()
 
-      // Parse receipt
+      // Parsing is queued on upload; poll until the job finishes
       setStatus('parsing')
       setMessage('Parsing receipt with AI...')
 
-      const parseResponse = await fetch(`${process.env.NEXT_PUBLIC_API_BASE}/invoices/${id}/parse`, {
-        method: 'POST',
-      })
+      let jobStatus = 'queued'
+      while (jobStatus === 'queued' || jobStatus === 'running') {
+        await new Promise(resolve => setTimeout(resolve, 1000))
+        const statusResponse = await fetch(`${process.env.NEXT_PUBLIC_API_BASE}/invoices/${id}/status`)
+        if (!statusResponse.ok) {
+          throw new Error('Parsing failed')
+        }
+        jobStatus = (await statusResponse.json()).status
+      }
+
+      if (jobStatus !== 'done') {
+        throw new Error('Parsing failed')
+      }
 
+      const parseResponse = await fetch(`${process.env.NEXT_PUBLIC_API_BASE}/invoices/${id}`)
       if (!parseResponse.ok) {
         throw new Error('Parsing failed')
       }
 
-      const parsed = await parseResponse.json()
-      setParsedData(parsed)
+      const invoice = await parseResponse.json()
+      setParsedData(invoice.raw_json)
       setStatus('done')
       setMessage('Receipt parsed successfully!')
 